@@ -0,0 +1,77 @@
+"""工時分類、手動記錄載入與假日查詢。"""
+import pytest
+
+from src.core.report_generator import _calculate_shift_hours, _load_manual_duties
+from src.services.duty_store import DutyStore
+from src.services.holiday_service import HolidayService
+
+
+@pytest.fixture(scope='module')
+def segments(dataset):
+    """當月所有成員的手動班次段 (約 成員數 × 記錄數 × 1.1 段)。"""
+    year_month = dataset['months'][0]
+    month_duties = DutyStore(dataset['data_dir']).load_month(year_month)
+    result = []
+    for member in dataset['members'].values():
+        result.extend(_load_manual_duties(year_month, member, month_duties))
+    return result
+
+
+@pytest.mark.benchmark(group='classify')
+def bench_calculate_shift_hours(benchmark, segments, holidays):
+    def classify():
+        for shift in segments:
+            _calculate_shift_hours(holidays, shift['date'], shift['start'], shift['end'])
+    benchmark(classify)
+
+
+@pytest.mark.benchmark(group='manual-duties')
+def bench_load_manual_duties_one_member(benchmark, dataset):
+    year_month = dataset['months'][0]
+    member = next(iter(dataset['members'].values()))
+    month_duties = DutyStore(dataset['data_dir']).load_month(year_month)
+    benchmark(_load_manual_duties, year_month, member, month_duties)
+
+
+@pytest.mark.benchmark(group='manual-duties')
+def bench_load_manual_duties_all_members(benchmark, dataset):
+    year_month = dataset['months'][0]
+    month_duties = DutyStore(dataset['data_dir']).load_month(year_month)
+    members = list(dataset['members'].values())
+
+    def load_all():
+        for member in members:
+            _load_manual_duties(year_month, member, month_duties)
+    benchmark(load_all)
+
+
+@pytest.mark.benchmark(group='manual-duties')
+def bench_load_month_partition_cold(benchmark, dataset):
+    """清除分區快取後讀取一個月份 (JSON 解析成本)。"""
+    store = DutyStore(dataset['data_dir'])
+    year_month = dataset['months'][0]
+
+    def load_cold():
+        store._partition_cache.clear()
+        return store.load_month(year_month)
+    benchmark(load_cold)
+
+
+@pytest.mark.benchmark(group='holidays')
+def bench_holiday_lookups_year(benchmark, dataset):
+    """一整年每天的 is_holiday / is_special_day / get_weekday。"""
+    service = HolidayService()
+    dates = [record['西元日期'] for record in service.store.get_all()]
+
+    def lookup():
+        for date_str in dates:
+            service.is_holiday(date_str)
+            service.is_special_day(date_str)
+            service.get_weekday(date_str)
+    benchmark(lookup)
+
+
+@pytest.mark.benchmark(group='holidays')
+def bench_holiday_month_payload(benchmark, dataset):
+    snapshot = HolidayService().snapshot()
+    benchmark(snapshot.month_payload, dataset['months'][0], ('西元日期', '是否放假'))
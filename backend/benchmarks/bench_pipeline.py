@@ -0,0 +1,53 @@
+"""端到端報表流程 (離線合成事件來源，不連線 Google Calendar)。"""
+import pytest
+
+from src.core.payroll_export import encode_rows, export_rows
+from src.core.report_generator import FETCH_WORKERS, generate_reports, generate_reports_range, preview_reports
+from src.services.calendar_governor import CalendarGovernor
+from src.services.event_sources import GoogleCalendarEventSource
+from src.services.fake_calendar import FakeCalendarServer
+
+
+@pytest.mark.benchmark(group='pipeline')
+def bench_preview_reports_month(benchmark, dataset):
+    """擷取 → 合併 → 分類 (不產生 Excel)。"""
+    result = benchmark(preview_reports, dataset['months'][0])
+    assert len(result) == len(dataset['members'])
+
+
+@pytest.mark.benchmark(group='pipeline')
+def bench_generate_reports_month(benchmark, dataset):
+    result = benchmark.pedantic(generate_reports, args=(dataset['months'][0],), rounds=3, iterations=1)
+    assert result
+
+
+@pytest.mark.benchmark(group='pipeline')
+def bench_generate_reports_range(benchmark, dataset):
+    """所有月份一次產生 (每位成員單次事件查詢)。"""
+    months = dataset['months']
+    result = benchmark.pedantic(generate_reports_range, args=(months[0], months[-1]), rounds=1, iterations=1)
+    assert result
+
+
+@pytest.mark.benchmark(group='pipeline')
+def bench_payroll_export_range(benchmark, dataset):
+    """所有成員、所有月份串流匯出為 CSV (不產生 Excel)。"""
+    months = dataset['months']
+
+    def export():
+        return sum(chunk.count('\n') for chunk in encode_rows(export_rows(months[0], months[-1]), 'csv'))
+    lines = benchmark.pedantic(export, rounds=3, iterations=1)
+    assert lines > len(dataset['members'])
+
+
+@pytest.mark.benchmark(group='pipeline')
+def bench_preview_reports_fake_calendar(benchmark, dataset):
+    """經過 HTTP (本機假 Calendar 伺服器，每頁 20 筆) 的擷取；連線池讓每輪都沿用同一批 keep-alive 連線。"""
+    with FakeCalendarServer(page_size=20) as server:
+        source = GoogleCalendarEventSource(api_endpoint=server.url, governor=CalendarGovernor(rate=10000, burst=1000))
+        try:
+            result = benchmark(preview_reports, dataset['months'][0], event_source=source)
+        finally:
+            source.close()
+        assert len(result) == len(dataset['members'])
+        assert server.stats['connections'] <= FETCH_WORKERS
@@ -0,0 +1,40 @@
+"""Excel 產生與 ZIP 打包。"""
+import os
+
+import pytest
+
+from src.core import report_generator
+from src.services.excel_service import ExcelService
+
+
+@pytest.fixture(scope='module')
+def member_rows(dataset):
+    """第一個月份每位成員的報表列 (由離線事件來源產生)。"""
+    year_month = dataset['months'][0]
+    return year_month, report_generator.preview_reports(year_month)
+
+
+@pytest.fixture(scope='module')
+def excel_service(dataset):
+    return ExcelService(template_path=os.path.join(dataset['data_dir'], 'VSduty_template.xlsx'),
+                        output_dir=report_generator.OUTPUT_DIR)
+
+
+@pytest.mark.benchmark(group='excel')
+def bench_generate_excel_one_member(benchmark, dataset, member_rows, excel_service):
+    year_month, previews = member_rows
+    preview = max(previews, key=lambda item: len(item['rows']))
+    member = dataset['members'][preview['member_id']]
+    benchmark(excel_service.generate_excel, member, preview['rows'], year_month, 1)
+
+
+@pytest.mark.benchmark(group='zip')
+def bench_create_zip_from_files(benchmark, dataset, member_rows, excel_service):
+    from src.api.main import create_zip_from_files
+
+    year_month, previews = member_rows
+    paths = []
+    for preview in previews[:20]:
+        path, _ = excel_service.generate_excel(dataset['members'][preview['member_id']], preview['rows'], year_month, 1)
+        paths.append(path)
+    benchmark(create_zip_from_files, paths, f"Overtime_Reports_{year_month}.zip")
@@ -0,0 +1,37 @@
+"""冷啟動：在新的直譯器中匯入 src.api.main 的耗時與預算。
+
+預算 (毫秒) 由環境變數 IMPORT_BUDGET_MS 設定，預設 1000；報表流程的重量級模組不應在匯入時載入。
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', '1000'))
+LAZY_MODULES = ('openpyxl', 'googleapiclient', 'google.oauth2', 'httplib2')
+PROBE = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import src.api.main\n"
+    "elapsed = (time.perf_counter() - start) * 1000\n"
+    f"print(json.dumps({{'ms': elapsed, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))\n"
+)
+
+
+def _import_app(data_dir: str) -> dict:
+    env = {**os.environ, 'DATA_DIR': data_dir, 'REPORT_WARMUP': '0', 'LOG_LEVEL': 'WARNING'}
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.benchmark(group='startup')
+def bench_import_api(benchmark, dataset):
+    results = []
+    benchmark.pedantic(lambda: results.append(_import_app(dataset['data_dir'])), rounds=3, iterations=1)
+    fastest = min(result['ms'] for result in results)
+    assert not results[-1]['loaded'], f"匯入時載入了應延遲載入的模組: {results[-1]['loaded']}"
+    assert fastest <= IMPORT_BUDGET_MS, f"匯入 src.api.main 耗時 {fastest:.0f} ms，超過預算 {IMPORT_BUDGET_MS:.0f} ms"
@@ -0,0 +1,60 @@
+"""報表流程的基準測試設定。
+
+資料規模由環境變數控制 (預設 50 位成員 × 3 個月 × 每人每月 8 筆手動記錄)：
+    BENCH_MEMBERS, BENCH_MONTHS, BENCH_DUTIES
+結果自動存到 benchmarks/results/ (依機器與 commit 分檔)，可用 --benchmark-compare 比較。
+"""
+import logging
+import os
+import sys
+
+import pytest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+sys.path.insert(0, BACKEND_DIR)
+
+BENCH_MEMBERS = int(os.environ.get('BENCH_MEMBERS', '50'))
+BENCH_MONTHS = int(os.environ.get('BENCH_MONTHS', '3'))
+BENCH_DUTIES = int(os.environ.get('BENCH_DUTIES', '8'))
+BENCH_LOG_LEVEL = os.environ.get('BENCH_LOG_LEVEL', 'WARNING')
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # 結果固定存在 benchmarks/results，與執行時的工作目錄無關
+    if config.getoption('benchmark_storage', None) == 'file://./.benchmarks':
+        config.option.benchmark_storage = f"file://{RESULTS_DIR}"
+
+
+@pytest.fixture(scope='session')
+def dataset(tmp_path_factory):
+    """建立合成 data 目錄，並讓所有單例服務都指向它 (不會讀寫 repo 的 data/)。"""
+    from synthetic import build_data_dir
+
+    data = build_data_dir(str(tmp_path_factory.mktemp('data')), BENCH_MEMBERS, BENCH_MONTHS, BENCH_DUTIES)
+    data_dir = data['data_dir']
+    os.environ['DATA_DIR'] = data_dir
+    os.environ['MEMBERS_FILE'] = os.path.join(data_dir, 'members.json')
+    os.environ['CALENDAR_EVENT_SOURCE'] = 'synthetic'
+
+    from src.core import report_generator
+    from src.services.duty_store import DutyStore
+    from src.services.holiday_service import HolidayService
+
+    logging.getLogger().setLevel(BENCH_LOG_LEVEL)
+    DutyStore._instance = None
+    HolidayService._instance = None
+    DutyStore(data_dir, legacy_file=os.path.join(data_dir, 'duties.json'))
+    HolidayService(holiday_file=os.path.join(data_dir, 'holiday_2026.json'))
+    report_generator.DATA_DIR = data_dir # 報表檔案儲存區 (data/artifacts) 也寫到合成目錄
+    report_generator.MEMBERS_FILE = os.environ['MEMBERS_FILE']
+    report_generator.OUTPUT_DIR = os.path.join(data_dir, 'output')
+    return data
+
+
+@pytest.fixture(scope='session')
+def holidays(dataset):
+    from src.services.holiday_service import HolidayService
+    return HolidayService().snapshot()
@@ -0,0 +1,67 @@
+"""基準測試用的合成資料產生器 (成員 × 月份 × 手動記錄)。"""
+import json
+import os
+import random
+import shutil
+
+from src.services.fake_calendar import synthetic_members
+
+REPO_DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+REASONS = ["2. 醫療會議 - 科會", "3. 教學 - 住院醫師教學", "5. 臨時支援", "7. 病房會診"]
+
+
+def year_months(count: int, year: int = 2026) -> list[str]:
+    """返回從 year 年 1 月開始的 count 個年月 (YYYYMM)，預設使用假日檔案涵蓋的 2026 年。"""
+    months = []
+    for index in range(count):
+        months.append(f"{year + index // 12:04d}{index % 12 + 1:02d}")
+    return months
+
+
+def synthetic_duties(members: dict, months: list[str], per_member_month: int,
+                     group_ratio: float = 0.1, seed: int = 0) -> list[dict]:
+    """產生手動加班記錄：每位成員每月 per_member_month 筆，約 group_ratio 比例為群組記錄。
+
+    Returns:
+        list[dict]: 與舊版 duties.json 相同格式的記錄 (含遞增 id)。
+    """
+    rng = random.Random(seed)
+    names = [member['name'] for member in members.values()]
+    duties = []
+    for year_month in months:
+        for name in names:
+            for _ in range(per_member_month):
+                day = rng.randint(1, 28)
+                hour = rng.choice([7, 8, 12, 17, 18, 22])
+                duty = {
+                    "id": str(len(duties) + 1),
+                    "dateTime": f"{year_month}{day:02d}{hour:02d}{rng.choice(['00', '30'])}",
+                    "hours": rng.choice([0.5, 1.0, 1.5, 2.0, 3.0, 4.0]),
+                    "reason": rng.choice(REASONS),
+                }
+                if rng.random() < group_ratio:
+                    duty["persons"] = rng.sample(names, k=min(len(names), rng.randint(2, 6)))
+                else:
+                    duty["person"] = name
+                duties.append(duty)
+    return duties
+
+
+def build_data_dir(path: str, member_count: int, month_count: int, per_member_month: int) -> dict:
+    """建立一個完整的 data 目錄 (假日、模板、合成成員與舊版 duties.json)。
+
+    Returns:
+        dict: {"data_dir", "members", "months", "duties"}。
+    """
+    os.makedirs(os.path.join(path, 'output'), exist_ok=True)
+    for name in ('holiday_2026.json', 'VSduty_template.xlsx'):
+        shutil.copy(os.path.join(REPO_DATA_DIR, name), os.path.join(path, name))
+
+    members = synthetic_members(member_count)
+    months = year_months(month_count)
+    duties = synthetic_duties(members, months, per_member_month)
+    with open(os.path.join(path, 'members.json'), 'w', encoding='utf-8') as f:
+        json.dump({"calendars": list(members.values())}, f, ensure_ascii=False)
+    with open(os.path.join(path, 'duties.json'), 'w', encoding='utf-8') as f:
+        json.dump(duties, f, ensure_ascii=False)
+    return {"data_dir": path, "members": members, "months": months, "duties": duties}
@@ -0,0 +1,364 @@
+"""API 負載測試工具。
+
+以多個並行的虛擬使用者依前端的操作流程 (瀏覽假日、維護加班記錄、查看時數、產生報表)
+對 `src.api.main:app` 發送請求，最後依端點列出請求數、錯誤率、吞吐量、延遲百分位數與延遲分布。
+
+預設完全離線執行：建立暫存 data 目錄與合成成員，啟動本機假 Calendar 伺服器，
+並透過 httpx.ASGITransport 直接在行程內呼叫 app (不需要啟動 uvicorn)。
+指定 --base-url 時改為對已啟動的伺服器施壓 (伺服器端的事件來源由其自身的環境變數決定)。
+
+用法 (在 backend 目錄下)：
+    python -m loadtest.harness --users 20 --duration 30
+    python -m loadtest.harness --users 50 --iterations 20 --calendar-latency 0.05 --json result.json
+    python -m loadtest.harness --base-url http://localhost:8000 --users 10 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000) # 延遲分布的上界 (毫秒)
+REASONS = ["2. 醫療會議 - 科會", "3. 教學 - 住院醫師教學", "5. 臨時支援"]
+
+
+@dataclass
+class EndpointStats:
+    """單一端點 (以路由樣板為名，例如 GET /duties/month/{ym}) 的統計。"""
+    latencies: list = field(default_factory=list) # 秒
+    errors: int = 0
+    statuses: dict = field(default_factory=dict)
+
+    def record(self, elapsed: float, status: Optional[int], ok: bool) -> None:
+        self.latencies.append(elapsed)
+        key = str(status) if status is not None else 'exception'
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        if not ok:
+            self.errors += 1
+
+    def percentile(self, q: float) -> float:
+        """最近排名法的百分位數 (秒)。"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+    def histogram(self) -> list[tuple[str, int]]:
+        """依 HISTOGRAM_BOUNDS_MS 分桶的延遲分布。"""
+        counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        for elapsed in self.latencies:
+            ms = elapsed * 1000
+            index = next((i for i, bound in enumerate(HISTOGRAM_BOUNDS_MS) if ms <= bound), len(HISTOGRAM_BOUNDS_MS))
+            counts[index] += 1
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+        return list(zip(labels, counts))
+
+    def to_dict(self, duration: float) -> dict:
+        count = len(self.latencies)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "error_rate": self.errors / count if count else 0.0,
+            "throughput_rps": count / duration if duration else 0.0,
+            "mean_ms": sum(self.latencies) / count * 1000 if count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": max(self.latencies) * 1000 if count else 0.0,
+            "statuses": self.statuses,
+            "histogram": dict(self.histogram()),
+        }
+
+
+class VirtualUser:
+    """一個虛擬使用者：持有共用的 client 與統計，並提供依端點計時的請求方法。"""
+
+    def __init__(self, client: httpx.AsyncClient, stats: dict, rng: random.Random,
+                 months: list[str], members: list[dict], think_time: float):
+        self.client = client
+        self.stats = stats
+        self.rng = rng
+        self.months = months
+        self.members = members
+        self.think_time = think_time
+
+    async def request(self, label: str, method: str, url: str, ok_statuses=(200,), **kwargs) -> Optional[httpx.Response]:
+        """發送請求並記錄到 label 的統計；連線錯誤與非預期狀態碼都計為錯誤。"""
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.setdefault(label, EndpointStats()).record(time.perf_counter() - start, None, False)
+            logger.debug(f"{label} 請求失敗: {e}")
+            return None
+        elapsed = time.perf_counter() - start
+        ok = response.status_code in ok_statuses
+        self.stats.setdefault(label, EndpointStats()).record(elapsed, response.status_code, ok)
+        if not ok:
+            logger.debug(f"{label} 回應 {response.status_code}: {response.text[:200]}")
+        return response
+
+    async def think(self) -> None:
+        if self.think_time:
+            await asyncio.sleep(self.rng.uniform(0, self.think_time * 2))
+
+    def month(self) -> str:
+        return self.rng.choice(self.months)
+
+    def member(self) -> dict:
+        return self.rng.choice(self.members)
+
+
+# --- 使用者流程 (對應前端頁面的操作順序) ---
+async def browse_holidays(user: VirtualUser) -> None:
+    """假日頁：切換月份瀏覽假日。"""
+    for _ in range(user.rng.randint(1, 3)):
+        await user.request("GET /holidays/month/{ym}", "GET", f"/holidays/month/{user.month()}")
+        await user.think()
+
+
+async def manage_duties(user: VirtualUser) -> None:
+    """加班記錄頁：載入月份記錄 → 批次新增 → 重新載入 → 刪除其中一筆。"""
+    year_month = user.month()
+    await user.request("GET /holidays/month/{ym}", "GET", f"/holidays/month/{year_month}")
+    await user.request("GET /duties/month/{ym}", "GET", f"/duties/month/{year_month}")
+    await user.think()
+
+    creates = [{
+        "dateTime": f"{year_month}{user.rng.randint(1, 28):02d}{user.rng.choice(['0800', '1800', '2200'])}",
+        "hours": user.rng.choice([1.0, 2.0, 3.0]),
+        "person": user.member()['name'],
+        "reason": user.rng.choice(REASONS),
+    } for _ in range(user.rng.randint(1, 3))]
+    response = await user.request("POST /duties/bulk", "POST", "/duties/bulk", json={"create": creates})
+    await user.request("GET /duties/month/{ym}", "GET", f"/duties/month/{year_month}")
+    await user.think()
+
+    if response is not None and response.status_code == 200:
+        created = response.json().get("created", [])
+        if created:
+            duty = user.rng.choice(created)
+            await user.request("DELETE /duties/{id}", "DELETE", f"/duties/{duty['id']}",
+                               params={"year_month": year_month})
+
+
+async def check_hours(user: VirtualUser) -> None:
+    """報表頁：查看月份摘要，再預覽單一成員的報表列。"""
+    year_month = user.month()
+    await user.request("GET /summary/{ym}", "GET", f"/summary/{year_month}")
+    await user.think()
+    await user.request("GET /report_preview/{ym}", "GET", f"/report_preview/{year_month}",
+                       params={"member_id": user.member()['member_id']})
+
+
+async def generate_report(user: VirtualUser) -> None:
+    """報表頁：產生單一成員的報表 (ZIP)，偶爾產生全部成員。"""
+    params = {} if user.rng.random() < 0.1 else {"member_id": user.member()['member_id']}
+    await user.request("POST /generate_report/{ym}", "POST", f"/generate_report/{user.month()}",
+                       params=params, timeout=300)
+
+
+Flow = Callable[[VirtualUser], Awaitable[None]]
+DEFAULT_MIX: dict[str, tuple[Flow, int]] = {
+    "browse_holidays": (browse_holidays, 40),
+    "manage_duties": (manage_duties, 30),
+    "check_hours": (check_hours, 25),
+    "generate_report": (generate_report, 5),
+}
+
+
+def parse_mix(spec: Optional[str]) -> dict[str, tuple[Flow, int]]:
+    """解析 "browse_holidays=40,generate_report=10" 格式的流程權重；未列出的流程權重為 0。"""
+    if not spec:
+        return DEFAULT_MIX
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"未知的流程: {name} (可用: {', '.join(DEFAULT_MIX)})")
+        mix[name] = (DEFAULT_MIX[name][0], int(weight or 1))
+    return mix
+
+
+async def run_user(user: VirtualUser, mix: dict, deadline: Optional[float], iterations: Optional[int]) -> None:
+    names = list(mix)
+    weights = [mix[name][1] for name in names]
+    completed = 0
+    while (deadline is None or time.perf_counter() < deadline) and (iterations is None or completed < iterations):
+        flow = mix[user.rng.choices(names, weights)[0]][0]
+        try:
+            await flow(user)
+        except Exception as e: # 流程本身的錯誤 (例如回應格式不符) 不中斷其他使用者
+            user.stats.setdefault("flow errors", EndpointStats()).record(0.0, None, False)
+            logger.warning(f"流程 {flow.__name__} 發生錯誤: {e}")
+        completed += 1
+
+
+async def load_members(client: httpx.AsyncClient, year_month: str) -> list[dict]:
+    """從 /summary 取得成員列表 (與前端報表頁相同的資料來源)。"""
+    response = await client.get(f"/summary/{year_month}")
+    response.raise_for_status()
+    return [row for row in response.json()["members"] if row.get("member_id")]
+
+
+async def run_load(client: httpx.AsyncClient, users: int, duration: Optional[float], iterations: Optional[int],
+                   months: list[str], mix: dict, think_time: float, seed: int) -> tuple[dict, float]:
+    """啟動 users 個虛擬使用者直到時間到或完成指定迭代數，返回 (端點統計, 實際耗時秒數)。"""
+    members = await load_members(client, months[0])
+    if not members:
+        raise RuntimeError("伺服器沒有任何成員，無法執行負載測試")
+    stats = {}
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+    await asyncio.gather(*(
+        run_user(VirtualUser(client, stats, random.Random(f"{seed}:{index}"), months, members, think_time),
+                 mix, deadline, iterations)
+        for index in range(users)
+    ))
+    return stats, time.perf_counter() - started
+
+
+def format_report(stats: dict, elapsed: float, users: int) -> str:
+    """將統計整理成文字表格與每個端點的延遲分布長條圖。"""
+    lines = []
+    total = sum(len(s.latencies) for s in stats.values())
+    errors = sum(s.errors for s in stats.values())
+    lines.append(f"{users} 位虛擬使用者，{elapsed:.1f} 秒，共 {total} 個請求 "
+                 f"({total / elapsed if elapsed else 0:.1f} req/s)，錯誤 {errors} ({errors / total if total else 0:.2%})")
+    lines.append("")
+    # 表頭使用 ASCII，避免全形字影響欄位對齊
+    header = f"{'endpoint':<32} {'requests':>8} {'err%':>7} {'req/s':>8} {'p50ms':>8} {'p90ms':>8} {'p99ms':>8} {'maxms':>8}"
+    lines.append(header)
+    lines.append('-' * len(header))
+    for label in sorted(stats):
+        row = stats[label].to_dict(elapsed)
+        lines.append(f"{label:<32} {row['requests']:>8} {row['error_rate']:>7.1%} {row['throughput_rps']:>8.1f} "
+                     f"{row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+
+    for label in sorted(stats):
+        endpoint = stats[label]
+        if not endpoint.latencies:
+            continue
+        lines.append("")
+        lines.append(f"{label}  狀態碼: {', '.join(f'{k}={v}' for k, v in sorted(endpoint.statuses.items()))}")
+        buckets = endpoint.histogram()
+        peak = max(count for _, count in buckets) or 1
+        # 只顯示有資料的區間 (前後裁掉空桶)
+        nonzero = [i for i, (_, count) in enumerate(buckets) if count]
+        for bucket_label, count in buckets[nonzero[0]:nonzero[-1] + 1]:
+            lines.append(f"  {bucket_label:>9} {count:>7} {'#' * max(1 if count else 0, round(40 * count / peak))}")
+    return '\n'.join(lines)
+
+
+def prepare_offline_environment(work_dir: str, members: int, duties: int, months: list[str], calendar_options: dict):
+    """建立暫存 data 目錄與假 Calendar 伺服器，並設定讓 app 使用它們的環境變數。
+
+    必須在匯入 src.api.main 之前呼叫 (app 在匯入時就讀取 DATA_DIR 與成員檔)。
+
+    Returns:
+        FakeCalendarServer: 已啟動的假 Calendar 伺服器 (結束時需呼叫 stop)。
+    """
+    sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.synthetic import build_data_dir
+    from src.services.fake_calendar import FakeCalendarServer
+
+    build_data_dir(work_dir, members, len(months), duties)
+    server = FakeCalendarServer(**calendar_options).start()
+    os.environ['DATA_DIR'] = work_dir
+    os.environ['MEMBERS_FILE'] = os.path.join(work_dir, 'members.json')
+    os.environ['CALENDAR_EVENT_SOURCE'] = f"fake:{server.url}"
+    return server
+
+
+async def main_async(args) -> dict:
+    months = [m.strip() for m in args.months.split(',')]
+    mix = parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    timeout = httpx.Timeout(args.timeout)
+
+    fake_server = None
+    work_dir = None
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout)
+    else:
+        work_dir = tempfile.TemporaryDirectory(prefix='loadtest-')
+        fake_server = prepare_offline_environment(work_dir.name, args.members, args.duties, months, {
+            "latency": args.calendar_latency, "jitter": args.calendar_jitter,
+            "error_rate": args.calendar_error_rate, "page_size": args.calendar_page_size, "seed": args.seed,
+        })
+        from src.api.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                                   limits=limits, timeout=timeout)
+    try:
+        async with client:
+            stats, elapsed = await run_load(client, args.users, args.duration, args.iterations,
+                                            months, mix, args.think_time, args.seed)
+    finally:
+        if fake_server is not None:
+            logger.info(f"假 Calendar 伺服器統計: {fake_server.stats}")
+            fake_server.stop()
+        if work_dir is not None:
+            work_dir.cleanup()
+
+    print(format_report(stats, elapsed, args.users))
+    result = {
+        "users": args.users,
+        "duration_s": elapsed,
+        "mode": "base_url" if args.base_url else "in_process",
+        "endpoints": {label: endpoint.to_dict(elapsed) for label, endpoint in sorted(stats.items())},
+    }
+    if fake_server is not None:
+        result["fake_calendar"] = fake_server.stats
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='對加班報表 API 進行負載測試 (預設離線、在行程內執行)。')
+    parser.add_argument('--users', type=int, default=10, help='並行的虛擬使用者數')
+    parser.add_argument('--duration', type=float, default=None, help='執行秒數 (與 --iterations 擇一，預設 30 秒)')
+    parser.add_argument('--iterations', type=int, default=None, help='每位使用者執行的流程數')
+    parser.add_argument('--think-time', type=float, default=0.0, help='請求間的平均停頓秒數')
+    parser.add_argument('--mix', type=str, default=None,
+                        help=f"流程權重，例如 browse_holidays=40,generate_report=10 (可用: {', '.join(DEFAULT_MIX)})")
+    parser.add_argument('--months', type=str, default='202601,202602,202603', help='以逗號分隔的年月 (YYYYMM)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=300.0, help='單一請求逾時秒數')
+    parser.add_argument('--json', type=str, default=None, help='將結果另存為 JSON 檔')
+    parser.add_argument('--base-url', type=str, default=None, help='對已啟動的伺服器施壓，而不是在行程內執行')
+    parser.add_argument('--members', type=int, default=30, help='離線模式：合成成員數')
+    parser.add_argument('--duties', type=int, default=4, help='離線模式：每位成員每月的初始手動記錄數')
+    parser.add_argument('--calendar-latency', type=float, default=0.0, help='離線模式：假 Calendar 每個請求的延遲 (秒)')
+    parser.add_argument('--calendar-jitter', type=float, default=0.0, help='離線模式：假 Calendar 的額外隨機延遲上限 (秒)')
+    parser.add_argument('--calendar-error-rate', type=float, default=0.0, help='離線模式：假 Calendar 的錯誤率 (0~1)')
+    parser.add_argument('--calendar-page-size', type=int, default=250, help='離線模式：假 Calendar 每頁事件數')
+    parser.add_argument('--log-level', type=str, default='WARNING', help='app 與工具的日誌等級')
+    args = parser.parse_args(argv)
+    if args.duration is None and args.iterations is None:
+        args.duration = 30.0
+
+    sys.path.insert(0, BACKEND_DIR)
+    from src.services.logging_setup import configure_logging
+    configure_logging(level=args.log_level)
+    result = asyncio.run(main_async(args))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n結果已寫入 {args.json}")
+    return 1 if any(endpoint["errors"] for endpoint in result["endpoints"].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
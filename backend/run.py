@@ -1,10 +1,48 @@
+import argparse
+import glob
+import os
+import tempfile
+
 import uvicorn
 
+WORKERS_ENV = 'WEB_CONCURRENCY'                 # 正式模式的 worker 行程數 (與 --workers 相同)
+METRICS_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'    # 多個 worker 共用的 Prometheus 指標目錄
+
+
+def prepare_metrics_dir() -> str:
+    """準備多個 worker 彙總指標用的目錄 (未設定時建立暫存目錄)，並清除上次執行留下的檔案。"""
+    metrics_dir = os.environ.get(METRICS_DIR_ENV) or tempfile.mkdtemp(prefix='overtime-metrics-')
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.unlink(path)
+    os.environ[METRICS_DIR_ENV] = metrics_dir # worker 行程繼承環境變數
+    return metrics_dir
+
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "src.api.main:app",
-        host="0.0.0.0",  # 允許外部訪問
-        port=8088,
-        reload=True,
-        log_level="info"
-    ) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='啟動加班時數報表 API 伺服器。')
+    parser.add_argument('--host', default='0.0.0.0', help='監聽位址 (預設允許外部訪問)')
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get(WORKERS_ENV, '0')),
+                        help='正式模式的 worker 行程數；未指定時以開發模式 (單一行程、修改程式碼後自動重新載入) 啟動')
+    args = parser.parse_args()
+
+    if args.workers > 0:
+        # 正式模式：各 worker 的記憶體索引透過資料檔旁的 .lock / .version 檔保持一致
+        os.environ[WORKERS_ENV] = str(args.workers) # worker 行程據此把 Calendar API 的速率上限平均分配
+        print(f"Production mode: {args.workers} workers, metrics in {prepare_metrics_dir()}")
+        uvicorn.run(
+            "src.api.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "src.api.main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level="info"
+        )
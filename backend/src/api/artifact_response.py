@@ -0,0 +1,154 @@
+import os
+import re
+import stat
+import logging
+from email.utils import formatdate
+from typing import Optional
+from urllib.parse import quote
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"   # 網址對應的內容會改變 (例如 /reports/YYYYMM/ID)，每次都須以 ETag 確認
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(value: Optional[str], size: int):
+    """解析單一範圍的 Range 標頭。
+
+    Args:
+        value (Optional[str]): Range 標頭，例如 "bytes=0-1023"、"bytes=1024-"、"bytes=-512"。
+        size (int): 檔案大小。
+
+    Returns:
+        None 表示沒有或不支援的 Range (返回完整內容)；False 表示範圍無法滿足 (416)；
+        否則為 (起始位置, 結束位置 (含))。
+    """
+    if not value:
+        return None
+    match = _RANGE_RE.match(value.strip())
+    if match is None or match.group(0) == "bytes=-":
+        return None # 多重範圍或格式錯誤：依 RFC 9110 可忽略並返回完整內容
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def content_disposition(filename: str, disposition: str = "attachment") -> str:
+    """Content-Disposition 標頭 (非 ASCII 檔名依 RFC 5987 以 filename* 編碼)。"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+class ArtifactFileResponse(FileResponse):
+    """支援條件請求與範圍請求的檔案回應。
+
+    - ETag 由呼叫端提供 (內容雜湊)，If-None-Match 相符時返回 304；
+    - 單一範圍的 Range 請求返回 206 (If-Range 不符時返回完整內容)，無法滿足時返回 416；
+    - 伺服器提供 ASGI 的 `http.response.zerocopy` 擴充時以 sendfile 傳送檔案 (不經過使用者空間)，
+      提供 `http.response.pathsend` 時完整內容交由伺服器依路徑傳送，否則分塊讀取。
+    """
+
+    def __init__(self, path: str, etag: str, filename: Optional[str] = None, media_type: Optional[str] = None,
+                 immutable: bool = True, headers: Optional[dict] = None):
+        """
+        Args:
+            path (str): 檔案路徑。
+            etag (str): 內容的強 ETag 值 (不含引號，例如 SHA-256)。
+            filename (Optional[str]): 下載時建議的檔名。
+            media_type (Optional[str]): Content-Type；None 時依檔名推測。
+            immutable (bool): 網址對應的內容是否永遠不變 (決定 Cache-Control)。
+            headers (Optional[dict]): 其他回應標頭。
+        """
+        super().__init__(path, headers=headers, media_type=media_type)
+        self.filename = filename
+        self.etag = f'"{etag}"'
+        self.headers["etag"] = self.etag
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        if filename is not None:
+            self.headers["content-disposition"] = content_disposition(filename)
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        # 不使用 FileResponse 以 mtime 計算的 ETag (下載時會更新 mtime 作為 LRU 依據)
+        self.headers.setdefault("last-modified", formatdate(stat_result.st_mtime, usegmt=True))
+
+    def _etag_matches(self, value: Optional[str]) -> bool:
+        if not value:
+            return False
+        tags = [tag.strip() for tag in value.split(',')]
+        return '*' in tags or self.etag in tags or f"W/{self.etag}" in tags
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        except FileNotFoundError:
+            raise RuntimeError(f"File at path {self.path} does not exist.")
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise RuntimeError(f"File at path {self.path} is not a file.")
+        self.set_stat_headers(stat_result)
+        size = stat_result.st_size
+        request_headers = Headers(scope=scope)
+
+        start, end = 0, size - 1
+        if self._etag_matches(request_headers.get("if-none-match")):
+            self.status_code = 304
+        else:
+            byte_range = parse_range(request_headers.get("range"), size)
+            if_range = request_headers.get("if-range")
+            if byte_range is not None and if_range is not None and if_range.strip() != self.etag:
+                byte_range = None # 用戶端快取的版本已不同，返回完整內容
+            if byte_range is False:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{size}"
+            elif byte_range is not None:
+                start, end = byte_range
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        count = end - start + 1 if self.status_code in (200, 206) else 0
+        if self.status_code == 304:
+            del self.headers["content-type"]
+        else:
+            self.headers["content-length"] = str(count)
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        extensions = scope.get("extensions") or {}
+        if scope["method"].upper() == "HEAD" or count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopy" in extensions:
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.zerocopy", "file": file.fileno(), "offset": start,
+                            "count": count, "more_body": False})
+        elif "http.response.pathsend" in extensions and count == size:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                remaining = count
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk: # 檔案在傳送途中被截斷
+                        logger.warning(f"檔案 {self.path} 在傳送途中變短，提前結束回應")
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
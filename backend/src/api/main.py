@@ -1,11 +1,18 @@
+import time
+_IMPORT_STARTED = time.perf_counter() # 量測模組載入 (冷啟動) 耗時
+
+import asyncio
 import logging
 import os
 import json
-from fastapi import FastAPI, HTTPException, Query, Body
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+import shutil
+import tempfile
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from fastapi import FastAPI, HTTPException, Query, Body, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional, List, Dict, Any
-import uvicorn
 import re
 from pydantic import BaseModel, Field
 import uuid
@@ -15,10 +22,26 @@ import zipfile
 import io
 
 # 修改導入方式
-from src.core.report_generator import generate_reports
+from src.core.report_generator import (generate_reports, generate_reports_range, preview_reports, load_members, month_range,
+                                       warm_up, ReportCancelled)
+from src.core.overtime_aggregates import OvertimeAggregates
+from src.core.report_regenerator import ReportRegenerator
+from src.core.payroll_export import export_rows, encode_rows, EXPORT_FORMATS
+from src.services.report_artifacts import ReportArtifactStore, report_key
+from src.services.blob_store import shared_blob_store, parse_blob_name, safe_filename, MEDIA_TYPES
+from src.api.artifact_response import ArtifactFileResponse
+from src.services.event_sources import close_event_sources
+from src.services.holiday_service import HolidayService
+from src.services.holiday_store import HOLIDAY_FIELDS
+from src.services.duty_store import DutyStore, DutyImportParser, validate_duty, expand_duties, GROUP_ID_SEPARATOR
+from src.services.duty_rules import validate_rule, parse_occurrence_id, parse_year_month
+from src.services.metrics import (HTTP_REQUEST_SECONDS, stage_timer, render_latest, begin_request_timings,
+                                  end_request_timings, format_server_timing)
+from src.services.profiling import RequestProfiler, PROFILE_TOKEN_HEADER, profiled, profiled_iter, token_matches
+from src.services.logging_setup import configure_logging
 
-# 設定 Logger
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(funcName)s] - %(message)s')
+# 設定 Logger (等級可用環境變數 LOG_LEVEL / LOG_LEVELS 調整，輸出由背景執行緒寫出)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # 設定資料檔案路徑
@@ -68,15 +91,38 @@ OUTPUT_DIR = os.path.join(DATA_DIR, 'output')
 # 確保輸出目錄存在
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# 假日資料由 HolidayService 單例持有的 HolidayStore 統一管理，
+# API 寫入與報表產生讀取同一份記憶體索引
+holiday_service = HolidayService(holiday_file=HOLIDAY_FILE)
+holiday_store = holiday_service.store
+
+# 加班記錄依月份分區儲存 (data/duties/YYYYMM.json)，首次啟動時自動由 duties.json 遷移
+duty_store = DutyStore(DATA_DIR, legacy_file=DUTIES_FILE)
+
+# 範圍報表一次最多產生的月份數
+MAX_REPORT_RANGE_MONTHS = 24
+
+# 報表進度串流 (SSE) 沒有事件時送出註解行的間隔 (秒)，避免代理伺服器因閒置而斷線
+SSE_KEEPALIVE_SECONDS = 15
+
+# 串流報表的背景工作 (事件迴圈只保留工作的弱參考，於此持有直到完成)
+_report_stream_tasks: set = set()
+
+# 每位成員、每月的加班時數摘要，隨加班記錄與假日變更增量更新
+overtime_aggregates = OvertimeAggregates(duty_store, holiday_store, DATA_DIR)
+
+# 每位成員每月最新一版的報表 (data/reports)；加班記錄、假日等變更時只在背景重新產生受影響的報表
+report_artifacts = ReportArtifactStore(DATA_DIR)
+blob_store = shared_blob_store(DATA_DIR) # 內容定址的報表檔案 (/artifacts/<sha256>.<副檔名>)
+report_regenerator = ReportRegenerator(report_artifacts, duty_store, holiday_store,
+                                       after_run=lambda run_info: record_calendar_dates(run_info))
+
+# 管理者以 X-Profile-Token 標頭 (需與環境變數 PROFILE_TOKEN 相同) 要求對單一請求進行效能分析
+request_profiler = RequestProfiler(DATA_DIR)
+
 # 確認檔案路徑
-logger.info(f"當前工作目錄: {os.getcwd()}")
-logger.info(f"script_dir: {script_dir}")
-logger.info(f"BASE_DIR: {BASE_DIR}")
-logger.info(f"DATA_DIR: {DATA_DIR}")
-logger.info(f"HOLIDAY_FILE: {HOLIDAY_FILE}")
-logger.info(f"HOLIDAY_FILE 存在: {os.path.exists(HOLIDAY_FILE)}")
-logger.info(f"DUTIES_FILE: {DUTIES_FILE}")
-logger.info(f"OUTPUT_DIR: {OUTPUT_DIR}")
+logger.debug("當前工作目錄: %s, script_dir: %s, BASE_DIR: %s", os.getcwd(), script_dir, BASE_DIR)
+logger.info(f"DATA_DIR: {DATA_DIR} (HOLIDAY_FILE 存在: {holiday_store.loaded}, OUTPUT_DIR: {OUTPUT_DIR})")
 
 # 定義加班記錄模型
 class DutyCreate(BaseModel):
@@ -88,44 +134,115 @@ class DutyCreate(BaseModel):
 class Duty(DutyCreate):
     id: str = Field(..., description="加班記錄唯一ID")
 
+class DutyGroupException(BaseModel):
+    hours: Optional[float] = Field(None, gt=0, le=24, description="此成員的加班時數 (覆寫群組設定)")
+    reason: Optional[str] = Field(None, description="此成員的加班原因 (覆寫群組設定)")
+    excluded: Optional[bool] = Field(None, description="此成員不適用此群組記錄")
+
+class DutyGroupCreate(BaseModel):
+    dateTime: str = Field(..., description="加班日期時間 (格式: YYYYMMDDHHMM)")
+    hours: float = Field(..., description="加班時數")
+    persons: List[str] = Field(..., description="參與的人員名稱列表")
+    reason: str = Field(..., description="加班原因")
+    exceptions: Dict[str, DutyGroupException] = Field(default_factory=dict, description="個人例外，以人員名稱為鍵")
+
+    def to_record(self) -> Dict[str, Any]:
+        record = {"dateTime": self.dateTime, "hours": self.hours, "persons": self.persons, "reason": self.reason}
+        exceptions = {person: {k: v for k, v in exception.dict().items() if v is not None}
+                      for person, exception in self.exceptions.items()}
+        if exceptions:
+            record["exceptions"] = exceptions
+        return record
+
+class DutyDelete(BaseModel):
+    id: str = Field(..., description="要刪除的加班記錄ID；'<群組ID>:<姓名>' 表示只將該成員從群組中排除")
+    year_month: Optional[str] = Field(None, pattern=r"^\d{6}$", description="記錄所屬年月 (YYYYMM)，提供時只需讀取該月份分區")
+
+class DutyRuleCreate(BaseModel):
+    weekday: int = Field(..., description="星期幾 (0=週一 ... 6=週日)")
+    time: str = Field(..., description="開始時間 (格式: HHMM)")
+    hours: float = Field(..., description="加班時數")
+    reason: str = Field(..., description="加班原因")
+    persons: List[str] = Field(..., description="適用的人員名稱列表")
+    start_date: str = Field(..., description="規則開始日期 (格式: YYYYMMDD)")
+    end_date: Optional[str] = Field(None, description="規則結束日期 (格式: YYYYMMDD)，省略表示不結束")
+    interval: int = Field(1, description="每幾週一次")
+    skip_holidays: bool = Field(True, description="遇到假日 (含特殊日) 時跳過")
+    exceptions: Dict[str, DutyGroupException] = Field(default_factory=dict, description="個人例外，以人員名稱為鍵")
+    skip_dates: List[str] = Field(default_factory=list, description="要跳過的日期 (YYYYMMDD)")
+
+    def to_rule(self) -> Dict[str, Any]:
+        rule = self.dict(exclude={"exceptions"})
+        rule["exceptions"] = {person: {k: v for k, v in exception.dict().items() if v is not None}
+                              for person, exception in self.exceptions.items()}
+        return rule
+
+class DutyBatch(BaseModel):
+    create: List[DutyCreate] = Field(default_factory=list, description="要新增的加班記錄")
+    create_groups: List[DutyGroupCreate] = Field(default_factory=list, description="要新增的群組加班記錄 (多位成員共用一筆)")
+    delete: List[DutyDelete] = Field(default_factory=list, description="要刪除的加班記錄")
+
 # --- 新增輔助函數 ---
-def clear_output_directory(directory_path: str) -> bool:
-    """清空輸出目錄中的所有文件，但保留目錄本身。
-    
+def parse_holiday_fields(fields: Optional[str]) -> Optional[tuple]:
+    """解析以逗號分隔的假日欄位投影參數。
+
     Args:
-        directory_path (str): 要清空的目錄路徑。
-        
+        fields (Optional[str]): 例如 "西元日期,是否放假"；None 或空字串表示全部欄位。
+
     Returns:
-        bool: 成功返回 True，失敗返回 False。
+        Optional[tuple]: 欄位名稱 tuple，或 None 表示不投影。
+
+    Raises:
+        HTTPException: 含有未知欄位時返回 400。
     """
-    if not os.path.exists(directory_path):
-        logger.warning(f"輸出目錄不存在: {directory_path}，嘗試創建...")
+    if not fields:
+        return None
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = [field for field in selected if field not in HOLIDAY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知的假日欄位: {unknown}，可用欄位: {list(HOLIDAY_FIELDS)}")
+    return selected or None
+
+def record_calendar_dates(run_info: dict) -> None:
+    """把報表執行取得的行事曆值班日期交給 OvertimeAggregates 與 ReportRegenerator (失敗只記錄錯誤，不影響報表)。"""
+    for year_month, dates_by_member in run_info.get("calendar_dates", {}).items():
         try:
-            os.makedirs(directory_path, exist_ok=True)
-            logger.info(f"成功創建輸出目錄: {directory_path}")
-            return True # 創建了新目錄，無需清理
-        except OSError as e:
-            logger.error(f"創建輸出目錄失敗: {directory_path}, 錯誤: {e}")
-            return False
-    
-    if not os.path.isdir(directory_path):
-        logger.error(f"指定的路徑不是目錄: {directory_path}")
-        return False
-    
+            overtime_aggregates.record_calendar_dates(year_month, dates_by_member)
+        except Exception as e:
+            logger.error(f"更新 {year_month} 行事曆值班摘要失敗: {e}", exc_info=True)
+    try:
+        report_regenerator.observe_calendar_dates(run_info)
+    except Exception as e:
+        logger.error(f"比對報表的行事曆值班日期失敗: {e}", exc_info=True)
+
+def record_report_run(run_info: dict) -> None:
+    """產生報表後：把活頁簿存入報表儲存區，再更新行事曆值班日期。"""
     try:
-        file_count = 0
-        for filename in os.listdir(directory_path):
-            file_path = os.path.join(directory_path, filename)
-            # 只刪除文件，不刪除子目錄
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
-                file_count += 1
-                
-        logger.info(f"成功清理輸出目錄: {directory_path}，已刪除 {file_count} 個文件。")
-        return True
+        report_regenerator.publish_run(run_info)
     except Exception as e:
-        logger.error(f"清理輸出目錄時發生錯誤: {directory_path}, 錯誤: {e}")
-        return False
+        logger.error(f"存入報表儲存區失敗: {e}", exc_info=True)
+    record_calendar_dates(run_info)
+
+@contextmanager
+def report_output_dir():
+    """為一次報表請求建立獨立的輸出目錄 (OUTPUT_DIR/.run-*)。
+
+    各請求不再清空共用的 OUTPUT_DIR，因此不會刪掉同時進行的其他報表 (或其他 worker) 正在寫入或打包的檔案。
+    離開時把產生的檔案以 os.replace 原子性地移到 OUTPUT_DIR (同名檔案直接覆寫，供 /download 使用)，再刪除目錄。
+
+    Yields:
+        str: 本次請求的輸出目錄。
+    """
+    work_dir = tempfile.mkdtemp(prefix='.run-', dir=OUTPUT_DIR)
+    try:
+        yield work_dir
+    finally:
+        try:
+            for filename in os.listdir(work_dir):
+                os.replace(os.path.join(work_dir, filename), os.path.join(OUTPUT_DIR, filename))
+        except OSError as e:
+            logger.error(f"移動報表檔案至輸出目錄 {OUTPUT_DIR} 失敗: {e}")
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 def create_zip_from_files(file_paths: List[str], zip_filename: str) -> Optional[io.BytesIO]:
     """將多個檔案壓縮到一個 ZIP 檔案。
@@ -140,7 +257,7 @@ def create_zip_from_files(file_paths: List[str], zip_filename: str) -> Optional[
     logger.info(f"開始將 {len(file_paths)} 個檔案壓縮成 {zip_filename}")
     try:
         zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        with stage_timer('zip'), zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
             files_added = 0
             for file_path in file_paths:
                 if os.path.exists(file_path) and os.path.isfile(file_path):
@@ -164,11 +281,41 @@ def create_zip_from_files(file_paths: List[str], zip_filename: str) -> Optional[
         logger.error(f"創建 ZIP 檔案時發生錯誤: {e}", exc_info=True)
         return None
 
+# --- 冷啟動預熱 ---
+# 報表流程的 openpyxl 與 Google API 用戶端延遲載入；啟動後在背景執行緒預先載入，
+# 讓第一個報表請求不必負擔匯入時間。設定 REPORT_WARMUP=0 可停用 (改為第一次使用時載入)。
+REPORT_WARMUP_ENV = 'REPORT_WARMUP'
+REPORT_AUTO_REGENERATE_ENV = 'REPORT_AUTO_REGENERATE' # 設為 0 停用背景重新產生過期報表
+report_stack_state = {"status": "pending", "warmup_ms": None, "error": None}
+
+def warm_up_report_stack() -> None:
+    report_stack_state["status"] = "warming"
+    start = time.perf_counter()
+    try:
+        warm_up()
+        report_stack_state["status"] = "ready"
+    except Exception as e:
+        logger.error(f"報表模組預熱失敗: {e}", exc_info=True)
+        report_stack_state.update(status="error", error=f"{type(e).__name__}: {e}")
+    report_stack_state["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"報表模組預熱結束 ({report_stack_state['status']})，耗時 {report_stack_state['warmup_ms']} ms")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.environ.get(REPORT_WARMUP_ENV, '1') != '0':
+        threading.Thread(target=warm_up_report_stack, name='report-warmup', daemon=True).start()
+    if os.environ.get(REPORT_AUTO_REGENERATE_ENV, '1') != '0':
+        report_regenerator.start()
+    yield
+    report_regenerator.stop()
+    close_event_sources() # 關閉 Calendar API 連線池中的 keep-alive 連線
+
 # 建立 FastAPI 應用程式實例
 app = FastAPI(
     title="加班時數報表產生器 API",
     description="此 API 用於觸發產生醫師加班時數 Excel 報表。",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 從環境變數讀取 CORS 設定
@@ -189,9 +336,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # 明確列出允許的 HTTP 方法
     allow_headers=["*"],  # 允許所有標頭
-    expose_headers=["Content-Disposition"],  # 設置可以被瀏覽器獲取的回應標頭
+    expose_headers=["Content-Disposition", "X-Holiday-Version", "Server-Timing", "X-Profile-Id", "X-Failed-Members",
+                    "Content-Location", "ETag"],  # 設置可以被瀏覽器獲取的回應標頭
 )
 
+# 記錄每個請求的耗時 (依路由樣板分類，避免路徑參數造成過多的標籤組合)，
+# 並以 Server-Timing 標頭回傳本次請求各階段 (Calendar 擷取、合併、分類、Excel、ZIP、資料檔讀寫) 的耗時。
+# 帶有正確 X-Profile-Token 的請求會以 cProfile 分析，結果存到 data/profiles 並以 X-Profile-Id 回傳。
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    profiler = None
+    if PROFILE_TOKEN_HEADER in request.headers:
+        if not token_matches(request.headers[PROFILE_TOKEN_HEADER]):
+            return JSONResponse(status_code=403, content={"detail": "效能分析權杖無效"})
+        profiler = request_profiler.try_start()
+        if profiler is None:
+            return JSONResponse(status_code=409, content={"detail": "另一個請求正在進行效能分析，請稍後再試"})
+
+    timings, token = begin_request_timings()
+    start = time.perf_counter()
+    status = 500
+    response = None
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        end_request_timings(token)
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(request.method, route_path, str(status)).observe(elapsed)
+        profile_id = request_profiler.new_profile_id(f"{request.method}{route_path}") if profiler else None
+        if profiler is not None and response is None:
+            request_profiler.finish(profiler, profile_id)
+
+    response.headers["Server-Timing"] = format_server_timing(timings, elapsed)
+    if profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+        # 串流回應 (SSE、薪資匯出) 的內容在端點返回後才產生，送完回應本文才停止分析
+        response.body_iterator = request_profiler.finish_after(response.body_iterator, profiler, profile_id)
+    return response
+
 # --- 新增 API 端點 ---
 
 # CORS 預檢請求處理
@@ -199,15 +384,70 @@ app.add_middleware(
 async def options_handler(path: str):
     return JSONResponse(content={}, status_code=200)
 
+# 存活檢查：行程能處理請求即返回 200 (不檢查資料與外部服務)
+@app.get("/healthz", summary="存活檢查", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+# 就緒檢查：假日資料已載入且 data 目錄可寫入才返回 200。
+# 報表模組的預熱狀態只供參考，不影響就緒 (未預熱時第一次產生報表會自行載入)。
+@app.get("/readyz", summary="就緒檢查", include_in_schema=False)
+async def readyz():
+    checks = {
+        "holidays": holiday_store.loaded,
+        "data_dir_writable": os.access(DATA_DIR, os.W_OK), # 加班記錄、報表輸出都寫在 data 目錄下
+    }
+    ready = all(checks.values())
+    return JSONResponse(status_code=200 if ready else 503, content={
+        "status": "ready" if ready else "not_ready",
+        "checks": checks,
+        "report_stack": report_stack_state,
+        "import_ms": IMPORT_MS,
+    })
+
+# --- 效能分析 (需 X-Profile-Token) ---
+def require_profile_token(request: Request) -> None:
+    if not token_matches(request.headers.get(PROFILE_TOKEN_HEADER)):
+        raise HTTPException(status_code=403, detail="效能分析權杖無效或未啟用 (請設定環境變數 PROFILE_TOKEN)")
+
+@app.get("/admin/profiles", summary="列出已儲存的請求效能分析", include_in_schema=False)
+async def list_request_profiles(request: Request):
+    require_profile_token(request)
+    return request_profiler.list_profiles()
+
+@app.get("/admin/profiles/{profile_id}", summary="下載或檢視請求效能分析", include_in_schema=False)
+async def get_request_profile(
+    request: Request,
+    profile_id: str,
+    format: str = Query("text", pattern="^(text|raw)$", description="text: pstats 摘要；raw: 原始 .prof 檔"),
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|ncalls)$", description="text 格式的排序欄位"),
+    limit: int = Query(50, ge=1, le=500, description="text 格式列出的函數數量")
+):
+    require_profile_token(request)
+    path = request_profiler.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"找不到效能分析: {profile_id}")
+    if format == "raw":
+        return FileResponse(path=path, filename=profile_id, media_type="application/octet-stream")
+    return Response(content=request_profiler.render_text(profile_id, sort, limit), media_type="text/plain; charset=utf-8")
+
+# Prometheus 指標 (報表各階段耗時、事件/班次/活頁簿計數、資料檔讀寫與請求耗時)
+@app.get("/metrics", summary="Prometheus 指標", include_in_schema=False)
+async def metrics():
+    payload, content_type = render_latest()
+    return Response(content=payload, media_type=content_type)
+
 # 獲取所有假日資料
 @app.get("/holidays", summary="獲取所有假日資料")
-async def get_all_holidays():
+async def get_all_holidays(
+    start: Optional[str] = Query(None, description="起始年 (YYYY) 或年月 (YYYYMM)，包含在內"),
+    end: Optional[str] = Query(None, description="結束年 (YYYY) 或年月 (YYYYMM)，包含在內"),
+    fields: Optional[str] = Query(None, description="只返回的欄位，以逗號分隔，例如 西元日期,是否放假")
+):
     try:
-        logger.info(f"嘗試讀取假日檔案: {HOLIDAY_FILE}")
-        
-        # 檢查檔案是否存在
-        if not os.path.exists(HOLIDAY_FILE):
-            logger.error(f"假日檔案不存在: {HOLIDAY_FILE}")
+        # 檢查假日資料是否成功載入
+        if not holiday_store.loaded:
+            logger.error(f"假日檔案不存在或無法載入: {holiday_store.holiday_file}")
             logger.error(f"當前工作目錄: {os.getcwd()}")
             logger.error(f"BASE_DIR: {BASE_DIR}")
             logger.error(f"DATA_DIR: {DATA_DIR}")
@@ -223,47 +463,51 @@ async def get_all_holidays():
                 detail=f"假日資料檔案不存在: {HOLIDAY_FILE}"
             )
         
-        with open(HOLIDAY_FILE, 'r', encoding='utf-8') as f:
-            holidays = json.load(f)
+        for value in (start, end):
+            if value is not None and not re.match(r"^\d{4}(\d{2})?$", value):
+                raise HTTPException(status_code=400, detail="範圍格式錯誤，請使用 YYYY 或 YYYYMM 格式。")
+        
+        snapshot = holiday_store.snapshot()
+        if start is None and end is None and fields is None:
+            # 未指定參數時維持原本行為：依檔案順序返回全部記錄
+            return JSONResponse(content=snapshot.records)
         
-        logger.info(f"成功讀取 {len(holidays)} 筆假日資料")
-        return holidays
+        payload = snapshot.range_payload(start, end, parse_holiday_fields(fields))
+        return Response(content=payload, media_type="application/json")
         
     except HTTPException:
         raise
-    except json.JSONDecodeError as e:
-        logger.error(f"解析假日 JSON 檔案失敗: {e}")
-        raise HTTPException(status_code=500, detail=f"假日資料格式錯誤: {str(e)}")
     except Exception as e:
         logger.error(f"讀取假日資料時發生錯誤: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"無法讀取假日資料: {str(e)}")
 
 # 獲取特定月份的假日資料
 @app.get("/holidays/month/{year_month}", summary="獲取特定月份的假日資料")
-async def get_holidays_by_month(year_month: str):
+async def get_holidays_by_month(
+    year_month: str,
+    fields: Optional[str] = Query(None, description="只返回的欄位，以逗號分隔，例如 西元日期,是否放假")
+):
     try:
-        logger.info(f"嘗試讀取 {year_month} 月份的假日資料")
-        
-        # 檢查檔案是否存在
-        if not os.path.exists(HOLIDAY_FILE):
-            logger.error(f"假日檔案不存在: {HOLIDAY_FILE}")
+        if not holiday_store.loaded:
+            logger.error(f"假日檔案不存在或無法載入: {holiday_store.holiday_file}")
             raise HTTPException(
                 status_code=500, 
                 detail=f"假日資料檔案不存在: {HOLIDAY_FILE}"
             )
         
-        with open(HOLIDAY_FILE, 'r', encoding='utf-8') as f:
-            all_holidays = json.load(f)
-        
-        month_holidays = [h for h in all_holidays if h.get("西元日期", "").startswith(year_month)]
-        logger.info(f"找到 {len(month_holidays)} 筆 {year_month} 月份的假日資料")
-        return month_holidays
+        snapshot = holiday_store.snapshot()
+        if re.match(r"^\d{4}$", year_month):
+            # 只給年份時與過去的前綴比對相同，返回整年的資料
+            payload = snapshot.range_payload(year_month, year_month, parse_holiday_fields(fields))
+        elif re.match(r"^\d{6}$", year_month):
+            # 月份索引與序列化結果都在快照建立時預先算好，這裡只是查表
+            payload = snapshot.month_payload(year_month, parse_holiday_fields(fields))
+        else:
+            raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 或 YYYY 格式。")
+        return Response(content=payload, media_type="application/json")
         
     except HTTPException:
         raise
-    except json.JSONDecodeError as e:
-        logger.error(f"解析假日 JSON 檔案失敗: {e}")
-        raise HTTPException(status_code=500, detail=f"假日資料格式錯誤: {str(e)}")
     except Exception as e:
         logger.error(f"讀取 {year_month} 月份假日資料時發生錯誤: {e}")
         raise HTTPException(status_code=500, detail=f"無法讀取 {year_month} 月份假日資料")
@@ -272,53 +516,37 @@ async def get_holidays_by_month(year_month: str):
 @app.put("/holidays/{date}", summary="更新假日狀態")
 async def update_holiday_status(date: str, status: str, description: str = ""):
     try:
-        with open(HOLIDAY_FILE, 'r', encoding='utf-8') as f:
-            all_holidays = json.load(f)
-        
-        # 查找是否已存在該日期
-        for holiday in all_holidays:
-            if holiday["西元日期"] == date:
-                holiday["是否放假"] = status
-                holiday["備註"] = description
-                break
-        else:
-            # 如果不存在，添加新記錄
-            new_holiday = {
-                "西元日期": date,
-                "星期": "",  # 這裡需要計算星期幾，暫時留空
-                "是否放假": status,
-                "備註": description
-            }
-            all_holidays.append(new_holiday)
-        
-        with open(HOLIDAY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(all_holidays, f, ensure_ascii=False, indent=4)
-        
-        return {"success": True, "message": f"成功更新 {date} 假日狀態"}
+        # 經由 HolidayStore 寫入：原子寫檔 + 遞增版本 + 替換記憶體索引
+        version = holiday_store.update_status(date, status, description)
+        return {"success": True, "message": f"成功更新 {date} 假日狀態", "holiday_version": version}
     except Exception as e:
         logger.error(f"更新假日狀態時發生錯誤: {e}")
         raise HTTPException(status_code=500, detail="無法更新假日狀態")
 
 # 獲取所有值班記錄
 @app.get("/duties", summary="獲取所有值班記錄")
-async def get_all_duties():
+async def get_all_duties(expand: bool = Query(True, description="是否將群組記錄展開為個人記錄")):
     try:
-        with open(DUTIES_FILE, 'r', encoding='utf-8') as f:
-            duties = json.load(f)
-        return duties
+        records = duty_store.load_all()
+        return list(expand_duties(records)) if expand else records
     except Exception as e:
         logger.error(f"讀取值班記錄時發生錯誤: {e}")
         raise HTTPException(status_code=500, detail="無法讀取值班記錄")
 
 # 獲取特定月份的值班記錄
 @app.get("/duties/month/{year_month}", summary="獲取特定月份的值班記錄")
-async def get_duties_by_month(year_month: str):
+async def get_duties_by_month(
+    year_month: str,
+    expand: bool = Query(True, description="是否將群組記錄展開為個人記錄")
+):
     try:
-        with open(DUTIES_FILE, 'r', encoding='utf-8') as f:
-            all_duties = json.load(f)
-        
-        month_duties = [d for d in all_duties if d.get("dateTime", "").startswith(year_month)]
-        return month_duties
+        parse_year_month(year_month) # 月份同時用於分區檔名與週期規則展開
+    except ValueError:
+        raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式 (月份 01–12)。")
+    try:
+        # 只讀取該月份的分區檔案，並展開週期規則在該月份的發生記錄
+        records = duty_store.load_month_with_rules(year_month, holiday_store.snapshot())
+        return list(expand_duties(records)) if expand else records
     except Exception as e:
         logger.error(f"讀取 {year_month} 月份值班記錄時發生錯誤: {e}")
         raise HTTPException(status_code=500, detail=f"無法讀取 {year_month} 月份值班記錄")
@@ -327,10 +555,7 @@ async def get_duties_by_month(year_month: str):
 @app.get("/duties/person/{person}", summary="獲取特定人員的值班記錄")
 async def get_duties_by_person(person: str):
     try:
-        with open(DUTIES_FILE, 'r', encoding='utf-8') as f:
-            all_duties = json.load(f)
-        
-        person_duties = [d for d in all_duties if d.get("person") == person]
+        person_duties = list(expand_duties(duty_store.load_all(), person=person))
         return person_duties
     except Exception as e:
         logger.error(f"讀取 {person} 的值班記錄時發生錯誤: {e}")
@@ -339,36 +564,17 @@ async def get_duties_by_person(person: str):
 # 新增加班記錄
 @app.post("/duties", summary="新增加班記錄", response_model=Duty)
 async def add_duty(duty_data: DutyCreate):
+    errors = validate_duty(duty_data.dict())
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
     try:
-        # 讀取現有的加班記錄
-        with open(DUTIES_FILE, 'r', encoding='utf-8') as f:
-            all_duties = json.load(f)
-        
-        # 生成新記錄ID (使用遞增數字)
-        max_id = 0
-        for duty in all_duties:
-            try:
-                duty_id = int(duty.get("id", "0"))
-                if duty_id > max_id:
-                    max_id = duty_id
-            except ValueError:
-                continue
-        
-        # 建立新記錄
-        new_duty = {
-            "id": str(max_id + 1),
+        # 只重寫該月份的分區檔案與 manifest
+        new_duty = duty_store.add({
             "dateTime": duty_data.dateTime,
             "hours": duty_data.hours,
             "person": duty_data.person,
             "reason": duty_data.reason
-        }
-        
-        # 添加到記錄列表
-        all_duties.append(new_duty)
-        
-        # 保存到文件
-        with open(DUTIES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(all_duties, f, ensure_ascii=False, indent=4)
+        })
         
         logger.info(f"成功新增加班記錄: {new_duty}")
         return new_duty
@@ -376,27 +582,98 @@ async def add_duty(duty_data: DutyCreate):
         logger.error(f"新增加班記錄時發生錯誤: {e}")
         raise HTTPException(status_code=500, detail=f"無法新增加班記錄: {str(e)}")
 
+# 批次新增/刪除加班記錄
+@app.post("/duties/bulk", summary="批次新增/刪除加班記錄")
+async def bulk_mutate_duties(batch: DutyBatch):
+    """驗證整批資料後以單次原子寫入套用。任何一筆無效或找不到時，整批都不會寫入。"""
+    creates = [duty.dict() for duty in batch.create] + [group.to_record() for group in batch.create_groups]
+    errors = {index: duty_errors for index, duty in enumerate(creates) if (duty_errors := validate_duty(duty))}
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "批次資料驗證失敗", "create_errors": errors})
+    
+    try:
+        created, missing = duty_store.apply_batch(
+            creates=creates,
+            deletes=[(item.id, item.year_month) for item in batch.delete]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"批次寫入加班記錄時發生錯誤: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"無法批次寫入加班記錄: {str(e)}")
+    
+    if missing:
+        logger.warning(f"批次刪除中找不到的ID: {missing}")
+        raise HTTPException(status_code=404, detail={"message": "找不到要刪除的加班記錄，整批未寫入", "missing_ids": missing})
+    
+    logger.info(f"批次寫入完成: 新增 {len(created)} 筆、刪除 {len(batch.delete)} 筆")
+    return {"success": True, "created": created, "deleted": [item.id for item in batch.delete]}
+
+# 串流匯入加班記錄 (CSV / JSONL)
+@app.post("/duties/import", summary="匯入 CSV 或 JSONL 加班記錄")
+async def import_duties(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|jsonl)$", description="匯入格式：csv (需含標頭 dateTime,hours,person,reason) 或 jsonl")
+):
+    """逐塊讀取請求內容並逐行解析，全部驗證通過後以單次原子寫入套用，用於回填歷史記錄。"""
+    parser = DutyImportParser(format)
+    batch = []
+    errors = []
+    pending = b''
+
+    def handle_line(raw: bytes):
+        try:
+            duty = parser.parse(raw.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError) as e:
+            errors.append(str(e))
+            return
+        if duty is None:
+            return
+        duty_errors = validate_duty(duty)
+        if duty_errors:
+            errors.append(f"第 {parser.line_no} 行: {'; '.join(duty_errors)}")
+        else:
+            batch.append(duty)
+
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for raw in lines:
+            handle_line(raw)
+    if pending:
+        handle_line(pending)
+
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "匯入資料驗證失敗，整批未寫入", "errors": errors[:100]})
+    
+    try:
+        created, _ = duty_store.apply_batch(creates=batch)
+    except Exception as e:
+        logger.error(f"匯入加班記錄時發生錯誤: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"無法匯入加班記錄: {str(e)}")
+    
+    logger.info(f"成功匯入 {len(created)} 筆加班記錄")
+    return {"success": True, "imported": len(created)}
+
 # 刪除加班記錄
 @app.delete("/duties/{duty_id}", summary="刪除加班記錄")
-async def delete_duty(duty_id: str):
+async def delete_duty(
+    duty_id: str,
+    year_month: Optional[str] = Query(None, description="記錄所屬年月 (YYYYMM)；提供時只需讀取該月份分區")
+):
+    if year_month is not None and not re.match(r"^\d{6}$", year_month):
+        raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式。")
     try:
-        # 讀取現有的加班記錄
-        with open(DUTIES_FILE, 'r', encoding='utf-8') as f:
-            all_duties = json.load(f)
-        
-        # 尋找要刪除的記錄
-        initial_count = len(all_duties)
-        all_duties = [duty for duty in all_duties if duty.get("id") != duty_id]
-        
-        # 檢查是否有記錄被刪除
-        if len(all_duties) == initial_count:
+        occurrence_id, _, person = duty_id.partition(GROUP_ID_SEPARATOR)
+        occurrence = parse_occurrence_id(occurrence_id)
+        if occurrence is not None:
+            # 週期規則展開的記錄：跳過該次發生 (或該次的單一成員)，而不是刪除整條規則
+            if not duty_store.rules.skip_occurrence(*occurrence, person=person or None):
+                raise HTTPException(status_code=404, detail=f"未找到ID為 {duty_id} 的週期規則記錄")
+        elif not duty_store.delete(duty_id, year_month=year_month):
             logger.warning(f"未找到ID為 {duty_id} 的加班記錄")
             raise HTTPException(status_code=404, detail=f"未找到ID為 {duty_id} 的加班記錄")
         
-        # 保存到文件
-        with open(DUTIES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(all_duties, f, ensure_ascii=False, indent=4)
-        
         logger.info(f"成功刪除ID為 {duty_id} 的加班記錄")
         return {"success": True, "message": f"成功刪除ID為 {duty_id} 的加班記錄"}
     except HTTPException:
@@ -405,12 +682,117 @@ async def delete_duty(duty_id: str):
         logger.error(f"刪除加班記錄時發生錯誤: {e}")
         raise HTTPException(status_code=500, detail=f"無法刪除加班記錄: {str(e)}")
 
+# --- 週期規則 ---
+@app.get("/duty_rules", summary="獲取所有週期加班規則")
+async def get_duty_rules():
+    return duty_store.rules.list_rules()
+
+@app.post("/duty_rules", summary="新增週期加班規則")
+async def add_duty_rule(rule_data: DutyRuleCreate):
+    rule = rule_data.to_rule()
+    errors = validate_rule(rule)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    try:
+        return duty_store.rules.add(rule)
+    except Exception as e:
+        logger.error(f"新增週期規則時發生錯誤: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"無法新增週期規則: {str(e)}")
+
+@app.put("/duty_rules/{rule_id}", summary="更新週期加班規則")
+async def update_duty_rule(rule_id: str, rule_data: DutyRuleCreate):
+    rule = rule_data.to_rule()
+    errors = validate_rule(rule)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    try:
+        updated = duty_store.rules.update(rule_id, rule)
+    except Exception as e:
+        logger.error(f"更新週期規則時發生錯誤: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"無法更新週期規則: {str(e)}")
+    if updated is None:
+        raise HTTPException(status_code=404, detail=f"未找到ID為 {rule_id} 的週期規則")
+    return updated
+
+@app.delete("/duty_rules/{rule_id}", summary="刪除週期加班規則")
+async def delete_duty_rule(rule_id: str):
+    if not duty_store.rules.delete(rule_id):
+        raise HTTPException(status_code=404, detail=f"未找到ID為 {rule_id} 的週期規則")
+    return {"success": True, "message": f"成功刪除ID為 {rule_id} 的週期規則"}
+
+# 每位成員的月份加班時數摘要 (由 OvertimeAggregates 增量維護)
+@app.get("/summary/{year_month}", summary="獲取每位成員的月份加班時數摘要")
+async def get_month_summary(
+    year_month: str,
+    member_id: Optional[str] = Query(None, description="只返回特定成員 ID 的摘要")
+):
+    """返回每位成員的總時數與 E–I 分類 (不產生 Excel、不呼叫 Google Calendar API)。
+
+    行事曆值班時數來自最近一次產生該月份報表時記錄的值班日期；
+    `calendar_synced` 為 false 表示該月份尚未產生過報表，摘要只含手動記錄。
+    """
+    try:
+        parse_year_month(year_month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式 (月份 01–12)。")
+    try:
+        summary = overtime_aggregates.month_summary(year_month)
+        members = load_members()
+        if member_id:
+            member = members.get(member_id.upper())
+            if member is None:
+                raise HTTPException(status_code=404, detail=f"找不到成員 ID: {member_id}")
+            members = {member_id.upper(): member}
+
+        rows = []
+        for mid, member in members.items():
+            totals = summary.get(member.get('name'))
+            rows.append({
+                "member_id": mid,
+                "name": member.get('name'),
+                "employee_id": member.get('employee_id'),
+                **(totals or {"total_hours": 0.0, "E": 0.0, "F": 0.0, "G": 0.0, "H": 0.0, "I": 0.0,
+                              "manual_hours": 0.0, "calendar_hours": 0.0}),
+            })
+        if not member_id:
+            # 手動記錄中不在 members.json 內的姓名也列出，避免時數被默默忽略
+            known = {member.get('name') for member in members.values()}
+            rows.extend({"member_id": None, "name": name, "employee_id": None, **totals}
+                        for name, totals in summary.items() if name not in known)
+
+        return {
+            "year_month": year_month,
+            "holiday_version": holiday_store.version,
+            "calendar_synced": overtime_aggregates.calendar_synced(year_month),
+            "members": rows,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"計算 {year_month} 加班摘要時發生錯誤: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"無法計算 {year_month} 加班摘要")
+
+@app.api_route("/artifacts/{blob_name}", methods=["GET", "HEAD"], summary="以內容雜湊下載報表檔案 (網址內容永不改變，可永久快取)")
+async def download_artifact(blob_name: str, name: Optional[str] = Query(None, description="下載時建議的檔名")):
+    """支援 ETag (If-None-Match → 304) 與單一範圍的 Range 請求；檔案被 LRU 淘汰後返回 404。"""
+    parsed = parse_blob_name(blob_name)
+    path = blob_store.open(blob_name) if parsed else None
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"找不到檔案: {blob_name}")
+    digest, extension = parsed
+    return ArtifactFileResponse(path, etag=digest, filename=safe_filename(name) or blob_name,
+                                media_type=MEDIA_TYPES[extension])
+
 # 下載生成的 Excel 文件
 @app.get("/download/{filename}", summary="下載生成的 Excel 文件")
 async def download_file(filename: str):
+    """下載產生於輸出目錄的檔案 (同名檔案會被之後產生的報表覆寫；需要長期保存請使用 /artifacts/... 網址)。"""
+    safe_name = safe_filename(filename)
+    if safe_name is None or safe_name != filename:
+        raise HTTPException(status_code=400, detail=f"無效的檔案名稱: {filename}")
     try:
-        file_path = os.path.join(OUTPUT_DIR, filename)
-        if not os.path.exists(file_path):
+        file_path = os.path.join(OUTPUT_DIR, safe_name)
+        if os.path.dirname(os.path.realpath(file_path)) != os.path.realpath(OUTPUT_DIR) or not os.path.isfile(file_path):
             raise HTTPException(status_code=404, detail=f"找不到文件: {filename}")
         
         return FileResponse(
@@ -424,6 +806,155 @@ async def download_file(filename: str):
         logger.error(f"下載文件 {filename} 時發生錯誤: {e}")
         raise HTTPException(status_code=500, detail=f"無法下載文件: {filename}")
 
+@app.get("/report_preview/{year_month}", summary="預覽指定年月的報表內容 (不產生 Excel)")
+async def preview_report(
+    year_month: str,
+    member_id: Optional[str] = Query(None, description="要處理的特定成員 ID (例如: A, B)。如果省略，則處理所有成員。")
+):
+    """執行與報表相同的 擷取 → 合併 → 分類 流程，以 JSON 返回每位成員的報表列與總計。
+
+    不載入 Excel 模板、不寫入檔案、不壓縮，適合只想確認時數的情況。
+    """
+    logger.info(f"收到報表預覽請求: 年月={year_month}, 成員ID={member_id}")
+    if not re.match(r"^\d{6}$", year_month):
+        raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式。")
+    try:
+        run_info = {}
+        # 行事曆擷取 (含 CalendarGovernor 的退避等待) 會阻塞，於執行緒中執行，避免卡住事件迴圈上的其他請求
+        members = await asyncio.to_thread(profiled(preview_reports), year_month, member_id, run_info=run_info)
+        await asyncio.to_thread(record_calendar_dates, run_info)
+        return {
+            "year_month": year_month,
+            "holiday_version": run_info.get("holiday_version"),
+            "members": members,
+            "failures": run_info.get("failures", []),
+        }
+    except ValueError:
+        raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式。")
+    except Exception as e:
+        logger.error(f"預覽 {year_month} 報表時發生錯誤: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"無法預覽 {year_month} 報表")
+
+@app.get("/payroll_export", summary="以 CSV 或 JSONL 串流匯出分類後的加班班次 (供薪資系統匯入)")
+async def export_payroll(
+    start_ym: str = Query(..., description="起始年月 (YYYYMM)"),
+    end_ym: Optional[str] = Query(None, description="結束年月 (YYYYMM，含)；省略時與起始年月相同"),
+    member_ids: Optional[str] = Query(None, description="以逗號分隔的成員 ID (例如 A,B)；省略時匯出所有成員"),
+    format: str = Query("csv", description="csv 或 jsonl"),
+    allow_partial: bool = Query(False, description="略過行事曆擷取失敗的成員；否則回應會在送出其餘成員後中斷")
+):
+    """每列為一個分類後的班次段 (成員、員工編號、日期、起訖時間、E–I 時數、原因)。
+
+    與報表相同的 擷取 → 合併 → 分類 流程，但不產生 Excel；逐位成員產生並送出，記憶體用量不隨成員與月份數增加。
+    行事曆擷取失敗且未設定 allow_partial 時，回應不會正常結束 (用戶端會收到不完整的傳輸)，避免不完整的資料被匯入。
+    """
+    end_ym = end_ym or start_ym
+    logger.info(f"收到薪資匯出請求: {start_ym}..{end_ym}, 成員ID={member_ids}, 格式={format}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支援的匯出格式: {format} (可用: {', '.join(EXPORT_FORMATS)})")
+    try:
+        year_months = month_range(start_ym, end_ym)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式，且結束年月不可早於起始年月。")
+    if len(year_months) > MAX_REPORT_RANGE_MONTHS:
+        raise HTTPException(status_code=400, detail=f"一次最多匯出 {MAX_REPORT_RANGE_MONTHS} 個月份。")
+
+    try:
+        batches = await asyncio.to_thread(profiled(export_rows), start_ym, end_ym,
+                                          member_ids.split(',') if member_ids else None, allow_partial)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"準備薪資匯出 {start_ym}..{end_ym} 時發生錯誤: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"伺服器內部錯誤，無法匯出 {start_ym}..{end_ym}。錯誤類型: {type(e).__name__}")
+
+    filename = f"payroll_{start_ym}{'-' + end_ym if end_ym != start_ym else ''}.{format}"
+    return StreamingResponse(
+        profiled_iter(encode_rows(batches, format)), # 同步迭代器，由 Starlette 在執行緒池中逐段取出 (行事曆擷取不阻塞事件迴圈)
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+def build_report_response(generated_files_info: list, period: str, member_id: Optional[str], run_info: dict):
+    """將產生的報表檔案打包為 ZIP 回應；沒有檔案或壓縮失敗時返回 JSON 說明。
+
+    Args:
+        generated_files_info (list): generate_reports 返回的 (檔案路徑, 相對 URL) 列表。
+        period (str): 年月 (YYYYMM) 或範圍 (YYYYMM-YYYYMM)，用於訊息與 ZIP 檔名。
+        member_id (Optional[str]): 目標成員 ID。
+        run_info (dict): 報表執行的中繼資料 (holiday_version、failures)。
+
+    行事曆擷取失敗的成員不會出現在 ZIP 中，其成員 ID 以 X-Failed-Members 標頭 (逗號分隔) 返回。
+    """
+    failures = run_info.get("failures", [])
+    failed_members = sorted({failure["member_id"] for failure in failures})
+    if not generated_files_info:
+        if failures:
+            logger.error(f"針對 {period} (成員: {member_id or '所有'}) 的行事曆擷取失敗，未產生任何報表檔案。")
+            return JSONResponse(
+                status_code=502,
+                content={
+                    "message": f"無法從 Google Calendar 取得 {period} 的值班資料，未產生任何報表檔案。請稍後再試。",
+                    "generated_files": [],
+                    "failures": failures,
+                }
+            )
+        logger.warning(f"針對 {period} (成員: {member_id or '所有'}) 未產生任何報表檔案。")
+        return JSONResponse(
+            status_code=200, # 即使未產生檔案，請求本身也是成功的
+            content={
+                "message": f"已完成處理 {period} (成員: {member_id or '所有'})，但未產生任何新的報表檔案。可能原因：該期間無值班記錄，或指定的成員 ID 不存在。",
+                "generated_files": [],
+                "failures": [],
+            }
+        )
+    
+    # 準備檔案路徑列表
+    file_paths = [path for path, _ in generated_files_info]
+    
+    # *** === 新增步驟：壓縮檔案為 ZIP === ***
+    zip_filename = f"Overtime_Reports_{period}{'_' + member_id if member_id else ''}.zip"
+    zip_buffer = create_zip_from_files(file_paths, zip_filename)
+    
+    if not zip_buffer:
+        logger.error(f"壓縮檔案失敗，改為返回檔案列表")
+        # 如果壓縮失敗，仍然返回檔案列表
+        response_files = [{"path": path, "url": url} for path, url in generated_files_info]
+        return JSONResponse(
+            status_code=500,
+            content={
+                "message": f"產生 {period} 加班表成功，但壓縮檔案失敗。請逐一下載檔案。",
+                "generated_files": response_files,
+                "failures": failures,
+            }
+        )
+        
+    # 返回 ZIP 檔案
+    logger.info(f"成功產生 ZIP 檔案: {zip_filename}，準備下載")
+    
+    headers = {
+        "Content-Disposition": f"attachment; filename={zip_filename}",
+        "X-Holiday-Version": str(run_info.get("holiday_version", "")),
+    }
+    if failed_members:
+        logger.warning(f"{period} 的 ZIP 不含行事曆擷取失敗的成員: {failed_members}")
+        headers["X-Failed-Members"] = ",".join(failed_members)
+
+    # ZIP 也存入內容定址的檔案儲存區，Content-Location 為之後可重複下載 (且可快取) 的網址
+    try:
+        blob = blob_store.put_bytes(zip_buffer.getbuffer(), 'zip')
+        headers["Content-Location"] = blob_store.url_for(blob, zip_filename)
+        return ArtifactFileResponse(blob_store.path_for(blob), etag=parse_blob_name(blob)[0], filename=zip_filename,
+                                    media_type="application/zip", immutable=False, headers=headers)
+    except OSError as e:
+        logger.error(f"存入 ZIP 至報表檔案儲存區失敗，改為直接傳送: {e}", exc_info=True)
+    
+    return StreamingResponse(
+        zip_buffer,  # 直接傳遞 BytesIO 物件，不需要 getvalue()
+        media_type="application/zip",
+        headers=headers
+    )
+
 # --- 修改後的報表生成端點 ---
 @app.post("/generate_report/{year_month}", 
           summary="產生指定年月的加班報表",
@@ -453,55 +984,16 @@ async def trigger_report_generation(
         raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式。")
 
     try:
-        # *** === 新增步驟：清理輸出目錄 === ***
-        if not clear_output_directory(OUTPUT_DIR):
-            logger.error(f"清理輸出目錄 {OUTPUT_DIR} 失敗，繼續執行但可能存在舊檔案。")
-            # 不中止，但記錄錯誤
+        # 呼叫核心邏輯 (輸出到本次請求的獨立目錄，ZIP 打包完成後才移到共用的輸出目錄)
+        def run():
+            run_info = {}
+            with report_output_dir() as output_dir:
+                generated_files_info = generate_reports(year_month, member_id, run_info=run_info, output_dir=output_dir)
+                record_report_run(run_info)
+                return build_report_response(generated_files_info, year_month, member_id, run_info)
 
-        # 呼叫核心邏輯
-        generated_files_info = generate_reports(year_month, member_id)
-        
-        if not generated_files_info:
-            logger.warning(f"針對 {year_month} (成員: {member_id or '所有'}) 未產生任何報表檔案。")
-            return JSONResponse(
-                status_code=200, # 即使未產生檔案，請求本身也是成功的
-                content={
-                    "message": f"已完成處理 {year_month} (成員: {member_id or '所有'})，但未產生任何新的報表檔案。可能原因：該月份無值班記錄，或指定的成員 ID 不存在。",
-                    "generated_files": []
-                }
-            )
-        
-        # 準備檔案路徑列表
-        file_paths = [path for path, _ in generated_files_info]
-        
-        # *** === 新增步驟：壓縮檔案為 ZIP === ***
-        zip_filename = f"Overtime_Reports_{year_month}{'_' + member_id if member_id else ''}.zip"
-        zip_buffer = create_zip_from_files(file_paths, zip_filename)
-        
-        if not zip_buffer:
-            logger.error(f"壓縮檔案失敗，改為返回檔案列表")
-            # 如果壓縮失敗，仍然返回檔案列表
-            response_files = [{"path": path, "url": url} for path, url in generated_files_info]
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "message": f"產生 {year_month} 加班表成功，但壓縮檔案失敗。請逐一下載檔案。",
-                    "generated_files": response_files
-                }
-            )
-            
-        # 返回 ZIP 檔案
-        logger.info(f"成功產生 ZIP 檔案: {zip_filename}，準備下載")
-        
-        headers = {
-            "Content-Disposition": f"attachment; filename={zip_filename}"
-        }
-        
-        return StreamingResponse(
-            zip_buffer,  # 直接傳遞 BytesIO 物件，不需要 getvalue()
-            media_type="application/zip",
-            headers=headers
-        )
+        # 行事曆擷取、Excel 產生與壓縮都會阻塞，於執行緒中執行，避免卡住事件迴圈上的其他請求
+        return await asyncio.to_thread(profiled(run))
 
     except FileNotFoundError as e:
          logger.error(f"處理請求時發生檔案找不到錯誤: {e}", exc_info=True)
@@ -511,11 +1003,185 @@ async def trigger_report_generation(
         # 避免洩漏過多內部錯誤細節給客戶端
         raise HTTPException(status_code=500, detail=f"伺服器內部錯誤，無法完成報表產生。請檢查伺服器日誌。錯誤類型: {type(e).__name__}")
 
+@app.post("/generate_report_range",
+          summary="產生多個月份的加班報表",
+          description="一次產生 `start_ym`..`end_ym` (含，格式 YYYYMM) 每個月份的報表並打包為 ZIP 檔案下載。\n"
+                      "每位成員只查詢一次 Google Calendar，假日與手動記錄也只載入一次。")
+async def trigger_report_range_generation(
+    start_ym: str = Query(..., description="起始年月 (YYYYMM)"),
+    end_ym: str = Query(..., description="結束年月 (YYYYMM)"),
+    member_id: Optional[str] = Query(None, description="要處理的特定成員 ID (例如: A, B)。如果省略，則處理所有成員。")
+):
+    """處理多月份報表產生請求，並將所有月份的檔案壓縮成單一 ZIP 檔案。"""
+    logger.info(f"收到範圍報表產生請求: {start_ym}..{end_ym}, 成員ID={member_id}")
+    try:
+        year_months = month_range(start_ym, end_ym)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式，且結束年月不可早於起始年月。")
+    if len(year_months) > MAX_REPORT_RANGE_MONTHS:
+        raise HTTPException(status_code=400, detail=f"一次最多產生 {MAX_REPORT_RANGE_MONTHS} 個月份的報表。")
+
+    try:
+        def run():
+            run_info = {}
+            with report_output_dir() as output_dir:
+                generated_files_info = generate_reports_range(start_ym, end_ym, member_id, run_info=run_info,
+                                                              output_dir=output_dir)
+                record_report_run(run_info)
+                return build_report_response(generated_files_info, f"{start_ym}-{end_ym}", member_id, run_info)
+
+        return await asyncio.to_thread(profiled(run)) # 同 trigger_report_generation，不阻塞事件迴圈
+
+    except FileNotFoundError as e:
+         logger.error(f"處理請求時發生檔案找不到錯誤: {e}", exc_info=True)
+         raise HTTPException(status_code=500, detail=f"伺服器內部錯誤：缺少必要的設定檔 ({e})。")
+    except Exception as e:
+        logger.error(f"處理範圍報表產生請求時發生未預期錯誤: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"伺服器內部錯誤，無法完成報表產生。請檢查伺服器日誌。錯誤類型: {type(e).__name__}")
+
+@app.get("/reports", summary="列出報表儲存區中的報表與過期狀態")
+async def list_stored_reports(year_month: Optional[str] = Query(None, description="只列出指定年月 (YYYYMM)")):
+    """每位成員每月最新一版的報表；dirty 為 true 表示輸入已變更、等待背景重新產生。"""
+    if year_month is not None and not re.match(r"^\d{6}$", year_month):
+        raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式。")
+    reports = [
+        {**entry, "url": f"/reports/{entry['year_month']}/{entry['member_id']}",
+         "artifact_url": blob_store.url_for(entry['blob'], entry['file']) if entry.get('blob') else None}
+        for entry in report_artifacts.entries()
+        if year_month is None or entry['year_month'] == year_month
+    ]
+    return {
+        "reports": reports,
+        "pending": len(report_artifacts.dirty_keys()),
+        "artifacts": blob_store.usage(),
+        "worker": {"running": report_regenerator.is_running(), "leader": report_regenerator.leader,
+                   "pid": os.getpid(), **report_regenerator.stats},
+    }
+
+@app.get("/reports/{year_month}/{member_id}", summary="下載報表儲存區中的報表")
+async def download_stored_report(year_month: str, member_id: str):
+    key = report_key(year_month, member_id.upper())
+    entry = report_artifacts.get(key) if re.match(r"^\d{6}$", year_month) else None
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"找不到 {year_month} 成員 {member_id} 的報表")
+    headers = {"X-Report-Dirty": "1" if entry['dirty'] else "0"}
+    path = blob_store.open(entry['blob']) if entry.get('blob') else None
+    if path is not None:
+        # 網址固定但內容會隨重新產生而改變：以內容雜湊作 ETag 要求每次確認，並指向內容不變的網址
+        headers["Content-Location"] = blob_store.url_for(entry['blob'], entry['file'])
+        return ArtifactFileResponse(path, etag=parse_blob_name(entry['blob'])[0], filename=entry['file'],
+                                    media_type=MEDIA_TYPES['xlsx'], immutable=False, headers=headers)
+    legacy_path = report_artifacts.legacy_path(key) # 改存 BlobStore 之前產生的報表
+    if not os.path.isfile(legacy_path):
+        raise HTTPException(status_code=404, detail=f"{year_month} 成員 {member_id} 的報表檔案已不存在")
+    return FileResponse(
+        path=legacy_path,
+        filename=entry['file'],
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers=headers,
+    )
+
+@app.post("/reports/{year_month}/{member_id}/regenerate", summary="要求在背景重新產生指定的報表", status_code=202)
+async def request_report_regeneration(year_month: str, member_id: str):
+    if not re.match(r"^\d{6}$", year_month) or not report_regenerator.request(year_month, member_id.upper()):
+        raise HTTPException(status_code=404, detail=f"找不到 {year_month} 成員 {member_id} 的報表")
+    return {"message": f"已排入重新產生: {year_month}/{member_id.upper()}"}
+
+def format_sse(event: dict) -> str:
+    """把進度事件轉為 SSE 訊息 (`event:` 為事件類型，`data:` 為 JSON)。"""
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+@app.get("/generate_report_events",
+         summary="產生報表並以 Server-Sent Events 串流每位成員的進度",
+         description="與 `/generate_report_range` 相同的流程，但不等全部完成：每位成員擷取、分類、產生 Excel 後立即送出事件，"
+                     "`rendered` 事件中的 `url` 可直接下載該成員的報表。最後送出 `complete` (含所有檔案) 或 `report_error`。")
+async def stream_report_generation(
+    start_ym: str = Query(..., description="起始年月 (YYYYMM)"),
+    end_ym: Optional[str] = Query(None, description="結束年月 (YYYYMM)，省略時只產生 start_ym"),
+    member_id: Optional[str] = Query(None, description="要處理的特定成員 ID (例如: A, B)。如果省略，則處理所有成員。")
+):
+    """以 text/event-stream 串流報表產生進度。
+
+    事件類型: started、fetched、classified、rendered、skipped、failed、finished (見 `generate_reports_range`)，
+    以及本端點送出的 complete / report_error (不使用 error，以免與瀏覽器 EventSource 的連線錯誤事件混淆)。
+    報表在背景執行緒產生；用戶端斷線後，下一個進度事件會中止產生。
+    """
+    end_ym = end_ym or start_ym
+    logger.info(f"收到報表進度串流請求: {start_ym}..{end_ym}, 成員ID={member_id}")
+    try:
+        year_months = month_range(start_ym, end_ym)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="年月格式錯誤，請使用 YYYYMM 格式，且結束年月不可早於起始年月。")
+    if len(year_months) > MAX_REPORT_RANGE_MONTHS:
+        raise HTTPException(status_code=400, detail=f"一次最多產生 {MAX_REPORT_RANGE_MONTHS} 個月份的報表。")
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    disconnected = threading.Event()
+
+    def publish(event: Optional[dict]) -> None:
+        try:
+            loop.call_soon_threadsafe(events.put_nowait, event)
+        except RuntimeError: # 事件迴圈已關閉 (伺服器停止中)
+            pass
+
+    def on_progress(event: dict) -> None:
+        if disconnected.is_set():
+            raise ReportCancelled()
+        publish(event)
+
+    def run() -> None:
+        run_info = {}
+        try:
+            with report_output_dir() as output_dir:
+                generated_files_info = generate_reports_range(start_ym, end_ym, member_id, run_info=run_info,
+                                                              progress=on_progress, output_dir=output_dir)
+                record_report_run(run_info)
+            publish({
+                "event": "complete",
+                "holiday_version": run_info.get("holiday_version"),
+                "files": [{"file": os.path.basename(path), "url": url} for path, url in generated_files_info],
+                "failures": run_info.get("failures", []),
+            })
+        except ReportCancelled:
+            logger.info(f"用戶端已斷線，停止產生 {start_ym}..{end_ym} 報表")
+            publish(None)
+        except Exception as e:
+            logger.error(f"串流產生報表時發生未預期錯誤: {e}", exc_info=True)
+            publish({"event": "report_error", "detail": f"伺服器內部錯誤，無法完成報表產生。錯誤類型: {type(e).__name__}"})
+
+    async def stream():
+        worker = asyncio.ensure_future(asyncio.to_thread(profiled(run)))
+        _report_stream_tasks.add(worker)
+        worker.add_done_callback(_report_stream_tasks.discard)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield format_sse(event)
+                if event["event"] in ("complete", "report_error"):
+                    break
+            await worker # 最後的事件已送出，工作隨即結束；等它結束再關閉回應 (效能分析因此包含整個工作)
+        finally:
+            disconnected.set() # 工作仍在執行時，於下一個進度事件中止
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # --- 運行伺服器 ---
+IMPORT_MS = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+logger.info(f"API 模組載入完成，耗時 {IMPORT_MS} ms")
+
 # 這個區塊允許你直接執行 `python src/api/main.py` 來啟動伺服器進行測試
 # 但在生產環境中，建議使用 uvicorn 命令來啟動，例如：
 # uvicorn src.api.main:app --reload --host 0.0.0.0 --port 8088
 if __name__ == "__main__":
+    import uvicorn
     logger.info("直接啟動 API 伺服器 (用於測試)...")
     # 注意：直接運行時，uvicorn 的 reload 可能不會如預期般工作
     # 建議使用 uvicorn 命令啟動
@@ -0,0 +1,242 @@
+import json
+import os
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from ..services.json_storage import atomic_write_json
+from ..services.metrics import io_timer
+from ..services.shared_state import ChangeLog, InterProcessLock
+from ..services.duty_store import INVALID_PARTITION, expand_duties
+from .report_generator import _split_manual_duty, _calculate_shift_hours, combine_member_shifts, current_rate_table
+from .overtime_rates import BUCKETS
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_DATES_FILE = 'calendar_dates.json' # data/calendar_dates.json: {"YYYYMM": {"姓名": ["YYYYMMDD", ...]}}
+
+def _zero() -> list[float]:
+    return [0.0] * (len(BUCKETS) + 3) # [總時數, E, F, G, H, I, 手動時數, 行事曆時數]
+
+
+def _accumulate(target: list[float], shifts: Iterable[dict], year_month: str, holidays) -> None:
+    """把班次段的工時分類累加到 target (只計入目標月份內的班次段，與報表相同)。"""
+    for shift in shifts:
+        if not shift['date'].startswith(year_month):
+            continue
+        hours = _calculate_shift_hours(holidays, shift['date'], shift['start'], shift['end'], shift.get('tier_offset', 0))
+        total = sum(hours)
+        target[0] += total
+        for index, value in enumerate(hours, start=1):
+            target[index] += value
+        target[-2 if shift.get('is_manual') else -1] += total
+
+
+def duties_by_person(records: Iterable[dict], year_month: str) -> dict[str, list[dict]]:
+    """把一組手動記錄 (可含群組記錄) 展開並拆成班次段，依成員分組。
+
+    Returns:
+        dict[str, list[dict]]: 成員姓名 -> `_split_manual_duty` 產生的班次段。
+    """
+    segments_by_person = {}
+    for duty_entry in expand_duties(records):
+        person = duty_entry.get('person')
+        if not person or not duty_entry.get('dateTime', '').startswith(year_month):
+            continue
+        try:
+            segments = _split_manual_duty(duty_entry)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.debug("摘要計算略過格式錯誤的記錄 %s: %s", duty_entry, e)
+            continue
+        segments_by_person.setdefault(person, []).extend(segments)
+    return segments_by_person
+
+
+def member_totals(manual_segments: list[dict], calendar_dates: Iterable[str], year_month: str, holidays) -> list[float]:
+    """以與報表相同的合併規則 (含重疊處理) 計算一位成員的工時分類。
+
+    Returns:
+        list[float]: [總時數, E, F, G, H, I, 手動時數, 行事曆時數]。
+    """
+    combined_shifts_by_date, _ = combine_member_shifts(calendar_dates, manual_segments, holidays)
+    totals = _zero()
+    for shifts in combined_shifts_by_date.values():
+        _accumulate(totals, shifts, year_month, holidays)
+    return totals
+
+
+class OvertimeAggregates:
+    """每位成員、每個月份的加班時數摘要 (總時數與 E–I 五個分類)。
+
+    摘要由兩部分合併而成，合併方式與報表相同 (重疊時段只計算一次)：
+        * 手動記錄：DutyStore 分區 (含週期規則)。
+        * 行事曆值班：使用最近一次產生報表時記錄的值班日期 (data/calendar_dates.json)，
+          因此查詢摘要不需要呼叫 Google Calendar API。
+    月份在第一次查詢時才計算；加班記錄變更時只重算受影響的成員，
+    假日狀態變更時只重算受影響的月份，週期規則或加班費率規則變更時讓所有月份失效。
+    其他 worker 的修改在查詢時載入 (各 store 的 refresh)，受影響的月份整月重算。
+    """
+
+    def __init__(self, duty_store, holiday_store, data_dir: str):
+        self.duty_store = duty_store
+        self.holiday_store = holiday_store
+        self.calendar_file = os.path.join(data_dir, CALENDAR_DATES_FILE)
+        self._lock = threading.RLock()
+        self._months = {} # YYYYMM -> {姓名: [總時數, E..I, 手動時數, 行事曆時數]}
+        self._rates_version = None # 計算 _months 時的加班費率規則版本
+        self._file_lock = InterProcessLock(f"{self.calendar_file}.lock")
+        self._changes = ChangeLog(f"{self.calendar_file}.version")
+        self._calendar_dates = self._read_calendar_dates()
+
+        duty_store.subscribe(self._on_duties_changed)
+        duty_store.rules.subscribe(self._on_rules_changed)
+        holiday_store.subscribe(self._on_holiday_changed)
+
+    def _read_calendar_dates(self) -> dict:
+        if not os.path.exists(self.calendar_file):
+            return {}
+        try:
+            with io_timer('calendar_dates', 'read'), open(self.calendar_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"讀取行事曆值班日期失敗 ({self.calendar_file})，摘要將不含行事曆值班: {e}")
+            return {}
+
+    def _refresh_calendar_dates(self) -> None:
+        """其他 worker 記錄過行事曆值班日期時重新載入，並讓變更的月份失效。"""
+        with self._lock:
+            changed = self._changes.poll()
+            if changed is None:
+                return
+            _, months = changed
+            self._calendar_dates = self._read_calendar_dates()
+            if months is None:
+                self._months.clear()
+            for year_month in months or ():
+                self._months.pop(year_month, None)
+
+    # --- 計算 ---
+    def _compute_members(self, year_month: str, records: list[dict], holidays,
+                         persons: Optional[Iterable[str]] = None) -> dict:
+        """計算 persons (None 表示所有出現在記錄或行事曆中的成員) 的摘要，沒有時數的成員不列入。"""
+        manual = duties_by_person(records, year_month)
+        calendar = self._calendar_dates.get(year_month, {})
+        if persons is None:
+            persons = list(manual) + [name for name in calendar if name not in manual]
+        totals = {}
+        for name in persons:
+            member = member_totals(manual.get(name, []), calendar.get(name, []), year_month, holidays)
+            if any(member):
+                totals[name] = member
+        return totals
+
+    def _month_records(self, year_month: str, holidays, partition: Optional[list[dict]] = None) -> list[dict]:
+        if partition is None:
+            return self.duty_store.load_month_with_rules(year_month, holidays)
+        return partition + self.duty_store.rules.expand_month(year_month, holidays)
+
+    def _compute_month(self, year_month: str, holidays) -> dict:
+        return self._compute_members(year_month, self._month_records(year_month, holidays), holidays)
+
+    def _recompute_persons(self, year_month: str, persons: Iterable[str], holidays,
+                           partition: Optional[list[dict]] = None) -> None:
+        month = self._months.get(year_month)
+        if month is None:
+            return
+        persons = set(persons)
+        records = self._month_records(year_month, holidays, partition)
+        for name in persons:
+            month.pop(name, None)
+        month.update(self._compute_members(year_month, records, holidays, persons))
+
+    # --- 變更通知 ---
+    def _on_duties_changed(self, changes: dict) -> None:
+        """只重算新增/移除記錄涉及的成員；尚未計算過的月份等第一次查詢時再算。"""
+        with self._lock:
+            holidays = self.holiday_store.snapshot()
+            for year_month, (before, after) in changes.items():
+                if year_month not in self._months or year_month == INVALID_PARTITION:
+                    continue
+                if before is None: # 其他 worker 的寫入，不知道修改前的記錄
+                    self._months.pop(year_month)
+                    continue
+                before_ids = {id(duty) for duty in before}
+                after_ids = {id(duty) for duty in after}
+                changed = [duty for duty in before if id(duty) not in after_ids]
+                changed += [duty for duty in after if id(duty) not in before_ids]
+                persons = {duty['person'] for duty in expand_duties(changed) if duty.get('person')}
+                self._recompute_persons(year_month, persons, holidays, partition=after)
+
+    def _on_rules_changed(self) -> None:
+        with self._lock:
+            self._months.clear()
+
+    def _on_holiday_changed(self, date: Optional[str], old, new) -> None:
+        """假日狀態只影響當天的班次段與前一天開始的行事曆值班，重算這些月份即可。"""
+        with self._lock:
+            if date is None:
+                self._months.clear()
+                return
+            try:
+                previous_day = (datetime.strptime(date, "%Y%m%d") - timedelta(days=1)).strftime("%Y%m%d")
+            except ValueError:
+                return
+            for year_month in {date[:6], previous_day[:6]}:
+                if year_month in self._months:
+                    self._months[year_month] = self._compute_month(year_month, new)
+
+    def record_calendar_dates(self, year_month: str, dates_by_member: dict) -> None:
+        """保存報表產生時取得的行事曆值班開始日期，並重算這些成員在該月份的摘要。
+
+        Args:
+            year_month (str): 年月 (YYYYMM)。
+            dates_by_member (dict): 成員姓名 -> 值班開始日期 (YYYYMMDD) 列表。
+        """
+        if not dates_by_member:
+            return
+        with self._lock, self._file_lock:
+            self._refresh_calendar_dates() # 合併其他 worker 剛記錄的成員，避免覆蓋
+            month = dict(self._calendar_dates.get(year_month, {}))
+            month.update({name: sorted(dates) for name, dates in dates_by_member.items()})
+            calendar_dates = {**self._calendar_dates, year_month: month}
+            with io_timer('calendar_dates', 'write'):
+                atomic_write_json(self.calendar_file, calendar_dates)
+            self._changes.bump([year_month])
+            self._calendar_dates = calendar_dates
+            self._recompute_persons(year_month, dates_by_member, self.holiday_store.snapshot())
+        logger.info(f"已更新 {year_month} 的行事曆值班日期 ({len(dates_by_member)} 位成員)")
+
+    # --- 查詢 ---
+    def calendar_synced(self, year_month: str) -> bool:
+        """該月份是否已有行事曆值班日期 (曾經產生過報表)。"""
+        self._refresh_calendar_dates()
+        return year_month in self._calendar_dates
+
+    def month_summary(self, year_month: str) -> dict[str, dict]:
+        """返回指定月份每位成員的摘要。
+
+        Returns:
+            dict[str, dict]: 成員姓名 -> {"total_hours", "E".."I", "manual_hours", "calendar_hours"}。
+                manual_hours / calendar_hours 為重疊處理後各來源實際計入的時數。
+        """
+        with self._lock:
+            rates_version = current_rate_table().version
+            if rates_version != self._rates_version:
+                self._months.clear()
+                self._rates_version = rates_version
+            # 載入其他 worker 的修改 (變更通知會讓受影響的月份失效)
+            self.duty_store.refresh()
+            self.holiday_store.snapshot()
+            self._refresh_calendar_dates()
+            if year_month not in self._months:
+                self._months[year_month] = self._compute_month(year_month, self.holiday_store.snapshot())
+            return {
+                name: {
+                    "total_hours": totals[0],
+                    **dict(zip(BUCKETS, totals[1:len(BUCKETS) + 1])),
+                    "manual_hours": totals[-2],
+                    "calendar_hours": totals[-1],
+                }
+                for name, totals in self._months[year_month].items()
+            }
@@ -0,0 +1,241 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import logging
+from typing import Optional
+
+from ..services.logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = ('E', 'F', 'G', 'H', 'I') # 報表欄位；_calculate_shift_hours 依此順序回傳
+DAY_TYPES = ('weekday', 'holiday', 'special')
+MAX_SHIFT_MINUTES = 24 * 60 # 班次段不跨日，最長 24 小時
+RELOAD_CHECK_SECONDS = 1.0  # 規則檔的修改時間最多每秒檢查一次
+
+# 與原本寫死在 _calculate_shift_hours / _standard_shifts 中的規則相同。
+# tiers 依序分配時數，最後一層不設 hours 表示其餘全部；special 省略時沿用 holiday。
+DEFAULT_RATE_RULES = {
+    "day_types": {
+        "weekday": [{"bucket": "E", "hours": 2}, {"bucket": "F", "hours": 2}, {"bucket": "G"}],
+        "holiday": [{"bucket": "H", "hours": 8}, {"bucket": "I"}],
+    },
+    "standard_shift": {"weekday_start": "1600", "holiday_start": "0800", "end": "0800"},
+}
+
+
+def _parse_hhmm(value, field: str) -> str:
+    if not isinstance(value, str) or len(value) != 4 or not value.isdigit() \
+            or int(value[:2]) > 23 or int(value[2:]) > 59:
+        raise ValueError(f"{field} 必須是 HHMM 格式的時間: {value!r}")
+    return value
+
+
+def _compile_tiers(day_type: str, tiers) -> tuple[tuple[int, int], ...]:
+    """把時數分層轉為 ((bucket 索引, 分鐘數上限), ...)；最後一層的上限為 MAX_SHIFT_MINUTES。"""
+    if not isinstance(tiers, list) or not tiers:
+        raise ValueError(f"day_types.{day_type} 必須是非空的列表")
+    compiled = []
+    for position, tier in enumerate(tiers):
+        is_last = position == len(tiers) - 1
+        bucket = tier.get('bucket') if isinstance(tier, dict) else None
+        if bucket not in BUCKETS:
+            raise ValueError(f"day_types.{day_type}[{position}].bucket 必須是 {', '.join(BUCKETS)} 之一: {bucket!r}")
+        hours = tier.get('hours')
+        if hours is None:
+            if not is_last:
+                raise ValueError(f"day_types.{day_type}[{position}] 只有最後一層可以省略 hours")
+            minutes = MAX_SHIFT_MINUTES
+        elif isinstance(hours, bool) or not isinstance(hours, (int, float)) or hours <= 0:
+            raise ValueError(f"day_types.{day_type}[{position}].hours 必須是正數: {hours!r}")
+        elif is_last:
+            raise ValueError(f"day_types.{day_type} 的最後一層不可設定 hours (需承接其餘時數)")
+        else:
+            minutes = round(hours * 60)
+        compiled.append((BUCKETS.index(bucket), minutes))
+    return tuple(compiled)
+
+
+class RateTable:
+    """編譯後的加班費率表：依日期類型與班次分鐘數直接查出 E–I 的時數分配。
+
+    每種日期類型預先計算 0..MAX_SHIFT_MINUTES 每個分鐘數的 E–I 分鐘數，
+    分類時只需一次查表，不再逐層比較。
+    """
+
+    def __init__(self, config: dict, source: str = '<default>'):
+        """編譯規則設定。
+
+        Raises:
+            ValueError: 設定格式錯誤時。
+        """
+        if not isinstance(config, dict):
+            raise ValueError("規則設定必須是 JSON 物件")
+        day_types = config.get('day_types')
+        if not isinstance(day_types, dict) or 'weekday' not in day_types or 'holiday' not in day_types:
+            raise ValueError("day_types 必須包含 weekday 與 holiday")
+        unknown = set(day_types) - set(DAY_TYPES)
+        if unknown:
+            raise ValueError(f"未知的日期類型: {sorted(unknown)} (可用: {', '.join(DAY_TYPES)})")
+        shift = config.get('standard_shift')
+        if not isinstance(shift, dict):
+            raise ValueError("standard_shift 必須是 JSON 物件")
+
+        self.source = source
+        self.version = hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.weekday_start = _parse_hhmm(shift.get('weekday_start'), 'standard_shift.weekday_start')
+        self.holiday_start = _parse_hhmm(shift.get('holiday_start'), 'standard_shift.holiday_start')
+        self.standard_end = _parse_hhmm(shift.get('end'), 'standard_shift.end')
+
+        tiers = {name: _compile_tiers(name, day_types[name]) for name in ('weekday', 'holiday')}
+        tiers['special'] = _compile_tiers('special', day_types['special']) if 'special' in day_types else tiers['holiday']
+        self._tables = {name: self._build_table(day_tiers) for name, day_tiers in tiers.items()}
+
+    @staticmethod
+    def _build_table(tiers: tuple[tuple[int, int], ...]) -> list[tuple[int, ...]]:
+        """table[d] = 長度 d 分鐘的班次段在 E–I 各分到的分鐘數。"""
+        minute_bucket = []
+        for bucket, minutes in tiers:
+            minute_bucket.extend([bucket] * min(minutes, MAX_SHIFT_MINUTES - len(minute_bucket)))
+        table = [(0,) * len(BUCKETS)]
+        counts = [0] * len(BUCKETS)
+        for bucket in minute_bucket:
+            counts[bucket] += 1
+            table.append(tuple(counts))
+        return table
+
+    @staticmethod
+    def day_type(is_holiday: bool, is_special: bool) -> str:
+        """特殊日 (是否放假=3) 在假日索引中也標記為假日，因此先判斷 is_special。"""
+        if is_special:
+            return 'special'
+        return 'holiday' if is_holiday else 'weekday'
+
+    def classify(self, day_type: str, minutes: int, offset: int = 0) -> list[float]:
+        """返回長度 minutes 分鐘的班次段在 E–I 的時數 (每項四捨五入到 0.5 小時)。
+
+        offset 大於 0 時，班次段從第 offset 分鐘的級距開始 (同一班次段被裁切後的後續片段)。
+        """
+        table = self._tables[day_type]
+        counts = table[min(max(offset + minutes, 0), MAX_SHIFT_MINUTES)]
+        if offset > 0:
+            before = table[min(offset, MAX_SHIFT_MINUTES)]
+            counts = [count - previous for count, previous in zip(counts, before)]
+        return [round(count / 30) / 2 for count in counts]
+
+    def standard_start(self, is_holiday: bool) -> str:
+        """行事曆值班當天的標準班次開始時間 (次日到 standard_end 結束)。"""
+        return self.holiday_start if is_holiday else self.weekday_start
+
+
+def legacy_work_hours(total_hours: float, is_holiday_or_special: bool) -> list[float]:
+    """原本寫死的分類規則，作為 `check_against_legacy` 的比對基準。"""
+    if is_holiday_or_special:
+        result = [0.0, 0.0, 0.0, min(8, total_hours), max(0, total_hours - 8)]
+    else:
+        result = [min(2, total_hours), min(2, max(0, total_hours - 2)), max(0, total_hours - 4), 0.0, 0.0]
+    return [round(float(x) * 2) / 2 for x in result]
+
+
+def check_against_legacy(table: RateTable) -> list[str]:
+    """以每半小時的班次長度比對編譯後的規則與原本的規則，返回差異說明 (空列表表示一致)。"""
+    differences = []
+    for day_type in DAY_TYPES:
+        for half_hours in range(MAX_SHIFT_MINUTES // 30 + 1):
+            expected = legacy_work_hours(half_hours / 2, day_type != 'weekday')
+            actual = table.classify(day_type, half_hours * 30)
+            if actual != expected:
+                differences.append(f"{day_type} {half_hours / 2:g}h: 預期 {expected}，實際 {actual}")
+    for is_holiday, expected in ((False, "1600"), (True, "0800")):
+        if table.standard_start(is_holiday) != expected:
+            label = 'holiday_start' if is_holiday else 'weekday_start'
+            differences.append(f"standard_shift.{label}: 預期 {expected}，實際 {table.standard_start(is_holiday)}")
+    if table.standard_end != "0800":
+        differences.append(f"standard_shift.end: 預期 0800，實際 {table.standard_end}")
+    return differences
+
+
+def load_rate_table(path: Optional[str]) -> RateTable:
+    """讀取並編譯規則檔；檔案不存在時使用 DEFAULT_RATE_RULES。
+
+    Raises:
+        ValueError: 規則檔不是有效的 JSON 或格式錯誤時。
+    """
+    if not path or not os.path.exists(path):
+        return RateTable(DEFAULT_RATE_RULES)
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            config = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"規則檔不是有效的 JSON: {e}") from e
+    table = RateTable(config, source=path)
+    differences = check_against_legacy(table)
+    if differences:
+        logger.warning(f"加班費率規則 {path} 與原本的規則有 {len(differences)} 處不同，例如: {differences[0]}")
+    return table
+
+
+_lock = threading.Lock()
+_cache = {} # 規則檔路徑 -> (mtime_ns, 上次檢查時間, RateTable)
+
+
+def rate_table(path: Optional[str]) -> RateTable:
+    """返回規則檔的編譯結果；檔案修改後自動重新編譯 (最多每 RELOAD_CHECK_SECONDS 秒檢查一次)。
+
+    重新編譯失敗時記錄錯誤並繼續使用上一版 (第一次載入失敗時使用預設規則)。
+    """
+    now = time.monotonic()
+    cached = _cache.get(path)
+    if cached is not None and now - cached[1] < RELOAD_CHECK_SECONDS:
+        return cached[2]
+    with _lock:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns if path else None
+        except FileNotFoundError:
+            mtime_ns = None
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            _cache[path] = (mtime_ns, now, cached[2])
+            return cached[2]
+        try:
+            table = load_rate_table(path)
+            logger.info(f"已載入加班費率規則 (版本 {table.version}，來源 {table.source})")
+        except (ValueError, OSError) as e:
+            table = cached[2] if cached is not None else RateTable(DEFAULT_RATE_RULES)
+            logger.error(f"載入加班費率規則 {path} 失敗，沿用版本 {table.version}: {e}")
+        _cache[path] = (mtime_ns, now, table)
+        return table
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="編譯並檢查加班費率規則檔")
+    parser.add_argument("path", nargs='?', help="規則檔路徑 (省略時檢查預設規則)")
+    parser.add_argument("--strict", action="store_true", help="與原本的規則不同時以結束碼 1 結束")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    try:
+        table = RateTable(DEFAULT_RATE_RULES) if args.path is None else load_rate_table(args.path)
+    except (ValueError, OSError) as e:
+        print(f"規則檔錯誤: {e}", file=sys.stderr)
+        return 1
+    differences = check_against_legacy(table)
+    print(f"規則版本 {table.version} ({table.source})")
+    print(f"標準班次: 平日 {table.weekday_start}、假日 {table.holiday_start} 開始，次日 {table.standard_end} 結束")
+    for day_type in DAY_TYPES:
+        print(f"  {day_type:8s} 12h -> {dict(zip(BUCKETS, table.classify(day_type, 12 * 60)))}")
+    if differences:
+        print(f"與原本的規則有 {len(differences)} 處不同:")
+        for line in differences[:20]:
+            print(f"  {line}")
+        return 1 if args.strict else 0
+    print("與原本的規則一致")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+import logging
+from typing import Iterable, Iterator, Optional
+
+from ..services.event_sources import EventSource, EVENT_SOURCE_ENV
+from ..services.logging_setup import configure_logging
+from ..services.metrics import REPORT_RUN_SECONDS, REPORT_MEMBERS, REPORT_SHIFTS
+from .overtime_rates import BUCKETS
+from .report_generator import classified_rows
+
+logger = logging.getLogger(__name__)
+
+# 每列一個分類後的班次段；日期 YYYYMMDD、時間 HHMM 與報表流程相同，E–I 為時數
+EXPORT_FIELDS = ('member_id', 'name', 'employee_id', 'date', 'weekday', 'start', 'end',
+                 *BUCKETS, 'total_hours', 'reason', 'source')
+EXPORT_FORMATS = {
+    'csv': "text/csv; charset=utf-8",
+    'jsonl': "application/x-ndjson; charset=utf-8",
+}
+FLUSH_BYTES = 64 * 1024 # 累積到這個大小 (或一位成員一個月份結束) 時送出一段
+
+
+class PayrollExportIncomplete(Exception):
+    """有成員的行事曆擷取失敗，匯出的資料不完整 (未允許部分匯出時在串流途中拋出，讓用戶端不會誤用)。"""
+
+    def __init__(self, failures: list[dict]):
+        self.failures = failures
+        members = sorted({f"{failure['year_month']}/{failure['member_id']}" for failure in failures})
+        super().__init__(f"行事曆擷取失敗，匯出不完整: {', '.join(members)}")
+
+
+def _export_row(member_id: str, member_info: dict, duty: dict) -> dict:
+    hours = [round(value, 2) for value in duty['work_hours']]
+    return {
+        "member_id": member_id,
+        "name": member_info.get('name'),
+        "employee_id": member_info.get('employee_id'),
+        "date": duty['date'],
+        "weekday": duty['weekday'],
+        "start": duty['start'],
+        "end": duty['end'],
+        **dict(zip(BUCKETS, hours)),
+        "total_hours": round(sum(hours), 2),
+        "reason": duty['reason'],
+        "source": 'manual' if duty['is_manual'] else 'calendar',
+    }
+
+
+def export_rows(start_ym: str, end_ym: str, member_ids: Optional[Iterable[str]] = None, allow_partial: bool = False,
+                members: Optional[dict] = None, event_source: Optional[EventSource] = None) -> Iterator[list[dict]]:
+    """準備匯出並返回迭代器，依成員、月份順序逐批產生匯出列 (每批為一位成員一個月份)。
+
+    不產生 Excel，也不會同時保留多位成員的資料。準備階段的錯誤在返回前拋出 (見 `classified_rows`)。
+
+    Args:
+        start_ym (str): 起始年月 (YYYYMM)。
+        end_ym (str): 結束年月 (YYYYMM，含)。
+        member_ids (Optional[Iterable[str]]): 要匯出的成員 ID；None 或空時匯出所有成員。
+        allow_partial (bool): 為 True 時略過行事曆擷取失敗的成員 (只記錄錯誤)；
+            為 False 時在送出其餘成員後拋出 PayrollExportIncomplete。
+        members (Optional[dict]): 同 `generate_reports_range`。
+        event_source (Optional[EventSource]): 同 `generate_reports_range`。
+
+    Raises:
+        ValueError: 年月格式不正確或成員 ID 不存在時。
+        RuntimeError: 無法載入成員或建立行事曆事件來源時。
+    """
+    run_info = {}
+    rows = classified_rows(start_ym, end_ym, member_ids, run_info=run_info, members=members, event_source=event_source)
+
+    def generate():
+        started = time.perf_counter()
+        exported = 0
+        try:
+            for _, member_id, member_info, duties in rows:
+                REPORT_MEMBERS.labels('export').inc()
+                REPORT_SHIFTS.labels('export').inc(len(duties))
+                exported += len(duties)
+                yield [_export_row(member_id, member_info, duty) for duty in duties]
+                for key in ('calendar_dates', 'overlaps'): # 匯出不更新摘要，不必累積
+                    run_info.pop(key, None)
+        finally:
+            rows.close() # 用戶端中途斷線時取消尚未開始的行事曆擷取
+        REPORT_RUN_SECONDS.labels('export').observe(time.perf_counter() - started)
+        failures = run_info.get('failures', [])
+        logger.info(f"匯出 {start_ym}..{end_ym} 共 {exported} 列，{len(failures)} 筆擷取失敗")
+        if failures and not allow_partial:
+            raise PayrollExportIncomplete(failures)
+    return generate()
+
+
+def encode_rows(batches: Iterable[list[dict]], export_format: str, header: bool = True) -> Iterator[str]:
+    """把匯出列編碼為 CSV 或 JSONL 文字，累積到 FLUSH_BYTES 或每批結束時產生一段。
+
+    Args:
+        batches (Iterable[list[dict]]): `export_rows` 的結果。
+        export_format (str): 'csv' 或 'jsonl'。
+        header (bool): CSV 是否輸出標題列。
+    """
+    buffer = io.StringIO()
+    if export_format == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator='\n')
+        if header:
+            writer.writeheader()
+        write = writer.writerow
+    elif export_format == 'jsonl':
+        def write(row: dict) -> None:
+            buffer.write(json.dumps(row, ensure_ascii=False))
+            buffer.write('\n')
+    else:
+        raise ValueError(f"不支援的匯出格式: {export_format}")
+
+    for batch in batches:
+        for row in batch:
+            write(row)
+            if buffer.tell() >= FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell(): # 沒有任何列時只有 CSV 標題列
+        yield buffer.getvalue()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="以 CSV 或 JSONL 串流匯出多位成員、多個月份分類後的加班班次 (供薪資系統匯入)")
+    parser.add_argument("--start-ym", required=True, help="起始年月 (YYYYMM)")
+    parser.add_argument("--end-ym", help="結束年月 (YYYYMM，含)；省略時與起始年月相同")
+    parser.add_argument("--members", help="以逗號分隔的成員 ID (例如 A,B)；省略時匯出所有成員")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default='csv')
+    parser.add_argument("--output", "-o", help="輸出檔案；省略時寫到標準輸出")
+    parser.add_argument("--allow-partial", action="store_true", help="略過行事曆擷取失敗的成員 (否則以結束碼 1 結束)")
+    parser.add_argument("--event-source", help="行事曆事件來源 (google、snapshot:<檔案>、fake:<網址>、synthetic)")
+    parser.add_argument("--synthetic-members", type=int, help="使用 N 位合成成員取代 members.json")
+    args = parser.parse_args(argv)
+    configure_logging()
+    if args.event_source:
+        os.environ[EVENT_SOURCE_ENV] = args.event_source
+    members = None
+    if args.synthetic_members:
+        from ..services.fake_calendar import synthetic_members # 測試用的假資料，只在命令列要求時匯入
+        members = synthetic_members(args.synthetic_members)
+    member_ids = args.members.split(',') if args.members else None
+
+    try:
+        batches = export_rows(args.start_ym, args.end_ym or args.start_ym, member_ids, args.allow_partial, members)
+    except (ValueError, RuntimeError) as e:
+        print(f"無法匯出: {e}", file=sys.stderr)
+        return 1
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for chunk in encode_rows(batches, args.format):
+            output.write(chunk)
+    except PayrollExportIncomplete as e:
+        print(str(e), file=sys.stderr)
+        if output is not sys.stdout:
+            output.close()
+            os.unlink(args.output) # 不留下不完整的檔案
+        return 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,38 +3,55 @@ import json
 import logging
 import time
 import argparse
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from typing import Optional
+from typing import Callable, Iterable, Optional
 
 # 使用相對路徑匯入服務
 from ..services.holiday_service import HolidayService
-from ..services.excel_service import ExcelService
+from ..services.holiday_store import WEEKDAYS
+from ..services.duty_store import DutyStore, expand_duties
+from ..services.event_sources import EventSource, EVENT_SOURCE_ENV, event_source_from_env, load_google_client
+from ..services.blob_store import shared_blob_store
+from ..services.logging_setup import configure_logging, sample_debug
+from ..services.profiling import profiled
+from ..services.metrics import (stage_timer, REPORT_RUN_SECONDS, REPORT_MEMBERS, CALENDAR_EVENTS,
+                                REPORT_SHIFTS, WORKBOOKS, MEMBER_FAILURES)
+from .shift_intervals import resolve_overlaps
+from .overtime_rates import RateTable, rate_table
 
 # 設定檔和金鑰的路徑 (相對於專案根目錄)
 script_dir = os.path.dirname(__file__)
 BASE_DIR = os.path.abspath(os.path.join(script_dir, '..', '..')) # 專案根目錄
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-MEMBERS_FILE = os.path.join(DATA_DIR, 'members.json')
-DUTIES_FILE = os.path.join(DATA_DIR, 'duties.json')
+DATA_DIR = os.environ.get('DATA_DIR', os.path.join(BASE_DIR, 'data')) # 與 API 相同，可用環境變數 DATA_DIR 指定
+MEMBERS_FILE = os.environ.get('MEMBERS_FILE', os.path.join(DATA_DIR, 'members.json')) # 可指向合成成員檔進行測試
+DUTIES_FILE = os.path.join(DATA_DIR, 'duties.json') # 舊版單一檔案，僅用於首次遷移
 SERVICE_ACCOUNT_FILE = os.path.join(DATA_DIR, 'service_account.json')
-SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
+RATE_RULES_FILE = os.environ.get('OVERTIME_RULES_FILE', os.path.join(DATA_DIR, 'overtime_rules.json')) # 不存在時使用預設規則
+# 同時擷取行事曆的成員數；總請求速率仍由 CalendarGovernor 限制在配額內
+FETCH_WORKERS = int(os.environ.get('CALENDAR_FETCH_WORKERS', '4'))
 
 # 確保輸出目錄存在
 OUTPUT_DIR = os.path.join(DATA_DIR, 'output')
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# 確認檔案路徑
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(funcName)s] - %(message)s')
+# 確認檔案路徑 (日誌由 configure_logging 集中設定)
 logger = logging.getLogger(__name__)
-logger.info(f"BASE_DIR: {BASE_DIR}")
-logger.info(f"DATA_DIR: {DATA_DIR}")
-logger.info(f"MEMBERS_FILE: {MEMBERS_FILE}")
-logger.info(f"DUTIES_FILE: {DUTIES_FILE}")
-logger.info(f"SERVICE_ACCOUNT_FILE: {SERVICE_ACCOUNT_FILE}")
-logger.info(f"OUTPUT_DIR: {OUTPUT_DIR}")
+logger.debug("BASE_DIR: %s, DATA_DIR: %s, MEMBERS_FILE: %s, DUTIES_FILE: %s, SERVICE_ACCOUNT_FILE: %s, OUTPUT_DIR: %s",
+             BASE_DIR, DATA_DIR, MEMBERS_FILE, DUTIES_FILE, SERVICE_ACCOUNT_FILE, OUTPUT_DIR)
+
+# openpyxl 與 Google API 用戶端的匯入合計約數百毫秒，延遲到第一次產生報表 (或 warm_up) 時才載入，
+# 讓 API 在冷啟動後能先服務假日、加班記錄與摘要等請求
+def _excel_service_class():
+    from ..services.excel_service import ExcelService
+    return ExcelService
+
+def warm_up() -> None:
+    """預先載入報表流程使用的重量級模組 (openpyxl、googleapiclient)。"""
+    _excel_service_class()
+    load_google_client()
 
 def load_members():
     """從 data/members.json 載入成員資料。"""
@@ -54,24 +71,9 @@ def load_members():
         logger.error(f"載入成員檔案時發生未預期錯誤: {e}", exc_info=True)
         return {}
 
-def get_credentials():
-    """使用 data/service_account.json 獲取憑證。"""
-    try:
-        if not os.path.exists(SERVICE_ACCOUNT_FILE):
-            logger.error(f"錯誤：找不到服務帳號金鑰檔案 {SERVICE_ACCOUNT_FILE}。")
-            raise FileNotFoundError(f"找不到 {SERVICE_ACCOUNT_FILE}")
-        
-        creds = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-        logger.info(f"成功從 {SERVICE_ACCOUNT_FILE} 載入服務帳號憑證。")
-        return creds
-    except Exception as e:
-        logger.error(f"從服務帳號檔案載入憑證時發生錯誤: {e}", exc_info=True)
-        raise
-
 def _add_hours_to_time(date: str, time_str: str, hours: float) -> dict:
     """將小時數添加到日期時間。"""
-    logger.debug(f"Adding {hours} hours to {date} {time_str}")
+    sample_debug(logger, "Adding %s hours to %s %s", hours, date, time_str)
     try:
         datetime_obj = datetime.strptime(f"{date}{time_str}", "%Y%m%d%H%M")
         new_datetime = datetime_obj + timedelta(hours=hours)
@@ -97,60 +99,82 @@ def _calculate_hours_between(start_time: str, end_time: str) -> float:
         logger.error(f"Error in _calculate_hours_between for {start_time}-{end_time}: {e}", exc_info=True)
         return 0.0
 
-def _load_manual_duties(year_month: str, member_info: dict) -> list[dict]:
-    """從 data/duties.json 載入指定年月和成員的手動值班記錄。"""
+def _split_manual_duty(duty_entry: dict) -> list[dict]:
+    """將一筆個人手動值班記錄轉換為班次段；跨日的記錄在午夜切成兩段。
+
+    Raises:
+        ValueError: dateTime 或 hours 格式錯誤時。
+        KeyError: 缺少 dateTime 或 hours 時。
+    """
+    date_str = duty_entry['dateTime'][:8]
+    start_time_str = duty_entry['dateTime'][8:]
+    hours = float(duty_entry['hours'])
+    reason = duty_entry.get('reason', 'N/A')
+    datetime.strptime(start_time_str, "%H%M") # Validate format
+
+    end_time_info = _add_hours_to_time(date_str, start_time_str, hours)
+    end_date_str = end_time_info['date']
+    end_time_str = end_time_info['time']
+
+    base_manual_shift = {
+        "start": start_time_str,
+        "end": end_time_str,
+        "is_manual": True,
+        "reason": reason,
+        "original_hours": hours
+    }
+
+    if end_date_str == date_str:
+        manual_shift = base_manual_shift.copy()
+        manual_shift["date"] = date_str
+        sample_debug(logger, "Added non-crossing manual duty: %s", manual_shift)
+        return [manual_shift]
+
+    first_day_shift = base_manual_shift.copy()
+    first_day_shift["date"] = date_str
+    first_day_shift["end"] = "2400"
+    sample_debug(logger, "Added crossing manual duty (Part 1): %s", first_day_shift)
+
+    second_day_shift = base_manual_shift.copy()
+    second_day_shift["date"] = end_date_str
+    second_day_shift["start"] = "0000"
+    sample_debug(logger, "Added crossing manual duty (Part 2): %s", second_day_shift)
+    return [first_day_shift, second_day_shift]
+
+def _standard_shifts(start_date_str: str, holidays) -> list[dict]:
+    """由行事曆值班的開始日期產生標準班次 (預設假日 0800 起、平日 1600 起，到隔日 0800；見 overtime_rates)。"""
+    rates = current_rate_table()
+    next_day_str = (datetime.strptime(start_date_str, "%Y%m%d") + timedelta(days=1)).strftime("%Y%m%d")
+    start = rates.standard_start(holidays.is_holiday(start_date_str))
+    shifts = [{'date': start_date_str, 'start': start, 'end': "2400", 'is_manual': False, 'reason': "10"}]
+    if rates.standard_end != "0000":
+        shifts.append({'date': next_day_str, 'start': "0000", 'end': rates.standard_end, 'is_manual': False, 'reason': "10"})
+    return shifts
+
+def _load_manual_duties(year_month: str, member_info: dict, month_duties: Optional[list[dict]] = None) -> list[dict]:
+    """載入指定年月和成員的手動值班記錄。
+
+    Args:
+        year_month (str): 目標年月 (YYYYMM)。
+        member_info (dict): 成員資料 (需包含 'name')。
+        month_duties (Optional[list[dict]]): 已載入的該月份分區記錄 (含週期規則展開結果)；
+            為 None 時從 DutyStore 讀取該月份分區並展開週期規則。
+    """
     logger.info(f"Loading manual duties for {year_month} and member {member_info['name']}")
     manual_duties = []
-    if not os.path.exists(DUTIES_FILE):
-        logger.warning(f"Manual duties file not found: {DUTIES_FILE}. Skipping manual duties.")
-        return []
 
     try:
-        with open(DUTIES_FILE, 'r', encoding='utf-8') as f:
-            all_manual_duties_data = json.load(f)
-        logger.debug(f"Loaded {len(all_manual_duties_data)} raw duties from {DUTIES_FILE}")
-
-        for duty_entry in all_manual_duties_data:
-            if duty_entry.get('dateTime', '').startswith(year_month) and duty_entry.get('person') == member_info['name']:
+        if month_duties is None:
+            holidays = HolidayService(holiday_file=os.path.join(DATA_DIR, 'holiday_2026.json')).snapshot()
+            month_duties = DutyStore(DATA_DIR, legacy_file=DUTIES_FILE).load_month_with_rules(year_month, holidays)
+        all_manual_duties_data = month_duties
+        logger.debug("Loaded %d raw duties for %s", len(all_manual_duties_data), year_month)
+
+        # 群組記錄只針對此成員延遲展開 (套用個人例外)
+        for duty_entry in expand_duties(all_manual_duties_data, person=member_info['name']):
+            if duty_entry.get('dateTime', '').startswith(year_month):
                 try:
-                    date_str = duty_entry['dateTime'][:8]
-                    start_time_str = duty_entry['dateTime'][8:]
-                    hours = float(duty_entry['hours'])
-                    reason = duty_entry.get('reason', 'N/A')
-                    datetime.strptime(start_time_str, "%H%M") # Validate format
-
-                    end_time_info = _add_hours_to_time(date_str, start_time_str, hours)
-                    end_date_str = end_time_info['date']
-                    end_time_str = end_time_info['time']
-
-                    base_manual_shift = {
-                        "start": start_time_str,
-                        "end": end_time_str,
-                        "is_manual": True,
-                        "reason": reason,
-                        "original_hours": hours
-                    }
-
-                    if end_date_str == date_str:
-                        manual_shift = base_manual_shift.copy()
-                        manual_shift["date"] = date_str
-                        manual_duties.append(manual_shift)
-                        logger.debug(f"Added non-crossing manual duty: {manual_shift}")
-                    else:
-                        first_day_end = "2400"
-                        first_day_shift = base_manual_shift.copy()
-                        first_day_shift["date"] = date_str
-                        first_day_shift["end"] = first_day_end
-                        manual_duties.append(first_day_shift)
-                        logger.debug(f"Added crossing manual duty (Part 1): {first_day_shift}")
-
-                        second_day_start = "0000"
-                        second_day_shift = base_manual_shift.copy()
-                        second_day_shift["date"] = end_date_str
-                        second_day_shift["start"] = second_day_start
-                        manual_duties.append(second_day_shift)
-                        logger.debug(f"Added crossing manual duty (Part 2): {second_day_shift}")
-
+                    manual_duties.extend(_split_manual_duty(duty_entry))
                 except ValueError as ve:
                     logger.warning(f"Skipping manual duty due to invalid format in dateTime ({duty_entry.get('dateTime')}) or hours ({duty_entry.get('hours')}): {ve} - Entry: {duty_entry}")
                 except KeyError as ke:
@@ -158,21 +182,30 @@ def _load_manual_duties(year_month: str, member_info: dict) -> list[dict]:
                 except Exception as e:
                     logger.error(f"Error processing manual duty entry {duty_entry}: {e}", exc_info=True)
 
-    except FileNotFoundError:
-        logger.warning(f"Manual duties file not found: {DUTIES_FILE}")
     except json.JSONDecodeError:
-        logger.error(f"Error decoding JSON from manual duties file: {DUTIES_FILE}")
+        logger.error(f"Error decoding JSON from manual duties partition: {year_month}")
     except Exception as e:
-        logger.error(f"Error loading or processing manual duties from {DUTIES_FILE}: {e}", exc_info=True)
+        logger.error(f"Error loading or processing manual duties for {year_month}: {e}", exc_info=True)
 
     logger.info(f"Loaded {len(manual_duties)} manual duty segments for {year_month} and member {member_info['name']}")
     return manual_duties
 
-def _calculate_shift_hours(holiday_service: HolidayService, date_str: str, start_time: str, end_time: str) -> list[float]:
-    """根據日期、時間和假日資訊計算工時分類。"""
+def current_rate_table() -> RateTable:
+    """目前的加班費率規則 (RATE_RULES_FILE 修改後自動重新編譯)。"""
+    return rate_table(RATE_RULES_FILE)
+
+def _calculate_shift_hours(holiday_service, date_str: str, start_time: str, end_time: str,
+                          tier_offset: int = 0) -> list[float]:
+    """根據日期、時間和假日資訊計算工時分類 (E–I 的分配由 `current_rate_table` 決定)。
+
+    `holiday_service` 可以是 HolidayService 或 HolidaySnapshot (兩者皆提供 is_holiday/is_special_day)。
+    tier_offset 為被裁切班次段之前片段的分鐘數 (見 `shift_intervals.resolve_overlaps`)：
+    以累計時數的半小時進位查表後相減，同一班次段各片段的合計與未分段時相同。
+    """
     is_holiday = holiday_service.is_holiday(date_str)
     is_special = holiday_service.is_special_day(date_str)
-    logger.debug(f"Calculating work hours - date: {date_str}, start: {start_time}, end: {end_time}, is_holiday/special: {is_holiday or is_special}")
+    sample_debug(logger, "Calculating work hours - date: %s, start: %s, end: %s, is_holiday/special: %s",
+                 date_str, start_time, end_time, is_holiday or is_special)
     
     try:
         start = datetime.strptime(f"{date_str}{start_time}", "%Y%m%d%H%M")
@@ -191,21 +224,14 @@ def _calculate_shift_hours(holiday_service: HolidayService, date_str: str, start
              end += timedelta(days=1)
 
         total_hours = (end - start).total_seconds() / 3600
-        total_hours = round(total_hours * 2) / 2
-        logger.debug(f"Calculated total hours: {total_hours}")
-        
-        if is_holiday or is_special:
-            hours_h = min(8, total_hours)
-            hours_i = max(0, total_hours - 8)
-            result = [0.0, 0.0, 0.0, hours_h, hours_i]
-        else:
-            hours_e = min(2, total_hours)
-            hours_f = min(2, max(0, total_hours - 2))
-            hours_g = max(0, total_hours - 4)
-            result = [hours_e, hours_f, hours_g, 0.0, 0.0]
-        
-        result = [round(float(x) * 2) / 2 for x in result]
-        logger.debug(f"Calculated work hours result: {result}")
+        offset_hours = round(tier_offset / 60 * 2) / 2
+        total_hours = round((tier_offset / 60 + total_hours) * 2) / 2 - offset_hours
+        sample_debug(logger, "Calculated total hours: %s (tier offset %s)", total_hours, offset_hours)
+
+        # 依日期類型與 (四捨五入到半小時的) 分鐘數查表，規則見 overtime_rates
+        result = current_rate_table().classify(RateTable.day_type(is_holiday, is_special), round(total_hours * 60),
+                                                round(offset_hours * 60))
+        sample_debug(logger, "Calculated work hours result: %s", result)
         return result
     except ValueError as ve:
         logger.error(f"Error parsing date/time in _calculate_shift_hours for {date_str} {start_time}-{end_time}: {ve}", exc_info=True)
@@ -214,77 +240,240 @@ def _calculate_shift_hours(holiday_service: HolidayService, date_str: str, start
         logger.error(f"Error in _calculate_shift_hours for {date_str} {start_time}-{end_time}: {str(e)}", exc_info=True)
         return [0.0] * 5
 
-def get_events_in_range(service, calendar_id, time_min_iso, time_max_iso, member_name):
-    """同步獲取指定日曆和日期範圍內的事件。"""
-    try:
-        logger.info(f"正在為 [{member_name}] ({calendar_id}) 獲取 {time_min_iso} 到 {time_max_iso} 的事件...")
-        events_result = service.events().list(
-            calendarId=calendar_id, timeMin=time_min_iso, timeMax=time_max_iso,
-            singleEvents=True, orderBy='startTime'
-        ).execute()
-        events = events_result.get('items', [])
-        logger.info(f"成功為 [{member_name}] 在指定範圍內獲取 {len(events)} 個事件。")
-        return events
-    except HttpError as error:
-        logger.error(f"為 [{member_name}] ({calendar_id}) 獲取事件時發生 HttpError ({error.resp.status}): {error.content.decode() if error.content else 'No content'}")
-        if error.resp.status == 404:
-            logger.warning(f"[{member_name}] - 日曆 ID 可能無效或無權限訪問: {calendar_id}")
-        elif error.resp.status == 403:
-             logger.warning(f"[{member_name}] - 權限不足 (Forbidden)，請檢查服務帳號是否已共享日曆並具有讀取權限: {calendar_id}")
-        return []
-    except Exception as e:
-        logger.error(f"為 [{member_name}] ({calendar_id}) 獲取事件時發生未預期錯誤: {e}", exc_info=True)
-        return []
+def month_query_range(year_month: str) -> tuple[str, str]:
+    """返回查詢 Google Calendar 用的 (timeMin, timeMax) ISO 字串。
 
-def generate_reports(year_month: str, target_member_id: Optional[str] = None):
-    """產生指定年月和成員 (可選) 的值班報表。
+    timeMax 延伸到下個月 1 日 09:00，讓月底最後一天開始的值班也能被取得。
+
+    Raises:
+        ValueError: 年月格式不正確時。
+    """
+    year = int(year_month[:4])
+    month = int(year_month[4:])
+    start_of_month = datetime(year, month, 1)
+    next_month = month + 1
+    next_year = year
+    if next_month > 12:
+        next_month = 1
+        next_year += 1
+    next_month_first_day = datetime(next_year, next_month, 1)
+
+    time_min_iso = start_of_month.isoformat() + 'Z'
+    time_max_dt_for_query = next_month_first_day + timedelta(hours=9)
+    time_max_iso = time_max_dt_for_query.isoformat() + 'Z'
+    return time_min_iso, time_max_iso
+
+def combine_member_shifts(calendar_starts: Iterable[str], manual_duties: list[dict], holidays,
+                          precedence: Optional[str] = None) -> tuple[dict, list[dict]]:
+    """由行事曆值班開始日期產生標準班次，與手動班次段合併並處理重疊。
+
+    報表與 OvertimeAggregates 的摘要都經由此函數合併，兩者對重疊時段的處理一致。
 
     Args:
-        year_month (str): 目標年月 (YYYYMM)。
-        target_member_id (Optional[str]): 目標成員 ID。如果為 None，則處理所有成員。
+        calendar_starts (Iterable[str]): 行事曆值班開始日期 (YYYYMMDD)。
+        manual_duties (list[dict]): `_split_manual_duty` 產生的手動班次段。
+        holidays: HolidaySnapshot。
+        precedence (Optional[str]): 重疊時的優先順序，見 `shift_intervals.resolve_precedence`。
 
     Returns:
-        list[tuple[str, str]]: 包含成功產生的 (檔案路徑, 相對 URL) 的列表。
+        tuple[dict, list[dict]]: (日期 -> 不重疊的班次段列表, 重疊記錄列表)。
     """
-    generated_files = [] # 儲存成功產生的檔案路徑和 URL
-    try:
-        year = int(year_month[:4])
-        month = int(year_month[4:])
-        start_of_month = datetime(year, month, 1)
-        next_month = month + 1
-        next_year = year
-        if next_month > 12:
-            next_month = 1
-            next_year += 1
-        next_month_first_day = datetime(next_year, next_month, 1)
-
-        time_min_iso = start_of_month.isoformat() + 'Z'
-        time_max_dt_for_query = next_month_first_day + timedelta(hours=9)
-        time_max_iso = time_max_dt_for_query.isoformat() + 'Z'
+    segments = []
+    for start_date_str in calendar_starts:
+        segments.extend(_standard_shifts(start_date_str, holidays))
+    segments.extend(manual_duties)
 
-    except ValueError:
-        logger.error(f"錯誤：年月格式不正確 ({year_month})，請使用 YYYYMM 格式。")
-        return []
+    resolved, overlaps = resolve_overlaps(segments, precedence)
+    combined_shifts_by_date = {}
+    for shift in resolved:
+        combined_shifts_by_date.setdefault(shift['date'], []).append(shift)
+    return combined_shifts_by_date, overlaps
+
+def merge_member_shifts(year_month: str, google_events: list[dict], manual_duties: list[dict], holidays,
+                        precedence: Optional[str] = None, overlaps: Optional[list] = None) -> tuple[dict, set]:
+    """合併階段：將行事曆事件轉換為標準班次，並與手動班次段合併為不重疊的班次段。
+
+    同一天開始的多個行事曆事件只產生一組標準班次；行事曆班次與手動班次 (或手動班次之間)
+    的重疊時段依 precedence 只保留一份，不會重複計算工時。
+
+    Args:
+        year_month (str): 目標年月 (YYYYMM)，只處理在該月開始的事件。
+        google_events (list[dict]): Google Calendar 事件。
+        manual_duties (list[dict]): `_load_manual_duties` 產生的手動班次段。
+        holidays: HolidaySnapshot。
+        precedence (Optional[str]): 重疊時的優先順序 (calendar | manual | flag)；
+            None 時使用環境變數 SHIFT_OVERLAP_PRECEDENCE (預設 calendar)。
+        overlaps (Optional[list]): 若提供，附加本成員的重疊記錄。
+
+    Returns:
+        tuple[dict, set]: (日期 -> 班次段列表, 行事曆值班開始日期集合)。
+    """
+    processed_calendar_duty_starts = set()
+
+    # --- 處理 Google Events，取得行事曆值班開始日期 ---
+    for event in google_events:
+        start_date_str = None
+        try:
+            start_info = event.get('start', {})
+            if 'dateTime' in start_info:
+                start_date_time_obj = datetime.fromisoformat(start_info['dateTime'])
+                start_date_str = start_date_time_obj.strftime('%Y%m%d')
+            elif 'date' in start_info:
+                start_date_str = start_info['date'].replace('-', '')
+            else:
+                logger.warning(f"事件缺少有效的 start date/dateTime: {event.get('summary', 'No Summary')}")
+                continue
+
+            if not start_date_str.startswith(year_month):
+                 sample_debug(logger, "Skipping event starting outside target month %s: %s - %s",
+                              year_month, start_date_str, event.get('summary', 'No Summary'))
+                 continue
+
+            if start_date_str in processed_calendar_duty_starts:
+                sample_debug(logger, "Skipping duplicate standard duty trigger for date %s: %s",
+                             start_date_str, event.get('summary', 'No Summary'))
+                continue
+            processed_calendar_duty_starts.add(start_date_str)
+
+        except Exception as e:
+             logger.error(f"處理事件時發生錯誤 ({event.get('summary', 'No Summary')} on {start_date_str}): {e}", exc_info=True)
+
+    # --- 與手動 Duties 合併並處理重疊 ---
+    combined_shifts_by_date, member_overlaps = combine_member_shifts(
+        sorted(processed_calendar_duty_starts), manual_duties, holidays, precedence)
+    if member_overlaps:
+        logger.info(f"{year_month} 有 {len(member_overlaps)} 段重疊的班次 (共 {sum(o['minutes'] for o in member_overlaps)} 分鐘)")
+    if overlaps is not None:
+        overlaps.extend(member_overlaps)
+
+    return combined_shifts_by_date, processed_calendar_duty_starts
+
+def classify_shifts(year_month: str, combined_shifts_by_date: dict, holidays) -> list[dict]:
+    """分類階段：計算每個班次段的 E–I 工時，返回依日期與開始時間排序的報表列。
+
+    Args:
+        year_month (str): 目標年月 (YYYYMM)，月份以外的班次段 (例如跨月的次日部分) 不計入。
+        combined_shifts_by_date (dict): `merge_member_shifts` 的日期 -> 班次段列表 (彼此不重疊)。
+        holidays: HolidaySnapshot。
+
+    Returns:
+        list[dict]: 每列含 date, weekday, start, end, work_hours ([E, F, G, H, I]), reason, is_manual。
+    """
+    duties_for_excel = []
+    for date_key, shifts_on_date in combined_shifts_by_date.items():
+        if not date_key.startswith(year_month):
+            sample_debug(logger, "Skipping shifts for date %s as it's outside target month %s.", date_key, year_month)
+            continue
+
+        for shift in shifts_on_date:
+            try:
+                shift_date = shift['date']
+                shift_start = shift['start']
+                shift_end = shift['end']
+
+                duty = {
+                    'date': shift_date,
+                    'weekday': WEEKDAYS[datetime.strptime(shift_date, "%Y%m%d").weekday()],
+                    'start': shift_start,
+                    'end': shift_end,
+                    'work_hours': _calculate_shift_hours(holidays, shift_date, shift_start, shift_end,
+                                                         shift.get('tier_offset', 0)),
+                    'reason': shift.get('reason', 'N/A'),
+                    'is_manual': shift.get('is_manual', False)
+                }
+                duties_for_excel.append(duty)
+                sample_debug(logger, "Prepared duty for Excel: %s", duty)
+
+            except KeyError as ke:
+                 logger.warning(f"Skipping shift due to missing key {ke} during final processing: {shift}.")
+            except Exception as e:
+                logger.error(f"Error processing combined shift {shift} for Excel: {e}", exc_info=True)
+
+    duties_for_excel.sort(key=lambda x: (x['date'], x['start']))
+    return duties_for_excel
+
+def summarize_rows(duties_for_excel: list[dict]) -> dict:
+    """加總報表列的工時：{"total_hours", "E", "F", "G", "H", "I"}。"""
+    buckets = [0.0] * 5
+    for duty in duties_for_excel:
+        for index, value in enumerate(duty['work_hours']):
+            buckets[index] += value
+    return {"total_hours": sum(buckets), **dict(zip(("E", "F", "G", "H", "I"), buckets))}
+
+def month_range(start_ym: str, end_ym: str) -> list[str]:
+    """返回 start_ym..end_ym (含) 的所有年月 (YYYYMM)。
+
+    Raises:
+        ValueError: 年月格式不正確或 end_ym 早於 start_ym 時。
+    """
+    if not all(len(value) == 6 and value.isdigit() for value in (start_ym, end_ym)):
+        raise ValueError(f"年月格式不正確: {start_ym}..{end_ym}")
+    start = datetime.strptime(start_ym, "%Y%m")
+    end = datetime.strptime(end_ym, "%Y%m")
+    if end < start:
+        raise ValueError(f"結束年月 {end_ym} 早於起始年月 {start_ym}")
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(f"{year:04d}{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def partition_events_by_month(google_events: list[dict]) -> dict[str, list[dict]]:
+    """依事件開始日期將一次範圍查詢的結果分到各月份 (YYYYMM)；缺少開始時間的事件會被略過。"""
+    by_month = {}
+    for event in google_events:
+        start_info = event.get('start', {})
+        try:
+            if 'dateTime' in start_info:
+                start_date_str = datetime.fromisoformat(start_info['dateTime']).strftime('%Y%m%d')
+            elif 'date' in start_info:
+                start_date_str = start_info['date'].replace('-', '')
+            else:
+                logger.warning(f"事件缺少有效的 start date/dateTime: {event.get('summary', 'No Summary')}")
+                continue
+        except ValueError as e:
+            logger.error(f"無法解析事件開始時間 ({event.get('summary', 'No Summary')}): {e}")
+            continue
+        by_month.setdefault(start_date_str[:6], []).append(event)
+    return by_month
+
+def _prepare_run(year_months: list[str], target_member_id: Optional[str], run_info: Optional[dict],
+                 members: Optional[dict] = None, event_source: Optional[EventSource] = None) -> Optional[dict]:
+    """準備一次報表執行所需的共用資料 (假日快照、成員、各月份手動記錄、事件來源)。
+
+    多個月份共用同一份假日快照與成員資料，只初始化一次。
+
+    Args:
+        members (Optional[dict]): 成員 ID -> 成員資料；None 時從 MEMBERS_FILE 載入。
+        event_source (Optional[EventSource]): 行事曆事件來源；None 時依 CALENDAR_EVENT_SOURCE 建立。
+
+    Returns:
+        Optional[dict]: 執行內容；發生無法繼續的錯誤時返回 None。
+    """
+    period = year_months[0] if len(year_months) == 1 else f"{year_months[0]}..{year_months[-1]}"
 
     # --- 初始化服務 ---
     try:
         # 明確傳遞絕對路徑以避免歧義
         holiday_service = HolidayService(holiday_file=os.path.join(DATA_DIR, 'holiday_2026.json'))
-        excel_service = ExcelService(
-            template_path=os.path.join(DATA_DIR, 'VSduty_template.xlsx'),
-            output_dir=OUTPUT_DIR # 使用全局定義的 OUTPUT_DIR
-        )
+        duty_store = DutyStore(DATA_DIR, legacy_file=DUTIES_FILE)
         logger.info(f"服務初始化完成，使用假日檔案: {os.path.join(DATA_DIR, 'holiday_2026.json')}")
-        logger.info(f"服務初始化完成，使用模板檔案: {os.path.join(DATA_DIR, 'VSduty_template.xlsx')}")
-        logger.info(f"服務初始化完成，使用輸出目錄: {OUTPUT_DIR}")
     except Exception as e:
         logger.critical(f"初始化服務時發生錯誤: {e}", exc_info=True)
-        return []
+        return None
+
+    # 固定使用同一版本的假日快照，避免產生途中假日被修改造成前後不一致
+    holidays = holiday_service.snapshot()
+    logger.info(f"本次報表使用假日資料版本: v{holidays.version}")
+    if run_info is not None:
+        run_info['holiday_version'] = holidays.version
+        run_info['rates_version'] = current_rate_table().version
 
     # --- 載入和過濾成員 ---
-    all_members = load_members()
+    all_members = members if members is not None else load_members()
     if not all_members:
-        return []
+        return None
     logger.info(f"載入 {len(all_members)} 位成員設定: {list(all_members.keys())}") # 新增日誌
 
     members_to_fetch = {}
@@ -292,202 +481,436 @@ def generate_reports(year_month: str, target_member_id: Optional[str] = None):
         member_id_upper = target_member_id.upper()
         if member_id_upper in all_members:
             members_to_fetch = {member_id_upper: all_members[member_id_upper]}
-            logger.info(f"準備為成員 ID [{member_id_upper}] 處理 {year_month}...")
+            logger.info(f"準備為成員 ID [{member_id_upper}] 處理 {period}...")
         else:
             logger.error(f"錯誤：在 {MEMBERS_FILE} 中找不到指定的成員 ID [{member_id_upper}]。可用 ID: {list(all_members.keys())}")
-            return []
+            return None
     else:
         members_to_fetch = all_members
-        logger.info(f"準備處理所有成員在 {year_month} 的資料...")
-    
+        logger.info(f"準備處理所有成員在 {period} 的資料...")
+
     if not members_to_fetch:
         logger.warning("沒有需要處理的成員。")
-        return []
-
-    # --- 建立 Google Calendar 服務 ---
+        return None
+
+    # --- 載入各月份手動 Duty (每個月份只讀取單一分區，並展開該月份的週期規則) ---
+    month_duties = {}
+    for year_month in year_months:
+        try:
+            with stage_timer('duty_load'):
+                month_duties[year_month] = duty_store.load_month_with_rules(year_month, holidays)
+            logger.info(f"從分區 {year_month} 載入 {len(month_duties[year_month])} 筆手動值班記錄 (含週期規則)。")
+        except Exception as e:
+            logger.error(f"載入 {year_month} 手動值班記錄時發生錯誤: {e}", exc_info=True)
+            month_duties[year_month] = []
+
+    # --- 建立行事曆事件來源 ---
     try:
-        creds = get_credentials()
-        google_service = build('calendar', 'v3', credentials=creds)
-        logger.info("Google Calendar API 服務建立成功 (使用服務帳號)。")
+        with stage_timer('client_setup'):
+            if event_source is None:
+                event_source = event_source_from_env(SERVICE_ACCOUNT_FILE)
+            event_source.prepare()
     except Exception as e:
-        logger.error(f"建立 Google Calendar 服務時發生錯誤: {e}", exc_info=True)
-        return []
+        logger.error(f"建立行事曆事件來源時發生錯誤: {e}", exc_info=True)
+        return None
+
+    return {
+        "year_months": year_months,
+        "holidays": holidays,
+        "members": members_to_fetch,
+        "month_duties": month_duties,
+        "event_source": event_source,
+        "failures": [],
+    }
+
+class ReportCancelled(Exception):
+    """進度回呼要求停止產生報表 (例如串流進度的用戶端已斷線)。"""
+
+ProgressCallback = Callable[[dict], None]
+
+def _emit(progress: Optional[ProgressCallback], event: str, **fields) -> None:
+    """送出進度事件 {"event": ..., 其他欄位}；回呼拋出 ReportCancelled 時中止報表產生。"""
+    if progress is not None:
+        progress({"event": event, **fields})
+
+def _fetch_member_events(event_source: EventSource, calendar_id: str, time_min: str, time_max: str,
+                         member_name: str) -> tuple[Optional[list[dict]], Optional[Exception], float]:
+    """在擷取執行緒中查詢一位成員的事件，返回 (事件列表, 錯誤, 耗時毫秒)；失敗時事件列表為 None。"""
+    started = time.perf_counter()
+    try:
+        with stage_timer('calendar_fetch'):
+            events = event_source.list_events(calendar_id, time_min, time_max, member_name)
+        return events, None, round((time.perf_counter() - started) * 1000, 1)
+    except Exception as e: # CalendarFetchError 以外的錯誤也只讓該成員失敗
+        return None, e, round((time.perf_counter() - started) * 1000, 1)
 
-    # --- 開始處理和計時 ---
-    start_process_time = time.time()
-    total_members_processed = 0
-    total_excel_generated = 0
-    
-    logger.info(f"開始順序處理 {len(members_to_fetch)} 個成員...")
+def _prefetch_member_events(run: dict, members: list[tuple[str, dict]], time_min: str, time_max: str):
+    """以最多 FETCH_WORKERS 個執行緒預先擷取後面成員的事件，依成員順序產生 (成員 ID, 成員資料, 擷取結果)。
 
-    # --- 主迴圈：處理每個成員 ---
-    for member_id, member_info in members_to_fetch.items():
-        member_name = member_info.get('name', '未知姓名')
-        calendar_id = member_info.get('calendar_id')
-        
-        if not calendar_id:
-            logger.warning(f"成員 {member_name} ({member_id}) 缺少 calendar_id，已跳過。")
+    工作執行緒在複製的 contextvars 中執行，擷取耗時仍計入目前請求的 Server-Timing (與效能分析，見 `profiled`)。
+    產生器提前關閉 (例如 ReportCancelled) 時取消尚未開始的擷取。
+    """
+    workers = max(1, min(FETCH_WORKERS, len(members)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='calendar-fetch')
+    pending = deque()
+    remaining = iter(members)
+
+    def submit_next() -> None:
+        item = next(remaining, None)
+        if item is not None:
+            member_id, member_info = item
+            context = contextvars.copy_context()
+            pending.append((member_id, member_info, executor.submit(
+                context.run, profiled(_fetch_member_events), run['event_source'], member_info['calendar_id'],
+                time_min, time_max, member_info.get('name', '未知姓名'))))
+
+    try:
+        for _ in range(workers):
+            submit_next()
+        while pending:
+            member_id, member_info, future = pending.popleft()
+            submit_next()
+            yield member_id, member_info, future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _record_fetch_failure(run: dict, run_info: Optional[dict], progress: Optional[ProgressCallback],
+                          member_id: str, member_name: str, error: Exception, ms: float) -> None:
+    """記錄成員的行事曆擷取失敗：每個月份送出一次 "failed" 事件，並寫入 run_info['failures']。"""
+    for year_month in run['year_months']:
+        failure = {"year_month": year_month, "member_id": member_id, "name": member_name, "stage": 'fetch',
+                   "error": str(error), "status": getattr(error, 'status', None)}
+        run['failures'].append(failure)
+        if run_info is not None:
+            run_info.setdefault('failures', []).append(failure)
+        MEMBER_FAILURES.labels('fetch').inc()
+        _emit(progress, 'failed', **failure, ms=ms)
+
+def _iter_member_rows(run: dict, run_info: Optional[dict], progress: Optional[ProgressCallback] = None):
+    """依序對每位成員執行 擷取 → 合併 → 分類，產生 (年月, 成員 ID, 成員資料, 報表列)。
+
+    每位成員只對整個範圍查詢一次 Google Calendar，再依事件開始日期分到各月份；
+    後面成員的查詢在背景預先進行 (見 `_prefetch_member_events`)。
+    擷取後送出 "fetched"、分類後送出 "classified" 進度事件 (見 `generate_reports_range`)。
+    擷取失敗的成員不產生報表 (避免產生缺少標準班次的報表)，改為送出 "failed" 並記錄到 run['failures']。
+    """
+    year_months = run['year_months']
+    time_min_iso = month_query_range(year_months[0])[0]
+    time_max_iso = month_query_range(year_months[-1])[1]
+    holidays = run['holidays']
+
+    members = []
+    for member_id, member_info in run['members'].items():
+        if not member_info.get('calendar_id'):
+            logger.warning(f"成員 {member_info.get('name', '未知姓名')} ({member_id}) 缺少 calendar_id，已跳過。")
             continue
+        members.append((member_id, member_info))
 
+    for member_id, member_info, (google_events, error, fetch_ms) in _prefetch_member_events(
+            run, members, time_min_iso, time_max_iso):
+        member_name = member_info.get('name', '未知姓名')
         logger.info(f"--- 開始處理成員: {member_name} ({member_id}) ---")
-        
-        # 1. 獲取 Google Calendar 事件
-        google_events = get_events_in_range(google_service, calendar_id, time_min_iso, time_max_iso, member_name)
-        logger.info(f"成員 [{member_name}] 從 Google Calendar 獲取到 {len(google_events) if google_events else 0} 個事件。") # 新增日誌
-        
-        if google_events is None: # 理論上 get_events_in_range 不會回 None，而是 []
-             logger.error(f"獲取成員 [{member_name}] 的事件時返回 None，跳過處理。")
-             continue
 
-        # 2. 載入該成員的手動 Duty
-        manual_duties = _load_manual_duties(year_month, member_info)
-        logger.info(f"成員 [{member_name}] 從 duties.json 載入 {len(manual_duties)} 個手動班次段。") # 新增日誌
+        # 1. 擷取：整個範圍的 Google Calendar 事件 (單次查詢)
+        if error is not None:
+            logger.error(f"成員 [{member_name}] 的行事曆事件擷取失敗，不產生報表: {error}")
+            _record_fetch_failure(run, run_info, progress, member_id, member_name, error, fetch_ms)
+            continue
+        _emit(progress, 'fetched', member_id=member_id, name=member_name, events=len(google_events), ms=fetch_ms)
+        logger.info(f"成員 [{member_name}] 從 Google Calendar 獲取到 {len(google_events)} 個事件。") # 新增日誌
+        CALENDAR_EVENTS.inc(len(google_events))
+        events_by_month = partition_events_by_month(google_events)
+
+        for year_month in year_months:
+            # 2. 合併 (含篩選該成員該月份的手動 Duty)
+            classify_started = time.perf_counter()
+            with stage_timer('merge'):
+                manual_duties = _load_manual_duties(year_month, member_info, run['month_duties'][year_month])
+                logger.info(f"成員 [{member_name}] 從 duties 分區 {year_month} 載入 {len(manual_duties)} 個手動班次段。") # 新增日誌
+                overlaps = []
+                combined_shifts_by_date, calendar_starts = merge_member_shifts(
+                    year_month, events_by_month.get(year_month, []), manual_duties, holidays, overlaps=overlaps)
+            if run_info is not None:
+                # 記錄行事曆值班日期，供 OvertimeAggregates 在不呼叫 Calendar API 的情況下計算摘要
+                run_info.setdefault('calendar_dates', {}).setdefault(year_month, {})[member_name] = sorted(calendar_starts)
+                if overlaps:
+                    run_info.setdefault('overlaps', {}).setdefault(year_month, {})[member_name] = overlaps
+
+            # 3. 分類
+            with stage_timer('classify'):
+                duties_for_excel = classify_shifts(year_month, combined_shifts_by_date, holidays)
+            logger.info(f"成員 [{member_name}] {year_month} 準備寫入 Excel 的總記錄數: {len(duties_for_excel)}") # 新增日誌
+            _emit(progress, 'classified', year_month=year_month, member_id=member_id, name=member_name,
+                  rows=len(duties_for_excel), ms=round((time.perf_counter() - classify_started) * 1000, 1))
+
+            yield year_month, member_id, member_info, duties_for_excel
+        logger.info(f"--- 完成處理成員: {member_name} ({member_id}) ---")
 
-        # 3. 合併處理 Google Events 和 Manual Duties
-        combined_shifts_by_date = {} 
-        processed_calendar_duty_starts = set()
+def preview_reports(year_month: str, target_member_id: Optional[str] = None, run_info: Optional[dict] = None,
+                    members: Optional[dict] = None, event_source: Optional[EventSource] = None) -> list[dict]:
+    """執行 擷取 → 合併 → 分類，但不載入模板、不產生 Excel，直接返回每位成員的報表列。
 
-        # --- 3a. 處理 Google Events 轉換為標準班次 ---
-        for event in google_events:
-            try:
-                start_info = event.get('start', {})
-                start_date_str = None
-                if 'dateTime' in start_info:
-                    start_date_time_obj = datetime.fromisoformat(start_info['dateTime'])
-                    start_date_str = start_date_time_obj.strftime('%Y%m%d')
-                elif 'date' in start_info:
-                    start_date_str = start_info['date'].replace('-', '')
-                else:
-                    logger.warning(f"事件缺少有效的 start date/dateTime: {event.get('summary', 'No Summary')}")
-                    continue
-
-                if not start_date_str.startswith(year_month):
-                     logger.debug(f"Skipping event starting outside target month {year_month}: {start_date_str} - {event.get('summary', 'No Summary')}")
-                     continue
-
-                if start_date_str in processed_calendar_duty_starts:
-                    logger.debug(f"Skipping duplicate standard duty trigger for date {start_date_str}: {event.get('summary', 'No Summary')}")
-                    continue
-                processed_calendar_duty_starts.add(start_date_str)
-
-                is_holiday = holiday_service.is_holiday(start_date_str)
-                standard_shifts = []
-                next_day_obj = datetime.strptime(start_date_str, "%Y%m%d") + timedelta(days=1)
-                next_day_str = next_day_obj.strftime("%Y%m%d")
-
-                if is_holiday:
-                    standard_shifts.append({'date': start_date_str, 'start': "0800", 'end': "2400", 'is_manual': False, 'reason': "10"})
-                    standard_shifts.append({'date': next_day_str, 'start': "0000", 'end': "0800", 'is_manual': False, 'reason': "10"})
-                else:
-                    standard_shifts.append({'date': start_date_str, 'start': "1600", 'end': "2400", 'is_manual': False, 'reason': "10"})
-                    standard_shifts.append({'date': next_day_str, 'start': "0000", 'end': "0800", 'is_manual': False, 'reason': "10"})
+    Args:
+        year_month (str): 目標年月 (YYYYMM)。
+        target_member_id (Optional[str]): 目標成員 ID。如果為 None，則處理所有成員。
+        run_info (Optional[dict]): 同 `generate_reports`。
+        members (Optional[dict]): 同 `generate_reports_range`。
+        event_source (Optional[EventSource]): 同 `generate_reports_range`。
 
-                for shift in standard_shifts:
-                    date_key = shift['date']
-                    if date_key not in combined_shifts_by_date:
-                        combined_shifts_by_date[date_key] = []
-                    combined_shifts_by_date[date_key].append(shift)
-                    logger.debug(f"Added standard shift from calendar event: {shift}")
+    Returns:
+        list[dict]: 每位成員 {"member_id", "name", "employee_id", "totals", "rows", "overlaps"}；
+            overlaps 為合併時被裁切 (或僅標記) 的重疊時段。行事曆擷取失敗的成員不在列表中，
+            而是記錄在 run_info['failures']。
 
-            except Exception as e:
-                 logger.error(f"處理事件時發生錯誤 ({event.get('summary', 'No Summary')} on {start_date_str}): {e}", exc_info=True)
-
-        # --- 3b. 合併手動 Duties ---
-        for manual_shift in manual_duties:
-             date_key = manual_shift['date']
-             if date_key not in combined_shifts_by_date:
-                 combined_shifts_by_date[date_key] = []
-             combined_shifts_by_date[date_key].append(manual_shift)
-             logger.debug(f"Added manual shift: {manual_shift}")
-
-        # 4. 計算所有班次的工時並格式化為 Excel Duty 列表
-        duties_for_excel = []
-        for date_key, shifts_on_date in combined_shifts_by_date.items():
-            if not date_key.startswith(year_month):
-                logger.debug(f"Skipping shifts for date {date_key} as it's outside target month {year_month}.")
-                continue
+    Raises:
+        ValueError: 年月格式不正確時。
+    """
+    year_months = month_range(year_month, year_month)
+    if run_info is None:
+        run_info = {} # 重疊記錄經由 run_info 傳回
+    with REPORT_RUN_SECONDS.labels('preview').time():
+        run = _prepare_run(year_months, target_member_id, run_info, members, event_source)
+        if run is None:
+            return []
 
-            for shift in shifts_on_date:
-                try:
-                    shift_date = shift['date']
-                    shift_start = shift['start']
-                    shift_end = shift['end']
-                    is_manual = shift.get('is_manual', False)
-                    reason = shift.get('reason', 'N/A')
-
-                    weekday = holiday_service.get_weekday(shift_date)
-                    work_hours = _calculate_shift_hours(holiday_service, shift_date, shift_start, shift_end)
-
-                    duty = {
-                        'date': shift_date,
-                        'weekday': weekday,
-                        'start': shift_start,
-                        'end': shift_end,
-                        'work_hours': work_hours,
-                        'reason': reason,
-                        'is_manual': is_manual
-                    }
-                    duties_for_excel.append(duty)
-                    logger.debug(f"Prepared duty for Excel: {duty}")
+        previews = []
+        for _, member_id, member_info, duties_for_excel in _iter_member_rows(run, run_info):
+            REPORT_MEMBERS.labels('preview').inc()
+            REPORT_SHIFTS.labels('preview').inc(len(duties_for_excel))
+            previews.append({
+                "member_id": member_id,
+                "name": member_info.get('name'),
+                "employee_id": member_info.get('employee_id'),
+                "totals": summarize_rows(duties_for_excel),
+                "rows": duties_for_excel,
+                "overlaps": run_info.get('overlaps', {}).get(year_month, {}).get(member_info.get('name', '未知姓名'), []),
+            })
+    return previews
+
+def classified_rows(start_ym: str, end_ym: str, member_ids: Optional[Iterable[str]] = None,
+                    run_info: Optional[dict] = None, members: Optional[dict] = None,
+                    event_source: Optional[EventSource] = None):
+    """準備 start_ym..end_ym 的報表執行，返回逐一產生 (年月, 成員 ID, 成員資料, 報表列) 的迭代器。
+
+    與 `preview_reports` 相同的 擷取 → 合併 → 分類 流程，但不累積結果：每次只保留一位成員一個月份的報表列
+    (以及預先擷取中的少數成員事件)，適合串流匯出大量成員與月份。準備工作 (成員、假日、手動記錄、事件來源)
+    在返回前完成，錯誤會立即拋出而不是在迭代途中。
 
-                except KeyError as ke:
-                     logger.warning(f"Skipping shift due to missing key {ke} during final processing: {shift}.")
-                except Exception as e:
-                    logger.error(f"Error processing combined shift {shift} for Excel: {e}", exc_info=True)
+    Args:
+        start_ym (str): 起始年月 (YYYYMM)。
+        end_ym (str): 結束年月 (YYYYMM，含)。
+        member_ids (Optional[Iterable[str]]): 要處理的成員 ID；None 或空時處理所有成員。
+        run_info (Optional[dict]): 同 `generate_reports_range` (行事曆擷取失敗記錄在 'failures')。
+        members (Optional[dict]): 同 `generate_reports_range`。
+        event_source (Optional[EventSource]): 同 `generate_reports_range`。
+
+    Raises:
+        ValueError: 年月格式不正確或成員 ID 不存在時。
+        RuntimeError: 無法載入成員或建立行事曆事件來源時。
+    """
+    year_months = month_range(start_ym, end_ym)
+    all_members = members if members is not None else load_members()
+    if not all_members:
+        raise RuntimeError(f"無法載入成員資料 ({MEMBERS_FILE})")
+    selected = all_members
+    wanted = [member_id.strip().upper() for member_id in member_ids or () if member_id.strip()]
+    if wanted:
+        unknown = [member_id for member_id in wanted if member_id not in all_members]
+        if unknown:
+            raise ValueError(f"找不到成員 ID: {', '.join(unknown)}")
+        selected = {member_id: all_members[member_id] for member_id in dict.fromkeys(wanted)}
+    run = _prepare_run(year_months, None, run_info, selected, event_source)
+    if run is None:
+        raise RuntimeError(f"無法準備 {start_ym}..{end_ym} 的報表執行")
+    return _iter_member_rows(run, run_info)
+
+def _store_workbook(file_path: str) -> Optional[str]:
+    """把活頁簿存入內容定址的檔案儲存區，返回檔名；失敗時只記錄錯誤並返回 None (報表仍可從輸出目錄下載)。"""
+    try:
+        return shared_blob_store(DATA_DIR).put_file(file_path)
+    except OSError as e:
+        logger.error(f"存入報表檔案儲存區失敗 ({file_path}): {e}", exc_info=True)
+        return None
 
-        logger.info(f"成員 [{member_name}] 準備寫入 Excel 的總記錄數: {len(duties_for_excel)}") # 新增日誌
+def generate_reports_range(start_ym: str, end_ym: str, target_member_id: Optional[str] = None, run_info: Optional[dict] = None,
+                           members: Optional[dict] = None, event_source: Optional[EventSource] = None,
+                           progress: Optional[ProgressCallback] = None, output_dir: Optional[str] = None):
+    """產生 start_ym..end_ym (含) 每個月份的值班報表。
 
-        # 5. 排序最終 Duty 列表
-        duties_for_excel.sort(key=lambda x: (x['date'], x['start']))
-        
-        # 6. 產生 Excel 檔案
+    假日、成員與手動記錄只載入一次；每位成員只查詢一次 Google Calendar，
+    事件在記憶體中依月份分配後，逐月產生 Excel。
+
+    Args:
+        start_ym (str): 起始年月 (YYYYMM)。
+        end_ym (str): 結束年月 (YYYYMM)。
+        target_member_id (Optional[str]): 目標成員 ID。如果為 None，則處理所有成員。
+        run_info (Optional[dict]): 若提供，會寫入本次執行的中繼資料
+            ('holiday_version'、'rates_version' (加班費率規則版本)、
+            'calendar_dates': 年月 -> 成員姓名 -> 行事曆值班開始日期列表、
+            'overlaps': 年月 -> 成員姓名 -> 重疊記錄列表 (只含有重疊的成員)，
+            'workbooks': 每個產生的檔案 {"year_month", "member_id", "name", "path", "blob" (內容定址檔名)}，
+            以及 'failures': 行事曆擷取失敗的成員 {"year_month", "member_id", "name", "stage", "error", "status"})。
+        members (Optional[dict]): 成員 ID -> 成員資料；None 時從 MEMBERS_FILE 載入 (可傳入合成成員)。
+        event_source (Optional[EventSource]): 行事曆事件來源；None 時依環境變數 CALENDAR_EVENT_SOURCE
+            建立 (預設為 Google Calendar)。
+        progress (Optional[ProgressCallback]): 進度回呼，依序收到下列事件 (dict 的 "event" 欄位)：
+            "started" (members, year_months)、每位成員一次 "fetched" (events, ms)、
+            每位成員每個月份一次 "classified" (rows, ms) 與 "rendered" (file, url, ms) / "skipped" / "failed"，
+            最後是 "finished" (files, members, failed, seconds)。行事曆擷取失敗的成員沒有 "fetched" 與
+            "classified"，每個月份直接送出 "failed" (stage="fetch", error, status)。回呼拋出 ReportCancelled 時停止產生並向外拋出。
+        output_dir (Optional[str]): Excel 輸出目錄；None 時使用 OUTPUT_DIR (data/output)。
+
+    Returns:
+        list[tuple[str, str]]: 包含成功產生的 (檔案路徑, 相對 URL) 的列表。
+            活頁簿同時存入內容定址的檔案儲存區 (data/artifacts)，URL 為內容不變的 /artifacts/... 網址；
+            存入失敗時退回輸出目錄的 /download/... 網址。
+    """
+    generated_files = [] # 儲存成功產生的檔案路徑和 URL
+    try:
+        year_months = month_range(start_ym, end_ym)
+    except ValueError:
+        logger.error(f"錯誤：年月格式不正確 ({start_ym}..{end_ym})，請使用 YYYYMM 格式且結束年月不可早於起始年月。")
+        return []
+    period = year_months[0] if len(year_months) == 1 else f"{year_months[0]}..{year_months[-1]}"
+
+    run_started = time.perf_counter() # 含準備階段，與預覽的總耗時指標一致
+    run = _prepare_run(year_months, target_member_id, run_info, members, event_source)
+    if run is None:
+        return []
+    holidays = run['holidays']
+
+    try:
+        excel_service = _excel_service_class()(
+            template_path=os.path.join(DATA_DIR, 'VSduty_template.xlsx'),
+            output_dir=output_dir or OUTPUT_DIR # 未指定時使用全局定義的 OUTPUT_DIR
+        )
+        logger.info(f"服務初始化完成，使用模板檔案: {os.path.join(DATA_DIR, 'VSduty_template.xlsx')}")
+        logger.info(f"服務初始化完成，使用輸出目錄: {output_dir or OUTPUT_DIR}")
+    except Exception as e:
+        logger.critical(f"初始化 Excel 服務時發生錯誤: {e}", exc_info=True)
+        return []
+
+    # --- 開始處理和計時 ---
+    start_process_time = time.time()
+    total_members_processed = set()
+    total_excel_generated = 0
+
+    logger.info(f"開始順序處理 {len(run['members'])} 個成員，共 {len(year_months)} 個月份...")
+    _emit(progress, 'started', members=len(run['members']), year_months=year_months)
+
+    # --- 主迴圈：擷取 → 合併 → 分類後產生 Excel ---
+    for year_month, member_id, member_info, duties_for_excel in _iter_member_rows(run, run_info, progress):
+        member_name = member_info.get('name', '未知姓名')
+        REPORT_MEMBERS.labels('generate').inc()
+        REPORT_SHIFTS.labels('generate').inc(len(duties_for_excel))
+        outcome = {"year_month": year_month, "member_id": member_id, "name": member_name, "rows": len(duties_for_excel)}
+        render_started = time.perf_counter()
         if duties_for_excel:
+            outcome["event"] = 'failed'
             try:
-                logger.info(f"準備為 [{member_name}] 產生包含 {len(duties_for_excel)} 筆記錄 (含手動) 的 Excel 檔案...")
+                logger.info(f"準備為 [{member_name}] 產生 {year_month} 包含 {len(duties_for_excel)} 筆記錄 (含手動) 的 Excel 檔案...")
                 if 'employee_id' not in member_info:
                      logger.error(f"成員 [{member_name}] 缺少 'employee_id'，無法產生 Excel。")
                 else:
-                    file_path, relative_url = excel_service.generate_excel(member_info, duties_for_excel, year_month)
+                    file_path, relative_url = excel_service.generate_excel(member_info, duties_for_excel, year_month, holiday_version=holidays.version)
                     if file_path and relative_url:
+                        blob = _store_workbook(file_path)
+                        if blob is not None:
+                            relative_url = shared_blob_store(DATA_DIR).url_for(blob, os.path.basename(file_path))
                         logger.info(f"成功為 [{member_name}] 產生 Excel: {file_path} (URL: {relative_url})")
                         generated_files.append((file_path, relative_url))
                         total_excel_generated += 1
+                        WORKBOOKS.labels('success').inc()
+                        outcome.update(event='rendered', file=os.path.basename(file_path), url=relative_url)
+                        if run_info is not None:
+                            run_info.setdefault('workbooks', []).append(
+                                {"year_month": year_month, "member_id": member_id, "name": member_name,
+                                 "path": file_path, "blob": blob})
                     else:
                          logger.error(f"為 [{member_name}] 產生 Excel 時 excel_service 返回 None")
+                         WORKBOOKS.labels('failed').inc()
             except Exception as e:
                 logger.error(f"為 [{member_name}] 產生 Excel 時發生錯誤: {e}", exc_info=True)
+                WORKBOOKS.labels('failed').inc()
         else:
             logger.info(f"成員 [{member_name}] 在 {year_month} 沒有從行事曆或手動記錄解析出任何有效值班記錄，不產生 Excel。")
+            outcome["event"] = 'skipped'
 
-        total_members_processed += 1
-        logger.info(f"--- 完成處理成員: {member_name} ({member_id}) ---")
+        total_members_processed.add(member_id)
+        _emit(progress, outcome.pop("event"), **outcome, ms=round((time.perf_counter() - render_started) * 1000, 1))
 
     # --- 計時結束和總結 --- 
     end_process_time = time.time()
     total_duration = end_process_time - start_process_time
-    logger.info(f"=== {year_month} 報表產生完成 ({'Member ' + target_member_id if target_member_id else 'All Members'}) ===")
-    logger.info(f"總共處理成員數: {total_members_processed}")
+    REPORT_RUN_SECONDS.labels('generate').observe(time.perf_counter() - run_started)
+    logger.info(f"=== {period} 報表產生完成 ({'Member ' + target_member_id if target_member_id else 'All Members'}) ===")
+    logger.info(f"總共處理成員數: {len(total_members_processed)}")
     logger.info(f"成功產生 Excel 檔案數: {total_excel_generated}")
+    if run['failures']:
+        logger.warning(f"行事曆擷取失敗的成員: {sorted({failure['member_id'] for failure in run['failures']})}")
     logger.info(f"總耗時: {total_duration:.2f} 秒。")
+    _emit(progress, 'finished', files=total_excel_generated, members=len(total_members_processed),
+          failed=len({failure['member_id'] for failure in run['failures']}), seconds=round(total_duration, 3))
     
     return generated_files
 
+def generate_reports(year_month: str, target_member_id: Optional[str] = None, run_info: Optional[dict] = None,
+                     members: Optional[dict] = None, event_source: Optional[EventSource] = None,
+                     progress: Optional[ProgressCallback] = None, output_dir: Optional[str] = None):
+    """產生指定年月和成員 (可選) 的值班報表。
+
+    Args:
+        year_month (str): 目標年月 (YYYYMM)。
+        target_member_id (Optional[str]): 目標成員 ID。如果為 None，則處理所有成員。
+        run_info (Optional[dict]): 同 `generate_reports_range`。
+        members (Optional[dict]): 同 `generate_reports_range`。
+        event_source (Optional[EventSource]): 同 `generate_reports_range`。
+        progress (Optional[ProgressCallback]): 同 `generate_reports_range`。
+        output_dir (Optional[str]): 同 `generate_reports_range`。
+
+    Returns:
+        list[tuple[str, str]]: 包含成功產生的 (檔案路徑, 相對 URL) 的列表。
+    """
+    return generate_reports_range(year_month, year_month, target_member_id, run_info, members, event_source, progress,
+                                  output_dir)
+
 # --- 主程式執行區塊 (用於直接執行此腳本進行測試或獨立運行) ---
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='從 Google Calendar 和 duties.json 獲取成員事件並產生 Excel 值班表。')
     parser.add_argument('--member-id', type=str, help='只處理特定成員 ID (例如: A, B, ...)')
     parser.add_argument('--year-month', type=str, default=datetime.now().strftime('%Y%m'), help='指定處理的年月 (格式 YYYYMM)，預設為當前年月')
+    parser.add_argument('--start-ym', type=str, help='範圍產生的起始年月 (格式 YYYYMM)，需搭配 --end-ym')
+    parser.add_argument('--end-ym', type=str, help='範圍產生的結束年月 (格式 YYYYMM)')
+    parser.add_argument('--event-source', type=str, help='行事曆事件來源 (google、snapshot:<檔案>、fake:<網址>、synthetic)，預設讀取環境變數 CALENDAR_EVENT_SOURCE')
+    parser.add_argument('--synthetic-members', type=int, help='使用 N 位合成成員取代 members.json (搭配 fake 或 synthetic 事件來源)')
     args = parser.parse_args()
 
+    configure_logging()
+    if args.event_source:
+        os.environ[EVENT_SOURCE_ENV] = args.event_source
+    members = None
+    if args.synthetic_members:
+        from ..services.fake_calendar import synthetic_members # 測試用的假資料，只在命令列要求時匯入
+        members = synthetic_members(args.synthetic_members)
+
     # 注意：直接執行時，相對路徑是相對於 core 目錄，需要調整
     # 這裡假設直接執行只是為了測試，路徑應能正確找到 data 目錄
     # 如果要打包或部署，應依賴上面的 BASE_DIR 和 DATA_DIR
-    print(f"Executing report generation for {args.year_month}, Member: {args.member_id}")
-    results = generate_reports(args.year_month, args.member_id)
+    cli_run_info = {}
+    if args.start_ym or args.end_ym:
+        start_ym = args.start_ym or args.end_ym
+        end_ym = args.end_ym or args.start_ym
+        print(f"Executing report generation for {start_ym}..{end_ym}, Member: {args.member_id}")
+        results = generate_reports_range(start_ym, end_ym, args.member_id, run_info=cli_run_info, members=members)
+    else:
+        print(f"Executing report generation for {args.year_month}, Member: {args.member_id}")
+        results = generate_reports(args.year_month, args.member_id, run_info=cli_run_info, members=members)
     print("\n--- Generation Results ---")
     if results:
         for path, url in results:
             print(f"- Generated: {path} (URL: {url})")
     else:
         print("No reports were generated or an error occurred.")
-    print("-------------------------") 
\ No newline at end of file
+    for failure in cli_run_info.get('failures', []):
+        print(f"- Failed: {failure['year_month']} {failure['member_id']} ({failure['name']}): {failure['error']}")
+    print("-------------------------")
\ No newline at end of file
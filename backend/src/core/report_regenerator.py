@@ -0,0 +1,254 @@
+import os
+import tempfile
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from ..services.duty_store import INVALID_PARTITION, expand_duties
+from ..services.report_artifacts import ReportArtifactStore, parse_report_key, report_key
+from ..services.shared_state import InterProcessLock
+from .report_generator import generate_reports, current_rate_table
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = 2.0       # 最後一次變更後等待多久才開始重新產生 (合併連續的批次修改)
+RATES_CHECK_SECONDS = 30.0   # 檢查加班費率規則版本的間隔 (規則檔沒有變更通知)
+POLL_SECONDS = 2.0           # 檢查其他 worker 標記的過期報表的間隔
+LEADER_RETRY_SECONDS = 10.0  # 其他 worker 負責重新產生時，多久嘗試接手一次 (該 worker 結束後)
+LEADER_LOCK_FILE = '.regenerator.lock' # data/reports/.regenerator.lock
+
+
+class ReportRegenerator:
+    """追蹤報表的輸入，在輸入變更時只重新產生受影響的 (成員, 年月) 報表。
+
+    相依關係：
+        * 加班記錄：記錄所在月份、記錄涉及的成員 (群組記錄依成員展開)。
+        * 週期規則：所有報表 (規則變更通知不含範圍)。
+        * 假日：該日與前一天所在月份的所有報表 (與 OvertimeAggregates 相同)。
+        * 行事曆值班：之後任何報表執行 (預覽或產生) 取得的值班日期與報表產生時不同的成員。
+        * 加班費率規則：版本與報表產生時不同的報表。
+    變更只把報表標記為過期，背景執行緒在 DEBOUNCE_SECONDS 內沒有新變更後逐一重新產生，
+    每份報表只查詢一次該成員的行事曆並產生一個活頁簿。
+
+    多個 worker 行程時，每個 worker 都在自己的寫入後標記過期 (存在共用的 manifest)，
+    但只有取得 data/reports/.regenerator.lock 的 worker 執行背景重新產生。
+    """
+
+    def __init__(self, artifacts: ReportArtifactStore, duty_store, holiday_store,
+                 after_run: Optional[Callable[[dict], None]] = None, debounce_seconds: float = DEBOUNCE_SECONDS):
+        """
+        Args:
+            artifacts (ReportArtifactStore): 報表儲存區。
+            duty_store: DutyStore (訂閱加班記錄與週期規則變更)。
+            holiday_store: HolidayStore (訂閱假日變更)。
+            after_run (Optional[Callable[[dict], None]]): 每次重新產生後以 run_info 呼叫
+                (例如更新 OvertimeAggregates 的行事曆值班日期)。
+            debounce_seconds (float): 見 DEBOUNCE_SECONDS。
+        """
+        self.artifacts = artifacts
+        self.after_run = after_run
+        self.debounce_seconds = debounce_seconds
+        self.stats = {"rendered": 0, "removed": 0, "failed": 0, "last_run": None}
+        self._wake = threading.Event()
+        self._last_mark = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._render_lock = threading.Lock()
+        self.leader = False # 本 worker 是否負責背景重新產生
+
+        # 其他 worker 的寫入已由該 worker 標記在共用的 manifest，不需要再接收
+        duty_store.subscribe(self._on_duties_changed, external=False)
+        duty_store.rules.subscribe(self._on_rules_changed, external=False)
+        holiday_store.subscribe(self._on_holiday_changed, external=False)
+
+    # --- 登記報表 ---
+    def publish_run(self, run_info: dict, base_revisions: Optional[dict] = None) -> int:
+        """把一次報表執行產生的活頁簿存入儲存區，返回存入的數量。"""
+        published = 0
+        for workbook in run_info.get('workbooks', []):
+            year_month, member_id, name = workbook['year_month'], workbook['member_id'], workbook['name']
+            inputs = {
+                "holiday_version": run_info.get('holiday_version'),
+                "rates_version": run_info.get('rates_version'),
+                "calendar_dates": run_info.get('calendar_dates', {}).get(year_month, {}).get(name, []),
+            }
+            try:
+                self.artifacts.publish(year_month, member_id, name, workbook['path'], inputs,
+                                       base_revision=(base_revisions or {}).get(report_key(year_month, member_id)),
+                                       blob=workbook.get('blob'))
+                published += 1
+            except OSError as e:
+                logger.error(f"存入報表 {year_month}/{member_id} 失敗: {e}", exc_info=True)
+        return published
+
+    def observe_calendar_dates(self, run_info: dict) -> None:
+        """行事曆值班日期與報表產生時不同的成員，其報表標記為過期。"""
+        for year_month, dates_by_member in run_info.get('calendar_dates', {}).items():
+            for name, dates in dates_by_member.items():
+                for key in self.artifacts.keys_where(year_month, {name}):
+                    entry = self.artifacts.get(key)
+                    if entry is not None and entry['inputs'].get('calendar_dates') != sorted(dates):
+                        self._mark([key], 'calendar')
+
+    # --- 變更通知 ---
+    def _mark(self, keys: list[str], reason: str) -> None:
+        newly_dirty = self.artifacts.mark_dirty(keys, reason)
+        if newly_dirty:
+            logger.info(f"{len(newly_dirty)} 份報表因 {reason} 變更而過期: {newly_dirty[:10]}")
+        if keys:
+            self._last_mark = time.monotonic()
+            self._wake.set()
+
+    def _on_duties_changed(self, changes: dict) -> None:
+        for year_month, (before, after) in changes.items():
+            if year_month == INVALID_PARTITION:
+                continue
+            before_ids = {id(duty) for duty in before}
+            after_ids = {id(duty) for duty in after}
+            changed = [duty for duty in before if id(duty) not in after_ids]
+            changed += [duty for duty in after if id(duty) not in before_ids]
+            persons = {duty['person'] for duty in expand_duties(changed) if duty.get('person')}
+            if persons:
+                self._mark(self.artifacts.keys_where(year_month, persons), 'duties')
+
+    def _on_rules_changed(self) -> None:
+        self._mark(self.artifacts.keys_where(), 'duty_rules')
+
+    def _on_holiday_changed(self, date: Optional[str], old, new) -> None:
+        if date is None:
+            self._mark(self.artifacts.keys_where(), 'holidays')
+            return
+        try:
+            previous_day = (datetime.strptime(date, "%Y%m%d") - timedelta(days=1)).strftime("%Y%m%d")
+        except ValueError:
+            return
+        for year_month in {date[:6], previous_day[:6]}:
+            self._mark(self.artifacts.keys_where(year_month), 'holidays')
+
+    def _check_rates_version(self) -> None:
+        version = current_rate_table().version
+        stale = [entry['key'] for entry in self.artifacts.entries() if entry['inputs'].get('rates_version') != version]
+        if stale:
+            self._mark(stale, 'overtime_rates')
+
+    def request(self, year_month: str, member_id: str) -> bool:
+        """手動要求重新產生 (例如上次失敗後重試)；報表不存在時返回 False。"""
+        key = report_key(year_month, member_id)
+        if self.artifacts.get(key) is None:
+            return False
+        self._mark([key], 'manual')
+        return True
+
+    # --- 重新產生 ---
+    def regenerate(self, key: str) -> str:
+        """重新產生單一報表，返回結果 (rendered | removed | failed)。"""
+        year_month, member_id = parse_report_key(key)
+        entry = self.artifacts.get(key)
+        base_revision = entry.get('revision', 0) if entry else None
+        outcomes = []
+
+        def on_progress(event: dict) -> None:
+            if event['event'] in ('rendered', 'skipped', 'failed'):
+                outcomes.append(event['event'])
+
+        with self._render_lock, tempfile.TemporaryDirectory(prefix='regen-', dir=self.artifacts.reports_dir) as work_dir:
+            run_info = {}
+            try:
+                generate_reports(year_month, member_id, run_info=run_info, progress=on_progress, output_dir=work_dir)
+            except Exception as e:
+                logger.error(f"重新產生報表 {key} 時發生錯誤: {e}", exc_info=True)
+                outcomes = ['failed']
+            outcome = outcomes[0] if outcomes else 'failed'
+
+            if outcome == 'rendered':
+                self.publish_run(run_info, base_revisions={key: base_revision})
+                result = 'rendered'
+            elif outcome == 'skipped':
+                self.artifacts.remove(key) # 該月份已沒有任何班次
+                result = 'removed'
+            else:
+                failures = run_info.get('failures', [])
+                self.artifacts.record_error(key, failures[0]['error'] if failures else "重新產生失敗，請查看伺服器日誌")
+                result = 'failed'
+        if self.after_run is not None and outcome != 'failed':
+            try:
+                self.after_run(run_info)
+            except Exception as e:
+                logger.error(f"重新產生報表後的回呼失敗: {e}", exc_info=True)
+        self.stats[result] += 1
+        self.stats["last_run"] = datetime.now().isoformat(timespec='seconds')
+        logger.info(f"報表 {key} 重新產生結果: {result}")
+        return result
+
+    def run_pending(self) -> dict:
+        """重新產生所有過期 (且上次未失敗) 的報表，返回各結果的數量。"""
+        results = {}
+        for key in self.artifacts.dirty_keys(include_failed=False):
+            if self._stop.is_set():
+                break
+            result = self.regenerate(key)
+            results[result] = results.get(result, 0) + 1
+        return results
+
+    # --- 背景執行緒 ---
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='report-regenerator', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+        leader_lock = InterProcessLock(os.path.join(self.artifacts.reports_dir, LEADER_LOCK_FILE))
+        while not leader_lock.acquire(blocking=False):
+            if self._stop.wait(LEADER_RETRY_SECONDS):
+                return
+        self.leader = True
+        logger.info(f"本 worker (PID {os.getpid()}) 負責背景重新產生報表")
+        try:
+            if self.artifacts.dirty_keys(include_failed=False):
+                self._wake.set() # 上次停止時尚未處理的過期報表
+            self._run_leader()
+        finally:
+            self.leader = False
+            leader_lock.release()
+
+    def _run_leader(self) -> None:
+        last_rates_check = 0.0
+        manifest_version = self.artifacts.version
+        while not self._stop.is_set():
+            woken = self._wake.wait(POLL_SECONDS)
+            if self._stop.is_set():
+                return
+            try:
+                if self.artifacts.version != manifest_version:
+                    manifest_version = self.artifacts.version
+                    if self.artifacts.dirty_keys(include_failed=False):
+                        self._last_mark = max(self._last_mark, time.monotonic()) # 其他 worker 標記的過期報表
+                        woken = True
+                if woken or time.monotonic() - last_rates_check >= RATES_CHECK_SECONDS:
+                    last_rates_check = time.monotonic()
+                    self._check_rates_version()
+                if not (woken or self._wake.is_set()):
+                    continue
+                # 等到 debounce_seconds 內沒有新的變更，讓連續的修改只觸發一次重新產生
+                self._wake.clear()
+                while (remaining := self._last_mark + self.debounce_seconds - time.monotonic()) > 0:
+                    if self._stop.wait(remaining):
+                        return
+                results = self.run_pending()
+                if results:
+                    logger.info(f"背景重新產生報表完成: {results}")
+            except Exception as e:
+                logger.error(f"背景重新產生報表時發生錯誤: {e}", exc_info=True)
@@ -0,0 +1,170 @@
+import os
+import logging
+from datetime import datetime
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+PRECEDENCE_ENV = 'SHIFT_OVERLAP_PRECEDENCE'
+PRECEDENCES = ('calendar', 'manual', 'flag')
+DEFAULT_PRECEDENCE = 'calendar'
+MINUTES_PER_DAY = 24 * 60
+
+
+def resolve_precedence(precedence: Optional[str] = None) -> str:
+    """決定重疊處理方式：參數 > 環境變數 SHIFT_OVERLAP_PRECEDENCE > 預設 (calendar)。
+
+    - "calendar": 行事曆標準班次優先，與其重疊的手動班次段被裁切。
+    - "manual": 手動記錄優先，與其重疊的標準班次段被裁切。
+    - "flag": 不修改任何班次段，只回報重疊 (舊版行為，重疊時數會重複計算)。
+
+    Raises:
+        ValueError: 不是上述三種之一時。
+    """
+    value = (precedence or os.environ.get(PRECEDENCE_ENV) or DEFAULT_PRECEDENCE).lower()
+    if value not in PRECEDENCES:
+        raise ValueError(f"未知的重疊優先順序: {value} (可用: {', '.join(PRECEDENCES)})")
+    return value
+
+
+def _source(segment: dict) -> str:
+    return 'manual' if segment.get('is_manual') else 'calendar'
+
+
+def _to_minutes(segment: dict) -> tuple[int, int]:
+    """班次段 (不跨日，end 可為 "2400") 轉為絕對分鐘區間 [start, end)。"""
+    day = datetime.strptime(segment['date'], "%Y%m%d").toordinal() * MINUTES_PER_DAY
+    start = int(segment['start'][:2]) * 60 + int(segment['start'][2:])
+    end = int(segment['end'][:2]) * 60 + int(segment['end'][2:])
+    return day + start, day + end
+
+
+def _format_minute(value: int, is_end: bool) -> tuple[str, str]:
+    """絕對分鐘轉回 (YYYYMMDD, HHMM)；區間結束剛好落在午夜時表示為前一天的 "2400"。"""
+    day, minute = divmod(value, MINUTES_PER_DAY)
+    if is_end and minute == 0:
+        day, minute = day - 1, MINUTES_PER_DAY
+    date_str = datetime.fromordinal(day).strftime("%Y%m%d")
+    return date_str, f"{minute // 60:02d}{minute % 60:02d}"
+
+
+def _piece(segment: dict, start: int, end: int, tier_offset: int = 0) -> dict:
+    """以 segment 的屬性建立 [start, end) 的班次段 (原班次段不跨日，因此片段也不跨日)。
+
+    tier_offset 為同一原班次段在此片段之前保留的分鐘數；分類時片段由此位置接續 E/F/G 級距，
+    而不是每個片段都從第一級重新計算。
+    """
+    date_str, start_str = _format_minute(start, is_end=False)
+    _, end_str = _format_minute(end, is_end=True)
+    piece = {**segment, "date": date_str, "start": start_str, "end": end_str}
+    if tier_offset:
+        piece["tier_offset"] = tier_offset
+    return piece
+
+
+def _overlap(winner: dict, loser: dict, start: int, end: int) -> dict:
+    date_str, start_str = _format_minute(start, is_end=False)
+    _, end_str = _format_minute(end, is_end=True)
+    return {
+        "date": date_str, "start": start_str, "end": end_str, "minutes": end - start,
+        "kept": _source(winner), "kept_reason": winner.get('reason'),
+        "trimmed": _source(loser), "trimmed_reason": loser.get('reason'),
+    }
+
+
+def _dedupe_class(items: list[tuple[int, int, dict]], overlaps: list, trim: bool) -> list[tuple[int, int, dict]]:
+    """同一優先等級內的重疊：先開始的保留，後面的只保留超出部分 (已依開始時間排序)。"""
+    result = []
+    covered_until = None
+    covering = None
+    for start, end, segment in items:
+        if covered_until is not None and start < covered_until:
+            overlaps.append(_overlap(covering, segment, start, min(end, covered_until)))
+            if trim:
+                start = covered_until
+        if start < end:
+            result.append((start, end, segment))
+        if covered_until is None or end > covered_until:
+            covered_until, covering = end, segment
+    return result
+
+
+def _subtract(items: list[tuple[int, int, dict]], union: list[tuple[int, int, dict]],
+              overlaps: list, trim: bool) -> list[tuple[int, int, dict]]:
+    """從 items 扣除已接受的區間聯集 (兩者皆依開始時間排序，雙指標掃描)。"""
+    result = []
+    index = 0
+    for start, end, segment in items:
+        while index < len(union) and union[index][1] <= start:
+            index += 1
+        cursor = start
+        probe = index
+        while probe < len(union) and union[probe][0] < end:
+            u_start, u_end, winner = union[probe]
+            if u_end > cursor:
+                overlap_start, overlap_end = max(cursor, u_start), min(end, u_end)
+                if overlap_start < overlap_end:
+                    overlaps.append(_overlap(winner, segment, overlap_start, overlap_end))
+                    if trim and cursor < overlap_start:
+                        result.append((cursor, overlap_start, segment))
+                    if trim:
+                        cursor = overlap_end
+            probe += 1
+        if not trim:
+            result.append((start, end, segment))
+        elif cursor < end:
+            result.append((cursor, end, segment))
+    return result
+
+
+def _merge_sorted(a: list, b: list) -> list:
+    merged = a + b
+    merged.sort(key=lambda item: item[0]) # 兩段皆已排序，Timsort 合併為線性時間
+    return merged
+
+
+def resolve_overlaps(segments: Iterable[dict], precedence: Optional[str] = None) -> tuple[list[dict], list[dict]]:
+    """合併一位成員的所有班次段，依優先順序裁切重疊部分。
+
+    所有班次段只排序一次，之後以掃描線處理，整體為 O(n log n)。
+    同一來源 (例如兩筆手動記錄) 之間的重疊，先開始的保留；不同來源之間依 precedence 決定。
+
+    Args:
+        segments (Iterable[dict]): 班次段 (date, start, end, is_manual, ...)，每段不跨日。
+        precedence (Optional[str]): 見 `resolve_precedence`。
+
+    Returns:
+        tuple[list[dict], list[dict]]: (不重疊的班次段, 重疊記錄)。
+            被裁切的班次段以片段返回；同一班次段的第二個以後的片段帶有 tier_offset
+            (之前片段的分鐘數合計)，分類時接續原班次段的級距與半小時進位 (見 `_calculate_shift_hours`)。
+            重疊記錄含 date, start, end, minutes, kept, kept_reason, trimmed, trimmed_reason。
+            precedence 為 "flag" 時班次段原樣返回，只回報重疊。
+    """
+    precedence = resolve_precedence(precedence)
+    trim = precedence != 'flag'
+    first = 'manual' if precedence == 'manual' else 'calendar'
+
+    items = []
+    for segment in segments:
+        start, end = _to_minutes(segment)
+        if start < end:
+            items.append((start, end, segment))
+    items.sort(key=lambda item: (item[0], item[1]))
+
+    overlaps = []
+    primary = _dedupe_class([item for item in items if _source(item[2]) == first], overlaps, trim)
+    secondary = _dedupe_class([item for item in items if _source(item[2]) != first], overlaps, trim)
+    secondary = _subtract(secondary, primary, overlaps, trim)
+
+    resolved = []
+    kept_minutes = {} # id(原班次段) -> 已返回片段的分鐘數 (片段依開始時間排序，因此依序累加)
+    for start, end, segment in _merge_sorted(primary, secondary):
+        if (start, end) == _to_minutes(segment):
+            resolved.append(segment)
+            continue
+        tier_offset = kept_minutes.get(id(segment), 0)
+        kept_minutes[id(segment)] = tier_offset + end - start
+        resolved.append(_piece(segment, start, end, tier_offset))
+    if overlaps:
+        logger.debug("發現 %d 個重疊的班次段 (優先順序: %s)", len(overlaps), precedence)
+    return resolved, overlaps
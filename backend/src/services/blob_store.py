@@ -0,0 +1,207 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import logging
+from typing import Callable, Optional
+from urllib.parse import quote
+
+from .metrics import io_timer
+from .shared_state import InterProcessLock
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR_NAME = 'artifacts'             # data/artifacts/<雜湊前兩碼>/<sha256>.<副檔名>
+MAX_BYTES_ENV = 'ARTIFACT_STORE_MAX_BYTES'
+DEFAULT_MAX_BYTES = 1024 ** 3            # 超過後淘汰最久未下載的檔案
+RESCAN_SECONDS = 300.0                   # 其他 worker 也會寫入，估計的用量每隔一段時間重新掃描
+URL_PREFIX = '/artifacts'
+
+MEDIA_TYPES = {
+    'xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    'zip': "application/zip",
+}
+
+_BLOB_RE = re.compile(r"^([0-9a-f]{64})\.(xlsx|zip)$")
+_UNSAFE_FILENAME_CHARS = re.compile(r'[\x00-\x1f\x7f"\\/:*?<>|]')
+
+
+def parse_blob_name(blob_name: str) -> Optional[tuple[str, str]]:
+    """拆解 "<sha256>.<副檔名>"，返回 (雜湊, 副檔名)；格式不正確時返回 None。"""
+    match = _BLOB_RE.match(blob_name or '')
+    return (match.group(1), match.group(2)) if match else None
+
+
+def safe_filename(name: Optional[str]) -> Optional[str]:
+    """把用戶端提供的檔名正規化為單一路徑元件 (去掉目錄與不可用於檔名的字元)；無法使用時返回 None。"""
+    if not name:
+        return None
+    name = _UNSAFE_FILENAME_CHARS.sub('_', os.path.basename(name.replace('\\', '/'))).strip()
+    if name in ('', '.', '..'):
+        return None
+    return name
+
+
+class BlobStore:
+    """內容定址的檔案儲存區：報表活頁簿與 ZIP 以內容的 SHA-256 命名，同一內容只存一份。
+
+    檔名由內容決定，網址 (/artifacts/<sha256>.<副檔名>) 對應的內容永遠不變，
+    用戶端與代理伺服器可以永久快取；`/generate_report` 清空輸出目錄後舊報表仍可下載。
+    總大小超過上限時依最後使用時間 (下載時更新檔案 mtime) 淘汰，仍被報表儲存區引用的檔案不淘汰。
+    """
+
+    def __init__(self, data_dir: str, max_bytes: Optional[int] = None):
+        """
+        Args:
+            data_dir (str): 資料目錄。
+            max_bytes (Optional[int]): 總大小上限；None 表示使用環境變數 ARTIFACT_STORE_MAX_BYTES (預設 1 GiB)。
+        """
+        self.blobs_dir = os.path.join(data_dir, BLOBS_DIR_NAME)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get(MAX_BYTES_ENV, DEFAULT_MAX_BYTES))
+        self._pin_sources = []      # 返回不可淘汰檔名集合的函式
+        self._lock = threading.Lock()
+        self._evict_lock = InterProcessLock(os.path.join(self.blobs_dir, '.lock'))
+        self._estimated_bytes = None # 上次掃描的總大小加上之後本行程寫入的大小
+        self._scanned_at = 0.0
+
+    def add_pin_source(self, source: Callable[[], set]) -> None:
+        """登記仍在使用的檔名來源 (例如報表儲存區目前的各份報表)；沒有登記任何來源時不淘汰。"""
+        self._pin_sources.append(source)
+
+    def path_for(self, blob_name: str) -> str:
+        return os.path.join(self.blobs_dir, blob_name[:2], blob_name)
+
+    @staticmethod
+    def url_for(blob_name: str, filename: Optional[str] = None) -> str:
+        """下載網址；filename 為下載時建議的檔名 (不影響內容，只影響 Content-Disposition)。"""
+        url = f"{URL_PREFIX}/{blob_name}"
+        return f"{url}?name={quote(filename)}" if filename else url
+
+    # --- 寫入 ---
+    def put_file(self, source_path: str) -> str:
+        """把檔案存入儲存區 (內容已存在時不重複寫入)，返回檔名 "<sha256>.<副檔名>"。"""
+        extension = os.path.splitext(source_path)[1].lstrip('.').lower()
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        blob_name = f"{digest.hexdigest()}.{extension}"
+        target = self.path_for(blob_name)
+        if self._touch(target):
+            return blob_name
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with io_timer('artifacts', 'write'):
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, target)
+        self._added(os.path.getsize(target))
+        return blob_name
+
+    def put_bytes(self, data, extension: str) -> str:
+        """把記憶體中的內容 (bytes 或 memoryview，例如 ZIP 緩衝區) 存入儲存區，返回檔名。"""
+        blob_name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        target = self.path_for(blob_name)
+        if self._touch(target):
+            return blob_name
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with io_timer('artifacts', 'write'), open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, target)
+        self._added(len(data))
+        return blob_name
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """更新最後使用時間 (LRU 依據)；檔案不存在時返回 False。"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    # --- 讀取 ---
+    def open(self, blob_name: str) -> Optional[str]:
+        """返回檔案路徑並記錄這次使用；檔名格式不正確或檔案已被淘汰時返回 None。"""
+        if parse_blob_name(blob_name) is None:
+            return None
+        path = self.path_for(blob_name)
+        return path if self._touch(path) else None
+
+    # --- 淘汰 ---
+    def _added(self, size: int) -> None:
+        with self._lock:
+            if self._estimated_bytes is not None:
+                self._estimated_bytes += size
+            if (self._estimated_bytes is not None and self._estimated_bytes <= self.max_bytes
+                    and time.monotonic() - self._scanned_at < RESCAN_SECONDS):
+                return
+        if self._pin_sources:
+            self.evict()
+
+    def _scan(self) -> list[tuple[float, int, str]]:
+        blobs = []
+        for entry in os.scandir(self.blobs_dir):
+            if not entry.is_dir():
+                continue
+            for blob in os.scandir(entry.path):
+                if parse_blob_name(blob.name) is None:
+                    continue
+                try:
+                    stat = blob.stat()
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, blob.name))
+        return blobs
+
+    def evict(self) -> int:
+        """總大小超過上限時，從最久未使用的檔案開始刪除 (仍被引用的除外)，返回刪除的數量。"""
+        if not self._evict_lock.acquire(blocking=False):
+            return 0 # 其他 worker 正在淘汰
+        try:
+            blobs = self._scan()
+            total = sum(size for _, size, _ in blobs)
+            removed = 0
+            if total > self.max_bytes:
+                pinned = set()
+                for source in self._pin_sources:
+                    pinned |= source()
+                for _, size, blob_name in sorted(blobs):
+                    if total <= self.max_bytes:
+                        break
+                    if blob_name in pinned:
+                        continue
+                    try:
+                        os.unlink(self.path_for(blob_name))
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    removed += 1
+                logger.info(f"報表檔案儲存區超過 {self.max_bytes} bytes，淘汰 {removed} 個最久未使用的檔案 (剩餘 {total} bytes)")
+            with self._lock:
+                self._estimated_bytes = total
+                self._scanned_at = time.monotonic()
+            return removed
+        finally:
+            self._evict_lock.release()
+
+    def usage(self) -> dict:
+        """目前的檔案數與總大小。"""
+        blobs = self._scan()
+        return {"files": len(blobs), "bytes": sum(size for _, size, _ in blobs), "max_bytes": self.max_bytes}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def shared_blob_store(data_dir: str) -> BlobStore:
+    """行程內每個資料目錄共用一個 BlobStore (報表產生與 API 共用同一份用量估計與引用來源)。"""
+    key = os.path.abspath(data_dir)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = BlobStore(data_dir)
+        return _stores[key]
@@ -0,0 +1,274 @@
+import os
+import random
+import threading
+import time
+import logging
+from typing import Callable, Optional, TypeVar
+
+from .metrics import CALENDAR_REQUESTS, CALENDAR_THROTTLE_SECONDS, CALENDAR_BREAKER_OPEN
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Google Calendar API 的預設配額約為每位使用者每分鐘 600 個請求；預設值保留一半給其他用戶端
+RATE_ENV = 'CALENDAR_RATE_LIMIT'                # 每秒請求數 (token bucket 補充速率)
+BURST_ENV = 'CALENDAR_BURST'                    # token bucket 容量 (允許的瞬間請求數)
+MAX_ATTEMPTS_ENV = 'CALENDAR_MAX_ATTEMPTS'      # 每個請求最多嘗試次數 (含第一次)
+BACKOFF_BASE_ENV = 'CALENDAR_BACKOFF_BASE'      # 第一次重試前的退避上限 (秒)，之後每次加倍
+BACKOFF_MAX_ENV = 'CALENDAR_BACKOFF_MAX'        # 單次退避的上限 (秒)
+BREAKER_THRESHOLD_ENV = 'CALENDAR_BREAKER_THRESHOLD'  # 連續幾次請求 (含重試) 失敗後斷路
+BREAKER_RESET_ENV = 'CALENDAR_BREAKER_RESET'    # 斷路後多久允許一個試探請求 (秒)
+WORKERS_ENV = 'WEB_CONCURRENCY'                 # 正式模式的 worker 行程數 (run.py --workers 會設定)
+
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 10
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_RESET = 30.0
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+RATE_LIMIT_REASONS = frozenset({'rateLimitExceeded', 'userRateLimitExceeded'}) # Google 也會以 403 回應配額錯誤
+
+
+class CalendarFetchError(Exception):
+    """行事曆請求失敗 (重試後仍失敗、不可重試的錯誤或斷路中)。
+
+    Attributes:
+        status (Optional[int]): HTTP 狀態碼；網路錯誤或斷路時為 None。
+        retryable (bool): 錯誤是否屬於暫時性 (429 / 5xx / 網路錯誤)。
+        attempts (int): 已嘗試的次數。
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False, attempts: int = 0):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.attempts = attempts
+
+
+class CircuitOpenError(CalendarFetchError):
+    """斷路器開啟中，請求未送出。"""
+
+
+class TokenBucket:
+    """執行緒安全的 token bucket：平均每秒 rate 個請求，最多累積 burst 個。"""
+
+    def __init__(self, rate: float, burst: int):
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"rate 必須大於 0 且 burst 至少為 1 (rate={rate}, burst={burst})")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """取走一個 token，返回需要等待的秒數 (token 不足時預支，讓等待的請求依序排隊)。"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        """等待直到可以送出一個請求，返回等待的秒數。"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """連續 threshold 次請求 (含重試) 失敗後斷路 reset_seconds 秒，期間的請求立即失敗；
+    之後只放行一個試探請求，成功則恢復，失敗則再斷路。"""
+
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self._opened_at >= self.reset_seconds else 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release_probe(self) -> None:
+        """試探請求沒有得到可判斷健康狀態的結果 (例如程式錯誤) 時釋放試探資格，讓下一個請求重新試探。"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("行事曆 API 試探請求成功，斷路器恢復")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+        CALENDAR_BREAKER_OPEN.set(0)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.threshold):
+                self._opened_at = time.monotonic()
+                self._probing = False
+                logger.warning(f"行事曆 API 連續 {self._failures} 次請求失敗，斷路 {self.reset_seconds:g} 秒")
+                CALENDAR_BREAKER_OPEN.set(1)
+
+
+def classify_error(error: Exception) -> tuple[Optional[int], bool]:
+    """判斷錯誤的 HTTP 狀態碼與是否可重試。
+
+    googleapiclient 的 HttpError 以 `resp.status` 提供狀態碼；其他例外 (連線中斷、逾時) 視為可重試的網路錯誤。
+    """
+    resp = getattr(error, 'resp', None)
+    status = getattr(resp, 'status', None)
+    if status is None:
+        return None, isinstance(error, (OSError, TimeoutError)) or type(error).__module__.startswith('httplib2')
+    status = int(status)
+    if status == 403:
+        reason = getattr(error, 'error_details', None) or ''
+        content = getattr(error, 'content', b'') or b''
+        text = f"{reason} {content.decode('utf-8', 'replace') if isinstance(content, bytes) else content}"
+        return status, any(limit_reason in text for limit_reason in RATE_LIMIT_REASONS)
+    return status, status in RETRYABLE_STATUSES
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    resp = getattr(error, 'resp', None)
+    value = resp.get('retry-after') if hasattr(resp, 'get') else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None # HTTP-date 格式較少見，改用一般的退避
+
+
+class CalendarGovernor:
+    """所有行事曆請求共用的流量管控：token bucket 限速、429 / 5xx 的指數退避重試 (full jitter) 與斷路器。
+
+    同一行程內的所有報表執行 (API 請求、背景重新產生) 共用同一個實例 (見 `shared_governor`)，
+    因此併發擷取時總請求速率仍不超過配額。
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_max: float = DEFAULT_BACKOFF_MAX,
+                 breaker_threshold: int = DEFAULT_BREAKER_THRESHOLD, breaker_reset: float = DEFAULT_BREAKER_RESET,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+        self._rng = random.Random()
+
+    @classmethod
+    def from_env(cls) -> 'CalendarGovernor':
+        """依環境變數 CALENDAR_RATE_LIMIT 等建立 (未設定時使用預設值)。
+
+        token bucket 在每個行程各有一份；多個 worker 行程 (WEB_CONCURRENCY) 時，
+        CALENDAR_RATE_LIMIT 與 CALENDAR_BURST 為所有 worker 合計的上限，平均分給每個 worker。
+        """
+        workers = max(1, int(os.environ.get(WORKERS_ENV) or 1))
+        return cls(
+            rate=float(os.environ.get(RATE_ENV, DEFAULT_RATE)) / workers,
+            burst=max(1, int(os.environ.get(BURST_ENV, DEFAULT_BURST)) // workers),
+            max_attempts=int(os.environ.get(MAX_ATTEMPTS_ENV, DEFAULT_MAX_ATTEMPTS)),
+            backoff_base=float(os.environ.get(BACKOFF_BASE_ENV, DEFAULT_BACKOFF_BASE)),
+            backoff_max=float(os.environ.get(BACKOFF_MAX_ENV, DEFAULT_BACKOFF_MAX)),
+            breaker_threshold=int(os.environ.get(BREAKER_THRESHOLD_ENV, DEFAULT_BREAKER_THRESHOLD)),
+            breaker_reset=float(os.environ.get(BREAKER_RESET_ENV, DEFAULT_BREAKER_RESET)),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失敗後的等待秒數：0 到 min(backoff_max, backoff_base * 2^(attempt-1)) 之間的隨機值。"""
+        return self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def execute(self, call: Callable[[], T], description: str = '') -> T:
+        """在流量管控下執行 call，可重試的錯誤依退避時間重試。
+
+        Args:
+            call (Callable[[], T]): 送出單一請求的函式 (例如 `request.execute`)。
+            description (str): 用於日誌的說明 (例如成員姓名與頁數)。
+
+        Returns:
+            T: call 的返回值。
+
+        Raises:
+            CircuitOpenError: 斷路器開啟中。
+            CalendarFetchError: 不可重試的錯誤，或重試 max_attempts 次後仍失敗。
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            if not self.breaker.allow():
+                CALENDAR_REQUESTS.labels('rejected').inc()
+                raise CircuitOpenError(f"行事曆 API 暫時停用 (連續失敗後斷路中): {description}",
+                                       retryable=True, attempts=attempt - 1)
+            waited = self.bucket.acquire()
+            if waited:
+                CALENDAR_THROTTLE_SECONDS.observe(waited)
+            settled = False # 每次放行都必須回報結果，否則半開狀態的試探資格會一直被占用
+            try:
+                result = call()
+                self.breaker.record_success()
+                settled = True
+            except Exception as e:
+                status, retryable = classify_error(e)
+                if not retryable:
+                    # 404 / 403 等是該日曆本身的問題：伺服器有回應，視為 API 正常
+                    if status is not None:
+                        self.breaker.record_success()
+                        settled = True
+                    CALENDAR_REQUESTS.labels('error').inc()
+                    raise CalendarFetchError(f"{description}: {e}", status=status, attempts=attempt) from e
+                self.breaker.record_failure()
+                settled = True
+                if attempt == self.max_attempts:
+                    CALENDAR_REQUESTS.labels('error').inc()
+                    raise CalendarFetchError(f"{description}: 重試 {attempt} 次後仍失敗 ({status or type(e).__name__})",
+                                             status=status, retryable=True, attempts=attempt) from e
+                delay = max(self.backoff(attempt), _retry_after(e) or 0.0)
+                CALENDAR_REQUESTS.labels('retry').inc()
+                logger.warning(f"{description}: 第 {attempt} 次請求失敗 ({status or type(e).__name__})，{delay:.2f} 秒後重試")
+                self._sleep(delay)
+                continue
+            finally:
+                if not settled:
+                    self.breaker.release_probe()
+            CALENDAR_REQUESTS.labels('success').inc()
+            return result
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_governor() -> CalendarGovernor:
+    """行程內共用的 CalendarGovernor (第一次呼叫時依環境變數建立)。"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = CalendarGovernor.from_env()
+                logger.info(f"行事曆 API 流量管控 (本行程): 每秒 {_shared.bucket.rate:g} 個請求 (瞬間 {_shared.bucket.burst})，"
+                            f"最多嘗試 {_shared.max_attempts} 次")
+    return _shared
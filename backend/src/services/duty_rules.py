@@ -0,0 +1,356 @@
+import json
+import os
+import calendar
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .json_storage import atomic_write_json
+from .metrics import io_timer
+from .shared_state import ChangeLog, InterProcessLock
+
+logger = logging.getLogger(__name__)
+
+RULES_FILE_NAME = 'rules.json'   # data/duties/rules.json
+RULE_ID_PREFIX = 'rule-'         # 展開後的記錄 ID: "rule-<規則ID>-<YYYYMMDD>"
+RULE_FIELDS = ('weekday', 'time', 'hours', 'reason', 'interval', 'start_date', 'end_date',
+               'skip_holidays', 'persons', 'exceptions', 'skip_dates')
+EXCEPTION_FIELDS = ('hours', 'reason', 'excluded') # 個人例外可覆寫的欄位 (與群組記錄相同)
+
+
+def parse_year_month(year_month: str) -> tuple[int, int]:
+    """解析 YYYYMM，返回 (年, 月)。
+
+    Raises:
+        ValueError: 格式不正確或月份不在 1–12 時。
+    """
+    if not isinstance(year_month, str) or len(year_month) != 6 or not year_month.isdigit():
+        raise ValueError(f"年月格式不正確 (應為 YYYYMM): {year_month!r}")
+    year, month = int(year_month[:4]), int(year_month[4:])
+    if year < 1 or not 1 <= month <= 12:
+        raise ValueError(f"年月超出範圍: {year_month}")
+    return year, month
+
+
+def validate_exceptions(exceptions, persons: list) -> list[str]:
+    """檢查以姓名為鍵的個人例外 (群組記錄與週期規則共用)，返回錯誤訊息列表。"""
+    if not exceptions:
+        return []
+    if not isinstance(exceptions, dict):
+        return ["exceptions 必須是以姓名為鍵的物件"]
+    errors = []
+    for person, exception in exceptions.items():
+        if person not in persons:
+            errors.append(f"exceptions 中的 {person} 不在 persons 內")
+            continue
+        if not isinstance(exception, dict) or set(exception) - set(EXCEPTION_FIELDS):
+            errors.append(f"{person} 的例外只能包含 {list(EXCEPTION_FIELDS)}")
+            continue
+        hours = exception.get('hours')
+        if hours is not None and (isinstance(hours, bool) or not isinstance(hours, (int, float)) or not 0 < hours <= 24):
+            errors.append(f"{person} 的例外 hours 必須是 0 到 24 之間的數字: {hours}")
+        if 'reason' in exception and not isinstance(exception['reason'], str):
+            errors.append(f"{person} 的例外 reason 必須是字串")
+        if 'excluded' in exception and not isinstance(exception['excluded'], bool):
+            errors.append(f"{person} 的例外 excluded 必須是布林值")
+    return errors
+
+
+def validate_rule(rule: dict) -> list[str]:
+    """檢查週期規則，返回錯誤訊息列表 (空列表表示有效)。"""
+    errors = []
+    weekday = rule.get('weekday')
+    if not isinstance(weekday, int) or isinstance(weekday, bool) or weekday not in range(7):
+        errors.append("weekday 必須是 0 (週一) 到 6 (週日)")
+    try:
+        datetime.strptime(str(rule.get('time')), "%H%M")
+    except ValueError:
+        errors.append(f"time 格式錯誤 (應為 HHMM): {rule.get('time')}")
+    hours = rule.get('hours')
+    if isinstance(hours, bool) or not isinstance(hours, (int, float)) or not 0 < hours <= 24:
+        errors.append(f"hours 必須是 0 到 24 之間的數字: {hours}")
+    if not isinstance(rule.get('reason'), str):
+        errors.append("reason 必須是字串")
+    interval = rule.get('interval', 1)
+    if not isinstance(interval, int) or isinstance(interval, bool) or interval < 1:
+        errors.append("interval 必須是大於等於 1 的整數 (週)")
+    for field in ('start_date', 'end_date'):
+        value = rule.get(field)
+        if value is None and field == 'end_date':
+            continue
+        try:
+            datetime.strptime(str(value), "%Y%m%d")
+        except ValueError:
+            errors.append(f"{field} 格式錯誤 (應為 YYYYMMDD): {value}")
+    if rule.get('end_date') and str(rule.get('end_date')) < str(rule.get('start_date')):
+        errors.append("end_date 不可早於 start_date")
+    persons = rule.get('persons')
+    if not isinstance(persons, list) or not persons or any(not isinstance(p, str) or not p.strip() for p in persons):
+        errors.append("persons 必須是非空的成員列表")
+    elif len(set(persons)) != len(persons):
+        errors.append("persons 不可重複")
+    else:
+        errors.extend(validate_exceptions(rule.get('exceptions'), persons))
+    skip_dates = rule.get('skip_dates') or []
+    if not isinstance(skip_dates, list):
+        errors.append("skip_dates 必須是列表")
+    else:
+        for entry in skip_dates:
+            date_part, separator, person = entry.partition(':') if isinstance(entry, str) else ('', '', '')
+            try:
+                datetime.strptime(date_part, "%Y%m%d")
+            except ValueError:
+                errors.append(f"skip_dates 格式錯誤 (應為 YYYYMMDD 或 YYYYMMDD:姓名): {entry}")
+                continue
+            if separator and not person.strip():
+                errors.append(f"skip_dates 缺少姓名: {entry}")
+    return errors
+
+
+def is_occurrence(rule: dict, date_str: str) -> bool:
+    """date_str (YYYYMMDD) 是否為規則的發生日 (在日期範圍內、星期相同且符合間隔週數；不考慮假日與 skip_dates)。"""
+    try:
+        date = datetime.strptime(date_str, "%Y%m%d")
+    except (TypeError, ValueError):
+        return False
+    start = datetime.strptime(rule['start_date'], "%Y%m%d")
+    if date < start or (rule.get('end_date') and date > datetime.strptime(rule['end_date'], "%Y%m%d")):
+        return False
+    if date.weekday() != rule['weekday']:
+        return False
+    first = start + timedelta(days=(rule['weekday'] - start.weekday()) % 7)
+    return ((date - first).days // 7) % rule.get('interval', 1) == 0
+
+
+def expand_rule(rule: dict, year_month: str, holidays) -> list[dict]:
+    """將一條週期規則展開為指定月份的群組記錄。
+
+    Args:
+        rule (dict): 週期規則。
+        year_month (str): 目標年月 (YYYYMM)。
+        holidays: 提供 is_holiday 的物件 (HolidaySnapshot 或 HolidayService)，用於跳過假日。
+
+    Returns:
+        list[dict]: 與 DutyStore 群組記錄格式相同的記錄 (含 'rule_id')。
+
+    Raises:
+        ValueError: year_month 格式不正確或月份不在 1–12 時。
+    """
+    year, month = parse_year_month(year_month)
+    month_start = datetime(year, month, 1)
+    month_end = datetime(year, month, calendar.monthrange(year, month)[1])
+    start = datetime.strptime(rule['start_date'], "%Y%m%d")
+    end = datetime.strptime(rule['end_date'], "%Y%m%d") if rule.get('end_date') else None
+    if start > month_end or (end is not None and end < month_start):
+        return []
+
+    weekday = rule['weekday']
+    interval = rule.get('interval', 1)
+    first = start + timedelta(days=(weekday - start.weekday()) % 7) # 規則的第一次發生日
+    lower = max(first, month_start)
+    # 對齊到間隔週期內的發生日
+    weeks = -(-(lower - first).days // 7)
+    weeks += (-weeks) % interval
+    current = first + timedelta(weeks=weeks)
+
+    # skip_dates 內容可為 "YYYYMMDD" (整次跳過) 或 "YYYYMMDD:姓名" (該次只排除此成員)
+    skip_dates = set()
+    skipped_members = {}
+    for entry in rule.get('skip_dates') or []:
+        date_part, _, person = entry.partition(':')
+        if person:
+            skipped_members.setdefault(date_part, []).append(person)
+        else:
+            skip_dates.add(date_part)
+    occurrences = []
+    while current <= month_end and (end is None or current <= end):
+        date_str = current.strftime("%Y%m%d")
+        if date_str not in skip_dates and not (rule.get('skip_holidays', True) and holidays.is_holiday(date_str)):
+            occurrence = {
+                "id": f"{RULE_ID_PREFIX}{rule['id']}-{date_str}",
+                "dateTime": f"{date_str}{rule['time']}",
+                "hours": rule['hours'],
+                "persons": rule['persons'],
+                "reason": rule['reason'],
+                "rule_id": rule['id'],
+            }
+            exceptions = dict(rule.get('exceptions') or {})
+            for person in skipped_members.get(date_str, []):
+                exceptions[person] = dict(exceptions.get(person, {}), excluded=True)
+            if exceptions:
+                occurrence["exceptions"] = exceptions
+            occurrences.append(occurrence)
+        current += timedelta(weeks=interval)
+    return occurrences
+
+
+def parse_occurrence_id(duty_id: str) -> Optional[tuple[str, str]]:
+    """解析 "rule-<規則ID>-<YYYYMMDD>"，返回 (規則ID, 日期)；不是規則記錄時返回 None。"""
+    if not duty_id.startswith(RULE_ID_PREFIX):
+        return None
+    rule_id, _, date_str = duty_id[len(RULE_ID_PREFIX):].rpartition('-')
+    if not rule_id or len(date_str) != 8 or not date_str.isdigit():
+        return None
+    return rule_id, date_str
+
+
+class DutyRuleStore:
+    """週期性加班規則 (類似 RRULE：星期、間隔週數、日期範圍、假日跳過、成員)。
+
+    規則以精簡格式存放在 data/duties/rules.json，不會隨時間增加記錄；
+    只有在查詢某個月份時才展開，並依 (規則, 規則版本, 月份, 假日版本) 快取展開結果。
+    多個 worker 行程之間以 rules.json.lock 互斥寫入，讀取前依 rules.json.version 載入其他 worker 的修改。
+    """
+
+    def __init__(self, duties_dir: str):
+        self.rules_path = os.path.join(duties_dir, RULES_FILE_NAME)
+        self._write_lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._file_lock = InterProcessLock(f"{self.rules_path}.lock")
+        self._changes = ChangeLog(f"{self.rules_path}.version")
+        self._expansion_cache = {} # (rule_id, revision, YYYYMM, holiday_version) -> occurrences
+        self._cache_holiday_version = None
+        self._listeners = []
+        self._rules = self._read()
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.rules_path):
+            return {"next_id": 1, "rules": []}
+        with io_timer('duty_rules', 'read'), open(self.rules_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, data: dict):
+        """寫回規則檔並通知 (呼叫端必須持有 _write_lock 與 _file_lock)。"""
+        with io_timer('duty_rules', 'write'):
+            atomic_write_json(self.rules_path, data)
+        with self._sync_lock:
+            self._changes.bump()
+            self._replace(data)
+        self._notify(external=False)
+
+    def _replace(self, data: dict) -> None:
+        self._rules = data
+        # 只保留仍存在且版本相同的規則的展開結果
+        current = {(rule['id'], rule.get('revision', 1)) for rule in data['rules']}
+        self._expansion_cache = {key: value for key, value in self._expansion_cache.items()
+                                 if key[:2] in current}
+
+    def _notify(self, external: bool) -> None:
+        for listener, wants_external in self._listeners:
+            if external and not wants_external:
+                continue
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"週期規則變更通知失敗 ({listener}): {e}", exc_info=True)
+
+    def refresh(self) -> None:
+        """其他 worker 修改過規則時重新載入並通知。"""
+        with self._sync_lock:
+            if self._changes.poll() is None:
+                return
+            try:
+                self._replace(self._read())
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"重新載入其他 worker 修改的週期規則失敗: {e}", exc_info=True)
+                return
+        logger.info("週期規則已由其他 worker 更新，重新載入")
+        self._notify(external=True)
+
+    def subscribe(self, listener, external: bool = True) -> None:
+        """註冊規則變更通知 (不帶參數呼叫)；規則可能影響任意月份。
+
+        external 為 False 時不接收其他 worker 的修改 (見 HolidayStore.subscribe)。
+        """
+        self._listeners.append((listener, external))
+
+    def list_rules(self) -> list[dict]:
+        self.refresh()
+        return self._rules['rules']
+
+    def get(self, rule_id: str) -> Optional[dict]:
+        self.refresh()
+        return next((rule for rule in self._rules['rules'] if rule['id'] == rule_id), None)
+
+    def add(self, rule: dict) -> dict:
+        """新增規則 (呼叫端應先用 validate_rule 檢查)，返回含 id 與 revision 的規則。"""
+        with self._write_lock, self._file_lock:
+            self.refresh()
+            data = dict(self._rules)
+            new_rule = {"id": str(data['next_id']), "revision": 1, **rule}
+            data['next_id'] += 1
+            data['rules'] = data['rules'] + [new_rule]
+            self._write(data)
+            logger.info(f"新增週期規則 {new_rule['id']}: 每 {new_rule.get('interval', 1)} 週星期 {new_rule['weekday']} {new_rule['time']}")
+            return new_rule
+
+    def update(self, rule_id: str, changes: dict) -> Optional[dict]:
+        """更新規則欄位並遞增 revision (使舊的展開快取失效)；找不到時返回 None。"""
+        with self._write_lock, self._file_lock:
+            current = self.get(rule_id)
+            if current is None:
+                return None
+            updated = {**current, **{k: v for k, v in changes.items() if k in RULE_FIELDS},
+                       "revision": current.get('revision', 1) + 1}
+            data = dict(self._rules)
+            data['rules'] = [updated if rule['id'] == rule_id else rule for rule in data['rules']]
+            self._write(data)
+            return updated
+
+    def delete(self, rule_id: str) -> bool:
+        with self._write_lock, self._file_lock:
+            self.refresh()
+            data = dict(self._rules)
+            remaining = [rule for rule in data['rules'] if rule['id'] != rule_id]
+            if len(remaining) == len(data['rules']):
+                return False
+            data['rules'] = remaining
+            self._write(data)
+            return True
+
+    def skip_occurrence(self, rule_id: str, date_str: str, person: Optional[str] = None) -> bool:
+        """跳過規則在某一天的發生 (例如當週科會取消)；指定 person 時只排除該成員。
+
+        Returns:
+            bool: 規則不存在、該日不是規則的發生日或 person 不在規則成員中時返回 False (不寫入)。
+        """
+        with self._write_lock, self._file_lock: # 讀取與更新之間不讓其他 worker 修改同一條規則
+            self.refresh()
+            data = dict(self._rules)
+            rule = next((rule for rule in data['rules'] if rule['id'] == rule_id), None)
+            if rule is None or not is_occurrence(rule, date_str) or (person and person not in rule['persons']):
+                return False
+            entry = f"{date_str}:{person}" if person else date_str
+            updated = {**rule, "skip_dates": sorted(set(rule.get('skip_dates') or []) | {entry}),
+                       "revision": rule.get('revision', 1) + 1}
+            data['rules'] = [updated if item['id'] == rule_id else item for item in data['rules']]
+            self._write(data)
+            return True
+
+    def expand_month(self, year_month: str, holidays) -> list[dict]:
+        """展開所有規則在指定月份的發生記錄 (依規則與月份快取)。
+
+        Args:
+            year_month (str): 目標年月 (YYYYMM)。
+            holidays: HolidaySnapshot (需有 version 與 is_holiday)。
+
+        Raises:
+            ValueError: year_month 格式不正確或月份不在 1–12 時 (沒有任何規則時也會檢查)。
+        """
+        parse_year_month(year_month)
+        self.refresh()
+        occurrences = []
+        holiday_version = getattr(holidays, 'version', None)
+        if holiday_version != self._cache_holiday_version:
+            # 假日資料改版後，舊版本的展開結果不會再被使用
+            self._expansion_cache = {}
+            self._cache_holiday_version = holiday_version
+        for rule in self._rules['rules']:
+            key = (rule['id'], rule.get('revision', 1), year_month, holiday_version)
+            expanded = self._expansion_cache.get(key)
+            if expanded is None:
+                expanded = expand_rule(rule, year_month, holidays)
+                self._expansion_cache[key] = expanded
+            occurrences.extend(expanded)
+        return occurrences
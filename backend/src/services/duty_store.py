@@ -0,0 +1,632 @@
+import csv
+import json
+import os
+import re
+import threading
+import logging
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, Iterable, Iterator
+
+from .json_storage import atomic_write_json, atomic_write_many
+from .duty_rules import DutyRuleStore, EXCEPTION_FIELDS, validate_exceptions
+from .logging_setup import configure_logging
+from .metrics import io_timer
+from .shared_state import ChangeLog, InterProcessLock
+
+logger = logging.getLogger(__name__)
+
+DUTIES_DIR_NAME = 'duties'          # data/duties/YYYYMM.json
+MANIFEST_NAME = 'manifest.json'     # data/duties/manifest.json
+LEGACY_DUTIES_FILE = 'duties.json'  # 舊版單一檔案
+INVALID_PARTITION = 'invalid'       # dateTime 格式不正確的記錄
+MANIFEST_FORMAT = 1
+
+DUTY_FIELDS = ('dateTime', 'hours', 'person', 'reason')
+GROUP_ID_SEPARATOR = ':'                         # 展開後的成員記錄 ID: "<群組ID>:<姓名>"
+GROUP_EXCEPTION_FIELDS = EXCEPTION_FIELDS
+
+_YEAR_MONTH_RE = re.compile(r"^\d{6}$")
+
+
+def partition_key(date_time: str) -> str:
+    """由 dateTime (YYYYMMDDHHMM) 取得所屬分區 (YYYYMM)。"""
+    key = (date_time or '')[:6]
+    return key if _YEAR_MONTH_RE.match(key) else INVALID_PARTITION
+
+
+def is_partition_key(year_month: Optional[str]) -> bool:
+    """是否為合法的分區名稱 (YYYYMM 或 INVALID_PARTITION)；分區名稱會直接組成檔案路徑，不可含其他字元。"""
+    return isinstance(year_month, str) and (year_month == INVALID_PARTITION or bool(_YEAR_MONTH_RE.match(year_month)))
+
+
+def is_group(duty: dict) -> bool:
+    """是否為群組記錄 (同一事件、多位成員共用一筆記錄)。
+
+    群組記錄格式：
+        {"id", "dateTime", "hours", "reason", "persons": [...],
+         "exceptions": {"姓名": {"hours": 1.0, "reason": "...", "excluded": true}}}
+    """
+    return isinstance(duty.get('persons'), list)
+
+
+def member_view(group: dict, person: str) -> Optional[dict]:
+    """將群組記錄展開為單一成員的記錄 (套用個人例外)；該成員被排除時返回 None。"""
+    exception = (group.get('exceptions') or {}).get(person, {})
+    if exception.get('excluded'):
+        return None
+    return {
+        "id": f"{group['id']}{GROUP_ID_SEPARATOR}{person}",
+        "dateTime": group['dateTime'],
+        "hours": exception.get('hours', group['hours']),
+        "person": person,
+        "reason": exception.get('reason', group['reason']),
+        "group_id": group['id'],
+    }
+
+
+def expand_duties(records: Iterable[dict], person: Optional[str] = None) -> Iterator[dict]:
+    """逐筆產生個人記錄：一般記錄原樣返回，群組記錄依成員延遲展開。
+
+    Args:
+        records (Iterable[dict]): 分區中的原始記錄。
+        person (Optional[str]): 只產生該成員的記錄；None 表示展開所有成員。
+    """
+    for duty in records:
+        if not is_group(duty):
+            if person is None or duty.get('person') == person:
+                yield duty
+            continue
+        members = duty['persons'] if person is None else ([person] if person in duty['persons'] else [])
+        for member in members:
+            view = member_view(duty, member)
+            if view is not None:
+                yield view
+
+
+def validate_duty(duty: dict) -> list[str]:
+    """檢查一筆待新增的加班記錄 (一般或群組)，返回錯誤訊息列表 (空列表表示有效)。"""
+    errors = []
+    date_time = duty.get('dateTime')
+    if not isinstance(date_time, str) or not re.match(r"^\d{12}$", date_time):
+        errors.append(f"dateTime 格式錯誤 (應為 YYYYMMDDHHMM): {date_time}")
+    else:
+        try:
+            datetime.strptime(date_time, "%Y%m%d%H%M")
+        except ValueError:
+            errors.append(f"dateTime 不是有效的日期時間: {date_time}")
+    hours = duty.get('hours')
+    if isinstance(hours, bool) or not isinstance(hours, (int, float)) or not 0 < hours <= 24:
+        errors.append(f"hours 必須是 0 到 24 之間的數字: {hours}")
+    if is_group(duty) or 'persons' in duty:
+        errors.extend(_validate_group_fields(duty))
+    elif not isinstance(duty.get('person'), str) or not duty['person'].strip():
+        errors.append("person 不可為空")
+    if not isinstance(duty.get('reason'), str):
+        errors.append("reason 必須是字串")
+    return errors
+
+
+def _validate_group_fields(duty: dict) -> list[str]:
+    errors = []
+    persons = duty.get('persons')
+    if not isinstance(persons, list) or not persons:
+        return ["persons 必須是非空的成員列表"]
+    if any(not isinstance(person, str) or not person.strip() for person in persons):
+        errors.append("persons 不可包含空白姓名")
+    if len(set(persons)) != len(persons):
+        errors.append("persons 不可重複")
+    return errors + validate_exceptions(duty.get('exceptions'), persons)
+
+
+class DutyImportParser:
+    """逐行解析 CSV 或 JSONL 匯入資料。
+
+    CSV 第一行必須是欄位標頭 (dateTime,hours,person,reason)；JSONL 每行一個 JSON 物件。
+    解析器會保留標頭狀態，因此可以配合串流輸入逐行呼叫 `parse`。
+    """
+
+    def __init__(self, fmt: str):
+        if fmt not in ('csv', 'jsonl'):
+            raise ValueError(f"不支援的匯入格式: {fmt}")
+        self.fmt = fmt
+        self.header = None
+        self.line_no = 0
+
+    def parse(self, line: str) -> Optional[dict]:
+        """解析一行，返回加班記錄 dict；空白行或 CSV 標頭返回 None。
+
+        Raises:
+            ValueError: 該行格式錯誤時。
+        """
+        self.line_no += 1
+        line = line.strip().lstrip('\ufeff')
+        if not line:
+            return None
+
+        if self.fmt == 'jsonl':
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第 {self.line_no} 行 JSON 格式錯誤: {e}")
+            if not isinstance(record, dict):
+                raise ValueError(f"第 {self.line_no} 行必須是 JSON 物件")
+        else:
+            values = next(csv.reader([line]))
+            if self.header is None:
+                missing = [field for field in DUTY_FIELDS if field not in values]
+                if missing:
+                    raise ValueError(f"CSV 標頭缺少欄位: {missing}")
+                self.header = values
+                return None
+            if len(values) != len(self.header):
+                raise ValueError(f"第 {self.line_no} 行欄位數 ({len(values)}) 與標頭 ({len(self.header)}) 不符")
+            record = dict(zip(self.header, values))
+
+        try:
+            record['hours'] = float(record.get('hours'))
+        except (TypeError, ValueError):
+            raise ValueError(f"第 {self.line_no} 行 hours 不是數字: {record.get('hours')}")
+        record['dateTime'] = str(record.get('dateTime', ''))
+        return {field: record.get(field) for field in DUTY_FIELDS}
+
+
+class DutyStore:
+    """依月份分區的加班記錄儲存。
+
+    目錄結構：
+        data/duties/manifest.json   # {"format": 1, "next_id": N, "months": {"YYYYMM": 筆數}}
+        data/duties/202504.json     # 該月份的記錄陣列 (格式與舊版 duties.json 相同)
+
+    月份查詢與報表產生只讀取單一分區；新增或刪除只重寫一個小分區與 manifest。
+    第一次使用時若沒有 manifest 但存在舊版 duties.json，會自動遷移。
+
+    多個 worker 行程共用同一個目錄：寫入以 manifest.json.lock 互斥，並在 manifest.json.version
+    記錄每次寫入的月份；其他 worker 在讀取 manifest 或寫入前載入這些變更 (見 `refresh`)。
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(DutyStore, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, data_dir: str, legacy_file: Optional[str] = None):
+        if self._initialized:
+            return
+
+        self.data_dir = data_dir
+        self.duties_dir = os.path.join(data_dir, DUTIES_DIR_NAME)
+        self.manifest_path = os.path.join(self.duties_dir, MANIFEST_NAME)
+        self.legacy_file = legacy_file or os.path.join(data_dir, LEGACY_DUTIES_FILE)
+        self._write_lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._partition_cache = {} # YYYYMM -> ((inode, mtime_ns), records)
+        self._id_index = None      # id -> YYYYMM，第一次需要時才建立
+        self._listeners = []       # 分區寫入後的通知對象 (listener, 是否接收其他 worker 的寫入)
+
+        os.makedirs(self.duties_dir, exist_ok=True)
+        self._file_lock = InterProcessLock(f"{self.manifest_path}.lock")
+        self._changes = ChangeLog(f"{self.manifest_path}.version")
+        with self._file_lock: # 多個 worker 同時啟動時只遷移一次
+            if not os.path.exists(self.manifest_path) and os.path.exists(self.legacy_file):
+                logger.info(f"找不到分區 manifest，從舊版檔案遷移: {self.legacy_file}")
+                self.migrate_from_single_file(self.legacy_file)
+            self._manifest = self._read_manifest()
+        self.rules = DutyRuleStore(self.duties_dir) # 週期規則，查詢月份時才展開
+        logger.info(f"加班記錄分區目錄: {self.duties_dir} ({len(self._manifest['months'])} 個月份)")
+        self._initialized = True
+
+    # --- manifest ---
+    def _read_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {"format": MANIFEST_FORMAT, "next_id": 1, "months": {}}
+        with io_timer('duties', 'read'), open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: dict):
+        with io_timer('duties', 'write'):
+            atomic_write_json(self.manifest_path, manifest)
+        self._manifest = manifest
+
+    def months(self) -> list[str]:
+        """返回有資料的月份分區 (已排序)。"""
+        self.refresh()
+        return sorted(self._manifest['months'])
+
+    def partition_path(self, year_month: str) -> str:
+        """
+        Raises:
+            ValueError: year_month 不是 YYYYMM (或 INVALID_PARTITION) 時，避免組出 duties 目錄以外的路徑。
+        """
+        if not is_partition_key(year_month):
+            raise ValueError(f"無效的月份分區: {year_month!r}")
+        return os.path.join(self.duties_dir, f"{year_month}.json")
+
+    def subscribe(self, listener, external: bool = True) -> None:
+        """註冊分區變更通知。
+
+        每次寫入成功後以 `{YYYYMM: (修改前記錄, 修改後記錄)}` 呼叫 listener；
+        未修改的記錄在前後列表中是同一個物件，可用 identity 找出新增與移除的記錄。
+        其他 worker 的寫入在本行程發現時通知，本行程沒有修改前的記錄，因此修改前記錄為 None；
+        external 為 False 時不接收這類通知 (見 HolidayStore.subscribe)。
+        """
+        self._listeners.append((listener, external))
+
+    def _notify(self, changes: dict, external: bool = False) -> None:
+        for listener, wants_external in self._listeners:
+            if external and not wants_external:
+                continue
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"加班記錄變更通知失敗 ({listener}): {e}", exc_info=True)
+
+    # --- 遷移 ---
+    def refresh(self) -> None:
+        """載入其他 worker 的寫入：重新讀取 manifest、捨棄變更月份的快取並通知 (包括週期規則)。"""
+        self.rules.refresh()
+        with self._sync_lock:
+            changed = self._changes.poll()
+            if changed is None:
+                return
+            _, months = changed
+            previous_months = set(self._manifest['months'])
+            self._manifest = self._read_manifest()
+            self._id_index = None
+            if months is None:
+                months = previous_months | set(self._manifest['months'])
+                self._partition_cache.clear()
+            for year_month in months:
+                self._partition_cache.pop(year_month, None)
+        logger.info(f"加班記錄已由其他 worker 更新: {sorted(months)}")
+        self._notify({year_month: (None, self.load_month(year_month)) for year_month in sorted(months)}, external=True)
+
+    def migrate_from_single_file(self, legacy_file: str) -> int:
+        """將舊版單一 duties.json 拆分為月份分區。
+
+        舊檔案不會被刪除或修改。
+
+        Returns:
+            int: 遷移的記錄筆數。
+        """
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            all_duties = json.load(f)
+
+        partitions = defaultdict(list)
+        max_id = 0
+        for duty in all_duties:
+            key = partition_key(duty.get('dateTime', ''))
+            if key == INVALID_PARTITION:
+                logger.warning(f"dateTime 格式不正確，記錄放入 {INVALID_PARTITION} 分區: {duty}")
+            partitions[key].append(duty)
+            try:
+                max_id = max(max_id, int(duty.get('id', '0')))
+            except ValueError:
+                continue
+
+        with self._write_lock, self._file_lock:
+            for key, records in partitions.items():
+                atomic_write_json(self.partition_path(key), records)
+            self._write_manifest({
+                "format": MANIFEST_FORMAT,
+                "next_id": max_id + 1,
+                "months": {key: len(records) for key, records in sorted(partitions.items())}
+            })
+            with self._sync_lock:
+                self._changes.bump()
+                self._partition_cache.clear()
+                self._id_index = None
+
+        logger.info(f"已將 {len(all_duties)} 筆加班記錄遷移為 {len(partitions)} 個月份分區: {self.duties_dir}")
+        return len(all_duties)
+
+    # --- 讀取 ---
+    def load_month(self, year_month: str) -> list[dict]:
+        """載入單一月份分區的記錄 (分區不存在時返回空列表)。
+
+        返回的列表為快取內容，呼叫端不應修改。
+
+        Raises:
+            ValueError: year_month 不是 YYYYMM (或 INVALID_PARTITION) 時。
+        """
+        path = self.partition_path(year_month)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return []
+
+        # 分區以 rename 替換，inode 一定改變；mtime 的精度不足以區分其他 worker 的連續寫入
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        cached = self._partition_cache.get(year_month)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with io_timer('duties', 'read'), open(path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        self._partition_cache[year_month] = (signature, records)
+        return records
+
+    def load_month_with_rules(self, year_month: str, holidays) -> list[dict]:
+        """載入單一月份分區，並附加週期規則在該月份展開的群組記錄。
+
+        Args:
+            year_month (str): 目標年月 (YYYYMM)。
+            holidays: HolidaySnapshot，用於規則的假日跳過與快取版本。
+        """
+        return self.load_month(year_month) + self.rules.expand_month(year_month, holidays)
+
+    def load_months(self, year_months: Iterable[str]) -> list[dict]:
+        """依序載入多個月份分區的記錄。"""
+        records = []
+        for year_month in year_months:
+            records.extend(self.load_month(year_month))
+        return records
+
+    def load_all(self) -> list[dict]:
+        """載入所有分區的記錄 (依月份排序)。"""
+        return self.load_months(self.months())
+
+    def _build_id_index(self) -> dict:
+        if self._id_index is None:
+            self._id_index = {duty.get('id'): year_month
+                              for year_month in self.months()
+                              for duty in self.load_month(year_month)}
+        return self._id_index
+
+    # --- 寫入 ---
+    def apply_batch(self, creates: Iterable[dict] = (), deletes: Iterable[tuple] = ()) -> tuple[list[dict], list[str]]:
+        """以單次寫入套用一批新增與刪除。
+
+        每個受影響的分區只重寫一次，所有檔案先寫成暫存檔、最後才 rename (manifest 最後)。
+        呼叫端應先用 `validate_duty` 檢查整批新增資料。
+
+        Args:
+            creates (Iterable[dict]): 不含 id 的加班記錄。
+            deletes (Iterable[tuple]): (duty_id, year_month 提示或 None) 的序列。
+
+        Returns:
+            tuple[list[dict], list[str]]: (新增的完整記錄, 找不到的 ID)。
+                若有找不到的 ID，整批都不會寫入。
+
+        Raises:
+            ValueError: 刪除的月份提示不是 YYYYMM 時 (整批都不會寫入)。
+        """
+        deletes = list(deletes)
+        invalid = [year_month for _, year_month in deletes if year_month and not _YEAR_MONTH_RE.match(year_month)]
+        if invalid:
+            raise ValueError(f"無效的月份提示: {', '.join(map(repr, invalid))}")
+        with self._write_lock, self._file_lock:
+            self.refresh() # 其他 worker 可能已新增記錄 (next_id) 或修改相同分區
+            touched = {}   # YYYYMM -> 修改後的記錄列表
+            originals = {} # YYYYMM -> 修改前的記錄列表
+
+            def partition(year_month: str) -> list[dict]:
+                if year_month not in touched:
+                    originals[year_month] = self.load_month(year_month)
+                    touched[year_month] = list(originals[year_month])
+                return touched[year_month]
+
+            # 1. 刪除：優先使用月份提示，找不到才查 ID 索引
+            missing = []
+            deleted = []
+            for duty_id, year_month in deletes:
+                # "<群組ID>:<姓名>" 表示只把該成員從群組中排除
+                record_id, _, person = duty_id.partition(GROUP_ID_SEPARATOR)
+                found = None
+                if year_month and any(duty.get('id') == record_id for duty in partition(year_month)):
+                    found = year_month
+                else:
+                    indexed = self._build_id_index().get(record_id)
+                    if indexed and any(duty.get('id') == record_id for duty in partition(indexed)):
+                        found = indexed
+                if found is None:
+                    missing.append(duty_id)
+                    continue
+
+                if person:
+                    group = next(duty for duty in touched[found] if duty.get('id') == record_id)
+                    if not is_group(group) or person not in group['persons'] or member_view(group, person) is None:
+                        missing.append(duty_id)
+                        continue
+                    exceptions = dict(group.get('exceptions') or {})
+                    exceptions[person] = dict(exceptions.get(person, {}), excluded=True)
+                    replacement = dict(group, exceptions=exceptions)
+                    # 所有成員都被排除時，整筆群組記錄一併刪除
+                    if not any(member_view(replacement, member) for member in replacement['persons']):
+                        replacement = None
+                else:
+                    replacement = None
+                touched[found] = [
+                    (replacement if duty.get('id') == record_id else duty)
+                    for duty in touched[found]
+                    if duty.get('id') != record_id or replacement is not None
+                ]
+                deleted.append(duty_id)
+            if missing:
+                return [], missing
+
+            # 2. 新增：依序分配遞增 ID
+            next_id = self._manifest['next_id']
+            created = []
+            for duty in creates:
+                new_duty = {"id": str(next_id), **duty}
+                next_id += 1
+                partition(partition_key(new_duty.get('dateTime', ''))).append(new_duty)
+                created.append(new_duty)
+
+            if not touched:
+                return created, []
+
+            # 3. 單次寫入：所有分區 + manifest
+            manifest = dict(self._manifest, next_id=next_id)
+            manifest['months'] = dict(manifest['months'])
+            files = {}
+            emptied = []
+            for year_month, records in touched.items():
+                if records:
+                    files[self.partition_path(year_month)] = records
+                    manifest['months'][year_month] = len(records)
+                else:
+                    emptied.append(year_month)
+                    manifest['months'].pop(year_month, None)
+            manifest['months'] = dict(sorted(manifest['months'].items()))
+            files[self.manifest_path] = manifest
+            with io_timer('duties', 'write'):
+                atomic_write_many(files)
+            for year_month in emptied:
+                if os.path.exists(self.partition_path(year_month)):
+                    os.unlink(self.partition_path(year_month))
+
+            with self._sync_lock:
+                self._changes.bump(touched)
+                self._manifest = manifest
+                for year_month in touched:
+                    self._partition_cache.pop(year_month, None)
+                if self._id_index is not None:
+                    for duty_id in deleted:
+                        if GROUP_ID_SEPARATOR not in duty_id:
+                            self._id_index.pop(duty_id, None)
+                    for duty in created:
+                        self._id_index[duty['id']] = partition_key(duty.get('dateTime', ''))
+
+            logger.info(f"批次寫入完成: 新增 {len(created)} 筆、刪除 {len(deleted)} 筆，重寫 {len(touched)} 個分區")
+            self._notify({year_month: (originals[year_month], records) for year_month, records in touched.items()})
+            return created, []
+
+    def compact_groups(self, year_months: Optional[Iterable[str]] = None) -> int:
+        """把同一事件的重複個人記錄 (dateTime、hours、reason 相同，只差 person) 合併為群組記錄。
+
+        群組記錄分配新的 ID (舊資料中存在重複 ID，不能沿用)，並放在原第一筆記錄的位置。
+        所有受影響的分區以單次寫入更新。
+
+        Args:
+            year_months (Optional[Iterable[str]]): 要整理的月份；None 表示全部月份。
+
+        Returns:
+            int: 減少的記錄筆數。
+        """
+        with self._write_lock, self._file_lock:
+            self.refresh()
+            files = {}
+            manifest = dict(self._manifest)
+            manifest['months'] = dict(manifest['months'])
+            next_id = manifest['next_id']
+            saved = 0
+            changes = {}
+            for year_month in (year_months if year_months is not None else self.months()):
+                records = self.load_month(year_month)
+                events = defaultdict(list) # (dateTime, hours, reason) -> 記錄索引
+                for index, duty in enumerate(records):
+                    if not is_group(duty):
+                        events[(duty.get('dateTime'), duty.get('hours'), duty.get('reason'))].append(index)
+
+                replacements = {} # 記錄索引 -> 群組記錄 (None 表示移除)
+                for indexes in events.values():
+                    persons = [records[index].get('person') for index in indexes]
+                    if len(indexes) < 2 or len(set(persons)) != len(persons):
+                        continue
+                    first = records[indexes[0]]
+                    replacements[indexes[0]] = {
+                        "id": str(next_id),
+                        "dateTime": first['dateTime'],
+                        "hours": first['hours'],
+                        "persons": persons,
+                        "reason": first['reason'],
+                    }
+                    next_id += 1
+                    for index in indexes[1:]:
+                        replacements[index] = None
+
+                if not replacements:
+                    continue
+                compacted = [replacements.get(index, duty) for index, duty in enumerate(records)
+                             if replacements.get(index, duty) is not None]
+                saved += len(records) - len(compacted)
+                files[self.partition_path(year_month)] = compacted
+                changes[year_month] = (records, compacted)
+                manifest['months'][year_month] = len(compacted)
+
+            if files:
+                manifest['next_id'] = next_id
+                files[self.manifest_path] = manifest
+                with io_timer('duties', 'write'):
+                    atomic_write_many(files)
+                with self._sync_lock:
+                    self._changes.bump(changes)
+                    self._manifest = manifest
+                    self._partition_cache.clear()
+                    self._id_index = None
+                self._notify(changes)
+            logger.info(f"群組整理完成: 減少 {saved} 筆記錄，重寫 {max(len(files) - 1, 0)} 個分區")
+            return saved
+
+    def add(self, duty: dict) -> dict:
+        """新增一筆加班記錄，自動分配遞增 ID。
+
+        Args:
+            duty (dict): 不含 id 的加班記錄 (dateTime, hours, person, reason)。
+
+        Returns:
+            dict: 含新 ID 的完整記錄。
+        """
+        created, _ = self.apply_batch(creates=[duty])
+        return created[0]
+
+    def delete(self, duty_id: str, year_month: Optional[str] = None) -> bool:
+        """刪除指定 ID 的加班記錄。
+
+        Args:
+            duty_id (str): 記錄 ID。
+            year_month (Optional[str]): 記錄所屬月份的提示；提供時只會讀取該分區。
+
+        Returns:
+            bool: 找到並刪除返回 True，否則 False。
+
+        Raises:
+            ValueError: year_month 格式不正確時。
+        """
+        _, missing = self.apply_batch(deletes=[(duty_id, year_month)])
+        return not missing
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='將 data/duties.json 遷移為依月份分區的儲存格式。')
+    parser.add_argument('--data-dir', type=str, default=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data')),
+                        help='data 目錄路徑')
+    parser.add_argument('--source', type=str, help='舊版 duties.json 路徑，預設為 <data-dir>/duties.json')
+    parser.add_argument('--force', action='store_true', help='分區已存在時仍重新遷移 (會覆蓋現有分區)')
+    parser.add_argument('--import-file', type=str, help='匯入 (回填) 歷史記錄的 CSV 或 JSONL 檔案')
+    parser.add_argument('--format', type=str, choices=['csv', 'jsonl'], help='匯入檔案格式，預設依副檔名判斷')
+    parser.add_argument('--compact-groups', action='store_true', help='將同一事件的重複個人記錄合併為群組記錄')
+    args = parser.parse_args()
+
+    configure_logging()
+    source = args.source or os.path.join(args.data_dir, LEGACY_DUTIES_FILE)
+    already_migrated = os.path.exists(os.path.join(args.data_dir, DUTIES_DIR_NAME, MANIFEST_NAME))
+    store = DutyStore(args.data_dir, legacy_file=source) # 沒有 manifest 時會自動遷移
+    if already_migrated and args.force:
+        store.migrate_from_single_file(source)
+    elif already_migrated and not (args.import_file or args.compact_groups):
+        print(f"Partitions already exist under {store.duties_dir}; use --force to re-migrate from {source}")
+
+    if args.import_file:
+        import_format = args.format or ('jsonl' if args.import_file.endswith(('.jsonl', '.ndjson')) else 'csv')
+        import_parser = DutyImportParser(import_format)
+        batch = []
+        with open(args.import_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                duty = import_parser.parse(line)
+                if duty is None:
+                    continue
+                errors = validate_duty(duty)
+                if errors:
+                    raise SystemExit(f"Line {import_parser.line_no}: {'; '.join(errors)}")
+                batch.append(duty)
+        created, _ = store.apply_batch(creates=batch)
+        print(f"Imported {len(created)} duties from {args.import_file}")
+
+    if args.compact_groups:
+        print(f"Compacted group duties, {store.compact_groups()} records removed")
+    print(f"{len(store.load_all())} duties in {len(store.months())} partitions under {store.duties_dir}")
@@ -0,0 +1,259 @@
+import abc
+import json
+import os
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from .calendar_governor import CalendarFetchError, CalendarGovernor, shared_governor
+from .google_transport import HttpPool, http_factory, pool_size_from_env
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
+EVENT_SOURCE_ENV = 'CALENDAR_EVENT_SOURCE' # "google" (預設)、"snapshot:<檔案>"、"fake:<網址>"、"synthetic"
+
+
+def load_google_client():
+    """匯入 Google API 用戶端模組 (約數百毫秒)，第一次真正呼叫 Calendar API 或背景預熱時才執行。
+
+    Returns:
+        tuple: (httplib2, service_account, build, HttpError)。
+    """
+    import httplib2
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
+    return httplib2, service_account, build, HttpError
+
+
+class EventSource(abc.ABC):
+    """行事曆事件來源。
+
+    報表流程只透過 `list_events` 取得事件，因此可以替換為離線的快照或本機假伺服器，
+    在沒有 Google 帳號的環境下進行測試與效能量測。
+    """
+
+    def prepare(self) -> None:
+        """在處理第一位成員前呼叫，可用於建立連線或檢查憑證。"""
+
+    def close(self) -> None:
+        """釋放事件來源持有的連線 (伺服器停止時呼叫)。"""
+
+    @abc.abstractmethod
+    def list_events(self, calendar_id: str, time_min: str, time_max: str, member_name: str = '') -> list[dict]:
+        """返回 [time_min, time_max) 範圍內的事件 (格式與 Google Calendar events.list 的 items 相同)。
+
+        Args:
+            calendar_id (str): 日曆 ID。
+            time_min (str): RFC3339 起始時間。
+            time_max (str): RFC3339 結束時間。
+            member_name (str): 成員姓名，只用於日誌。
+
+        Raises:
+            CalendarFetchError: 無法取得事件時 (不可返回空列表代替，否則報表會少掉標準班次)。
+        """
+
+
+class GoogleCalendarEventSource(EventSource):
+    """透過 googleapiclient 呼叫 Google Calendar API。
+
+    指定 `api_endpoint` 時改為連到相容的 HTTP 伺服器 (例如 FakeCalendarServer)，
+    不需要服務帳號金鑰，其餘程式路徑與正式環境相同。
+
+    每個請求都經過 CalendarGovernor (限速、重試與斷路)。httplib2.Http 不是執行緒安全的，
+    因此服務物件共用，每個請求從 HttpPool 借一個 keep-alive 連線送出，可以併發擷取多位成員，
+    並在之後的成員與報表執行中沿用已建立的連線。
+    """
+
+    def __init__(self, service_account_file: Optional[str] = None, api_endpoint: Optional[str] = None,
+                 governor: Optional[CalendarGovernor] = None):
+        self.service_account_file = service_account_file
+        self.api_endpoint = api_endpoint
+        self.governor = governor or shared_governor()
+        self._service = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_service(self):
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._service = self._build_service()
+        return self._service
+
+    def _build_service(self):
+        """建立 API 服務與連線池 (服務只用來組成請求，請求一律以連線池中的 Http 送出)。"""
+        httplib2, service_account, build, _ = load_google_client()
+        if self.api_endpoint:
+            logger.info(f"使用相容的 Calendar API 端點: {self.api_endpoint}")
+            self._pool = HttpPool(http_factory(httplib2), pool_size_from_env())
+            return build('calendar', 'v3', http=httplib2.Http(), static_discovery=True,
+                         client_options={'api_endpoint': self.api_endpoint})
+
+        if not self.service_account_file or not os.path.exists(self.service_account_file):
+            logger.error(f"錯誤：找不到服務帳號金鑰檔案 {self.service_account_file}。")
+            raise FileNotFoundError(f"找不到 {self.service_account_file}")
+        creds = service_account.Credentials.from_service_account_file(self.service_account_file, scopes=SCOPES)
+        logger.info(f"成功從 {self.service_account_file} 載入服務帳號憑證。")
+        self._pool = HttpPool(http_factory(httplib2, creds), pool_size_from_env())
+        service = build('calendar', 'v3', credentials=creds)
+        logger.info("Google Calendar API 服務建立成功 (使用服務帳號)。")
+        return service
+
+    def _execute(self, request):
+        with self._pool.connection() as http:
+            return request.execute(http=http)
+
+    def prepare(self) -> None:
+        """預先建立 API 服務 (憑證錯誤會在此時拋出，而不是處理到第一位成員時才發現)。"""
+        self._get_service()
+
+    def close(self) -> None:
+        """關閉連線池中的閒置連線。"""
+        if self._pool is not None:
+            self._pool.close()
+
+    def list_events(self, calendar_id: str, time_min: str, time_max: str, member_name: str = '') -> list[dict]:
+        logger.info(f"正在為 [{member_name}] ({calendar_id}) 獲取 {time_min} 到 {time_max} 的事件...")
+        service = self._get_service()
+        events = []
+        page_token = None
+        page = 0
+        try:
+            while True:
+                page += 1
+                request = service.events().list(
+                    calendarId=calendar_id, timeMin=time_min, timeMax=time_max,
+                    singleEvents=True, orderBy='startTime', pageToken=page_token
+                )
+                events_result = self.governor.execute(lambda: self._execute(request),
+                                                      f"[{member_name}] ({calendar_id}) 第 {page} 頁")
+                events.extend(events_result.get('items', []))
+                page_token = events_result.get('nextPageToken')
+                if not page_token:
+                    break
+        except CalendarFetchError as error:
+            logger.error(f"為 [{member_name}] ({calendar_id}) 獲取事件失敗: {error}")
+            if error.status == 404:
+                logger.warning(f"[{member_name}] - 日曆 ID 可能無效或無權限訪問: {calendar_id}")
+            elif error.status == 403 and not error.retryable:
+                 logger.warning(f"[{member_name}] - 權限不足 (Forbidden)，請檢查服務帳號是否已共享日曆並具有讀取權限: {calendar_id}")
+            raise
+        logger.info(f"成功為 [{member_name}] 在指定範圍內獲取 {len(events)} 個事件。")
+        return events
+
+
+def parse_event_time(value: dict) -> Optional[datetime]:
+    """將事件的 start/end ({"dateTime"} 或全天 {"date"}) 轉為 UTC datetime；格式錯誤時返回 None。"""
+    try:
+        if 'dateTime' in value:
+            parsed = datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        elif 'date' in value:
+            parsed = datetime.strptime(value['date'], "%Y-%m-%d")
+        else:
+            return None
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def events_in_range(events: Iterable[dict], time_min: str, time_max: str) -> list[dict]:
+    """依 Calendar API 的規則篩選事件：結束時間晚於 time_min 且開始時間早於 time_max，依開始時間排序。"""
+    lower = parse_event_time({'dateTime': time_min})
+    upper = parse_event_time({'dateTime': time_max})
+    selected = []
+    for event in events:
+        start = parse_event_time(event.get('start', {}))
+        end = parse_event_time(event.get('end', {})) or start
+        if start is None:
+            continue
+        if (upper is None or start < upper) and (lower is None or end > lower):
+            selected.append((start, event))
+    selected.sort(key=lambda item: item[0])
+    return [event for _, event in selected]
+
+
+class SnapshotEventSource(EventSource):
+    """從 JSONL 快照重播事件。
+
+    每行格式為 {"calendar_id": "...", "events": [...]}；同一日曆可以出現在多行 (事件會合併)。
+    查詢時依時間範圍篩選，因此用單月份錄製的快照也能重播範圍查詢。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._events = {} # calendar_id -> 事件列表
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._events.setdefault(record['calendar_id'], []).extend(record.get('events', []))
+        logger.info(f"已載入事件快照 {path}: {len(self._events)} 個日曆")
+
+    def list_events(self, calendar_id: str, time_min: str, time_max: str, member_name: str = '') -> list[dict]:
+        return events_in_range(self._events.get(calendar_id, []), time_min, time_max)
+
+
+def record_snapshot(source: EventSource, members: dict, time_min: str, time_max: str, path: str) -> int:
+    """從任一事件來源錄製 JSONL 快照 (每位成員一行)，返回錄製的事件數。"""
+    total = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for member in members.values():
+            calendar_id = member.get('calendar_id')
+            if not calendar_id:
+                continue
+            events = source.list_events(calendar_id, time_min, time_max, member.get('name', ''))
+            total += len(events)
+            f.write(json.dumps({"calendar_id": calendar_id, "events": events}, ensure_ascii=False) + '\n')
+    logger.info(f"已錄製 {len(members)} 位成員、{total} 個事件到 {path}")
+    return total
+
+
+_api_sources = {} # (種類, 端點或金鑰檔) -> GoogleCalendarEventSource
+_sources_lock = threading.Lock()
+
+
+def event_source_from_env(service_account_file: str) -> EventSource:
+    """依環境變數 CALENDAR_EVENT_SOURCE 建立事件來源。
+
+    - 未設定或 "google": Google Calendar API (使用服務帳號)。
+    - "snapshot:<檔案路徑>": 從 JSONL 快照重播。
+    - "fake:<網址>": 連到本機假 Calendar 伺服器 (python -m src.services.fake_calendar)。
+    - "synthetic": 在行程內產生合成事件 (不經過 HTTP)。
+
+    連到 Calendar API 的事件來源 (google、fake) 依設定快取重複使用，
+    之後的報表執行沿用同一個 API 服務與連線池，不必重新建立服務與 TLS 連線。
+    """
+    spec = os.environ.get(EVENT_SOURCE_ENV, 'google')
+    kind, _, argument = spec.partition(':')
+    if kind == 'snapshot':
+        return SnapshotEventSource(argument)
+    if kind == 'synthetic':
+        from .fake_calendar import SyntheticEventSource # fake_calendar 依賴本模組，於此延遲匯入
+        return SyntheticEventSource()
+    if kind not in ('google', 'fake'):
+        raise ValueError(f"未知的 {EVENT_SOURCE_ENV}: {spec}")
+    key = (kind, argument if kind == 'fake' else service_account_file)
+    with _sources_lock:
+        source = _api_sources.get(key)
+        if source is None:
+            if kind == 'fake':
+                source = GoogleCalendarEventSource(api_endpoint=argument)
+            else:
+                source = GoogleCalendarEventSource(service_account_file=service_account_file)
+            _api_sources[key] = source
+    return source
+
+
+def close_event_sources() -> None:
+    """關閉所有快取的 Calendar API 事件來源的連線 (伺服器停止時呼叫)。"""
+    with _sources_lock:
+        sources = list(_api_sources.values())
+        _api_sources.clear()
+    for source in sources:
+        source.close()
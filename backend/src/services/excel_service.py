@@ -4,8 +4,12 @@ import datetime # 改回舊版匯入
 # from app.utils import western_to_roc_year # 移除錯誤的匯入
 import logging
 import os # 新增匯入 os
+import time
 from openpyxl.styles import Alignment, Font, Border, Side
 
+from .logging_setup import sample_debug
+from .metrics import observe_stage
+
 # --- 設定 ---
 # TEMPLATE_PATH = 'data/templates/VSduty_template.xlsx' # 改回舊版模板路徑
 # TEMPLATE_PATH = 'data/VSduty_template.xlsx' # 使用者確認此路徑正確
@@ -13,7 +17,6 @@ TEMPLATE_PATH = 'VSduty_template.xlsx' # 僅使用文件名，將在初始化時
 # OUTPUT_DIR = 'data/output/' # 更新輸出目錄 - 保留新版的相對路徑處理和目錄建立
 OUTPUT_DIR = 'output' # 僅使用目錄名，將在初始化時計算完整路徑
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [%(funcName)s] - %(message)s')
 logger = logging.getLogger(__name__)
 
 # --- 直接定義所需的函數 ---
@@ -96,7 +99,7 @@ class ExcelService:
             
         logger.info(f"最終使用的輸出目錄路徑: {self.output_dir}")
 
-    def generate_excel(self, member_info: dict, duties: list[dict], year_month: str) -> tuple[str, str]:
+    def generate_excel(self, member_info: dict, duties: list[dict], year_month: str, holiday_version: int = None) -> tuple[str, str]:
         """根據成員資訊和值班記錄產生 Excel 檔案 (使用舊版邏輯)。
 
         Args:
@@ -104,6 +107,7 @@ class ExcelService:
             duties (list[dict]): 包含值班記錄的列表，每個記錄是一個字典，
                                 包含 'date', 'weekday', 'start', 'end', 'work_hours', 'reason'。
             year_month (str): 年月字串 (YYYYMM)。
+            holiday_version (int): 產生此報表時使用的假日資料版本，會寫入活頁簿屬性。
 
         Returns:
             tuple[str, str]: 包含產生的檔案路徑和用於下載的相對 URL 的元組。
@@ -116,6 +120,7 @@ class ExcelService:
         output_path = os.path.join(self.output_dir, filename)
 
         try:
+            render_started = time.perf_counter()
             # 載入模板
             workbook = load_workbook(self.template_path)
             sheet = workbook.active
@@ -123,7 +128,7 @@ class ExcelService:
             # --- 處理合併儲存格 (保留新版邏輯) ---
             merged_ranges = list(sheet.merged_cells.ranges)
             for merged_range in merged_ranges:
-                logger.debug(f"Unmerging range: {merged_range}")
+                sample_debug(logger, "Unmerging range: %s", merged_range)
                 sheet.unmerge_cells(str(merged_range))
             # --------------------------
 
@@ -154,7 +159,7 @@ class ExcelService:
 
             # --- 重新合併儲存格 (保留新版邏輯) ---
             for merged_range in merged_ranges:
-                 logger.debug(f"Re-merging range: {merged_range}")
+                 sample_debug(logger, "Re-merging range: %s", merged_range)
                  sheet.merge_cells(str(merged_range))
             # --------------------------
 
@@ -178,8 +183,15 @@ class ExcelService:
             logger.info("已取消 A1、D1、G1、J1 的粗體字")
             # --------------------------
 
-            # 儲存檔案
+            # 記錄此報表使用的假日資料版本
+            if holiday_version is not None:
+                workbook.properties.keywords = f"holiday_version={holiday_version}"
+
+            # 儲存檔案 (載入模板到填寫完成計為 excel_render，寫入磁碟計為 excel_save)
+            save_started = time.perf_counter()
+            observe_stage('excel_render', save_started - render_started)
             workbook.save(output_path)
+            observe_stage('excel_save', time.perf_counter() - save_started)
             logger.info(f"Excel file generated: {output_path}")
 
             # 生成相對 URL (與舊版一致)
@@ -294,7 +306,8 @@ class ExcelService:
 
         ws.cell(row=row, column=10, value=duty.get('reason', '')) # J 欄: 事由
 
-        logger.debug(f"已填寫第 {row} 行: 日期={formatted_date}, 時間={ws.cell(row=row, column=3).value}, 總時數={total_hours}, 事由={duty.get('reason', '')}")
+        sample_debug(logger, "已填寫第 %s 行: 日期=%s, 時間=%s, 總時數=%s, 事由=%s",
+                     row, formatted_date, ws.cell(row=row, column=3).value, total_hours, duty.get('reason', ''))
 
     def _set_totals(self, ws, totals):
         """填寫總計列 (舊版邏輯，第 20 列)"""
@@ -0,0 +1,237 @@
+import json
+import random
+import threading
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import urlparse, parse_qs, unquote
+
+from .event_sources import EventSource, parse_event_time
+from .logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+SYNTHETIC_CALENDAR_DOMAIN = 'synthetic.calendar.local'
+
+
+def synthetic_members(count: int) -> dict:
+    """產生合成的成員資料 (格式與 members.json 的 calendars 項目相同)，以成員 ID 為鍵。"""
+    members = {}
+    for index in range(1, count + 1):
+        member_id = f"S{index:04d}"
+        members[member_id] = {
+            "id": member_id,
+            "name": f"合成成員{index:04d}",
+            "employee_id": f"9{index:04d}",
+            "calendar_id": f"{member_id.lower()}@{SYNTHETIC_CALENDAR_DOMAIN}",
+        }
+    return members
+
+
+def synthetic_events(calendar_id: str, time_min: str, time_max: str,
+                     duty_probability: float = 0.2, seed: int = 0) -> list[dict]:
+    """為日曆產生範圍內的合成值班事件 (依日曆與日期決定，相同參數永遠得到相同結果)。
+
+    約 duty_probability 比例的日子有一個全天值班事件，其中少數改為有時間的事件，
+    偶爾同一天會有重複的事件 (用來涵蓋報表的重複日期處理)。
+    """
+    lower = parse_event_time({'dateTime': time_min})
+    upper = parse_event_time({'dateTime': time_max})
+    if lower is None or upper is None:
+        return []
+    events = []
+    day = lower.date()
+    while datetime(day.year, day.month, day.day, tzinfo=timezone.utc) < upper:
+        rng = random.Random(f"{seed}:{calendar_id}:{day.isoformat()}")
+        if rng.random() < duty_probability:
+            next_day = day + timedelta(days=1)
+            event_id = f"{calendar_id.split('@')[0]}-{day.strftime('%Y%m%d')}"
+            if rng.random() < 0.1:
+                start = {"dateTime": f"{day.isoformat()}T08:00:00+08:00"}
+                end = {"dateTime": f"{next_day.isoformat()}T08:00:00+08:00"}
+            else:
+                start = {"date": day.isoformat()}
+                end = {"date": next_day.isoformat()}
+            events.append({"id": event_id, "summary": "值班", "start": start, "end": end})
+            if rng.random() < 0.05:
+                events.append({"id": f"{event_id}-dup", "summary": "值班 (重複)", "start": start, "end": end})
+        day += timedelta(days=1)
+    return events
+
+
+class SyntheticEventSource(EventSource):
+    """不經過 HTTP、直接在行程內產生合成事件的事件來源 (用於基準測試)。"""
+
+    def __init__(self, duty_probability: float = 0.2, seed: int = 0):
+        self.duty_probability = duty_probability
+        self.seed = seed
+
+    def list_events(self, calendar_id: str, time_min: str, time_max: str, member_name: str = '') -> list[dict]:
+        return synthetic_events(calendar_id, time_min, time_max, self.duty_probability, self.seed)
+
+
+class FakeCalendarServer:
+    """模擬 Google Calendar `events.list` 的本機 HTTP 伺服器。
+
+    支援 `GET /calendars/{calendarId}/events` (以及 `/calendar/v3/...` 前綴)，
+    參數 timeMin、timeMax、maxResults、pageToken。可設定回應延遲、分頁大小與錯誤率，
+    錯誤回應的格式與 Google API 相同 (429 / 500 / 503)，可用來測試重試與錯誤處理。
+
+    用法：
+        with FakeCalendarServer(latency=0.05, error_rate=0.01) as server:
+            source = GoogleCalendarEventSource(api_endpoint=server.url)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 page_size: int = 250, error_rate: float = 0.0, seed: int = 0,
+                 events_provider: Optional[Callable[[str, str, str], list]] = None):
+        """
+        Args:
+            host (str): 監聽位址。
+            port (int): 監聽埠號，0 表示自動選擇。
+            latency (float): 每個請求的基本延遲 (秒)。
+            jitter (float): 額外的隨機延遲上限 (秒)。
+            page_size (int): 預設每頁事件數 (請求的 maxResults 較小時以請求為準)。
+            error_rate (float): 回應錯誤的機率 (0~1)。
+            seed (int): 隨機種子 (延遲、錯誤與合成事件)。
+            events_provider (Callable): (calendar_id, time_min, time_max) -> 事件列表；預設為合成事件。
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.events_provider = events_provider or (
+            lambda calendar_id, time_min, time_max: synthetic_events(calendar_id, time_min, time_max, seed=seed))
+        self.stats = {"requests": 0, "errors": 0, "events": 0, "connections": 0}
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> 'FakeCalendarServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-calendar', daemon=True)
+        self._thread.start()
+        logger.info(f"假 Calendar 伺服器已啟動: {self.url} (延遲 {self.latency}s+{self.jitter}s，分頁 {self.page_size}，錯誤率 {self.error_rate})")
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'FakeCalendarServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _draw(self) -> tuple[float, Optional[int]]:
+        """取得本次請求的延遲與要注入的錯誤狀態碼 (None 表示正常回應)。"""
+        with self._rng_lock:
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            error_status = self._rng.choice([429, 500, 503]) if self._rng.random() < self.error_rate else None
+            self.stats["requests"] += 1
+            if error_status:
+                self.stats["errors"] += 1
+        return delay, error_status
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # 與 Google API 相同支援 keep-alive，stats["connections"] 可用來確認連線重複使用
+            disable_nagle_algorithm = True # 標頭與內容分開寫出，keep-alive 時避免 Nagle 與延遲 ACK 造成每個請求多 40ms
+
+            def setup(self):
+                super().setup()
+                with server._rng_lock:
+                    server.stats["connections"] += 1
+
+            def log_message(self, format, *args):
+                logger.debug("fake-calendar: " + format, *args)
+
+            def _send_json(self, status: int, body: dict):
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                parts = [unquote(part) for part in parsed.path.strip('/').split('/')]
+                if parts[:2] == ['calendar', 'v3']:
+                    parts = parts[2:]
+                if len(parts) != 3 or parts[0] != 'calendars' or parts[2] != 'events':
+                    self._send_json(404, {"error": {"code": 404, "message": "Not Found"}})
+                    return
+
+                delay, status = server._draw()
+                if delay:
+                    time.sleep(delay)
+                if status:
+                    self._send_json(status, {"error": {"code": status, "message": "Injected failure", "errors": [
+                        {"reason": "rateLimitExceeded" if status == 429 else "backendError"}]}})
+                    return
+
+                query = parse_qs(parsed.query)
+                time_min = query.get('timeMin', [''])[0]
+                time_max = query.get('timeMax', [''])[0]
+                try:
+                    offset = int(query.get('pageToken', ['0'])[0])
+                    page_size = min(int(query.get('maxResults', [server.page_size])[0]), server.page_size)
+                except ValueError:
+                    self._send_json(400, {"error": {"code": 400, "message": "Invalid pageToken or maxResults"}})
+                    return
+
+                events = server.events_provider(parts[1], time_min, time_max)
+                page = events[offset:offset + page_size]
+                with server._rng_lock:
+                    server.stats["events"] += len(page)
+                body = {"kind": "calendar#events", "summary": parts[1], "items": page}
+                if offset + page_size < len(events):
+                    body["nextPageToken"] = str(offset + page_size)
+                self._send_json(200, body)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='啟動模擬 Google Calendar events.list 的本機伺服器，並可產生合成成員資料。')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='每個請求的基本延遲 (秒)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='額外隨機延遲上限 (秒)')
+    parser.add_argument('--page-size', type=int, default=250, help='每頁事件數')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='回應錯誤的機率 (0~1)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--members', type=int, default=500, help='合成成員數 (搭配 --write-members)')
+    parser.add_argument('--write-members', type=str, help='將合成成員寫入此 members.json 路徑後繼續啟動伺服器')
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.write_members:
+        with open(args.write_members, 'w', encoding='utf-8') as f:
+            json.dump({"calendars": list(synthetic_members(args.members).values())}, f, ensure_ascii=False, indent=2)
+        print(f"Wrote {args.members} synthetic members to {args.write_members}")
+
+    fake = FakeCalendarServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                              page_size=args.page_size, error_rate=args.error_rate, seed=args.seed)
+    fake.start()
+    print(f"Fake Calendar API listening on {fake.url}  (export CALENDAR_EVENT_SOURCE=fake:{fake.url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
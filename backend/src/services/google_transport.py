@@ -0,0 +1,107 @@
+import os
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Callable
+
+from .metrics import CALENDAR_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE_ENV = 'CALENDAR_HTTP_POOL_SIZE'  # 保留的閒置連線數上限
+TIMEOUT_ENV = 'CALENDAR_HTTP_TIMEOUT'      # 單一請求的 socket 逾時 (秒)
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TIMEOUT = 30.0
+
+
+class HttpPool:
+    """可重複使用的 httplib2.Http 連線池。
+
+    httplib2.Http 不是執行緒安全的，但會對同一主機保留 keep-alive 連線。
+    池中的每個 Http 同一時間只借給一個執行緒，用完歸還，後續請求 (不同成員、不同報表執行)
+    沿用已完成 TLS 交握的連線。以後進先出歸還，最常用的連線最不容易因閒置而被伺服器關閉。
+    """
+
+    def __init__(self, factory: Callable[[], object], max_idle: int = DEFAULT_POOL_SIZE):
+        """
+        Args:
+            factory (Callable[[], object]): 建立新 Http (或 AuthorizedHttp) 的函式。
+            max_idle (int): 保留的閒置 Http 數上限；同時借出的數量不受限制，超出的歸還時關閉。
+        """
+        self._factory = factory
+        self.max_idle = max(1, max_idle)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _checkout(self):
+        with self._lock:
+            http = self._idle.pop() if self._idle else None
+        if http is None:
+            CALENDAR_CONNECTIONS.labels('created').inc()
+            return self._factory()
+        CALENDAR_CONNECTIONS.labels('reused').inc()
+        return http
+
+    def _checkin(self, http) -> None:
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(http)
+                return
+        self._close(http)
+
+    def _close(self, http) -> None:
+        CALENDAR_CONNECTIONS.labels('closed').inc()
+        try:
+            http.close()
+        except Exception as e:
+            logger.debug("關閉 Calendar 連線時發生錯誤: %s", e)
+
+    @contextmanager
+    def connection(self):
+        """借出一個 Http；區塊內發生網路錯誤時丟棄 (連線狀態不明)，其他情況歸還到池中。
+
+        HttpError (伺服器有回應，例如 429) 不影響連線，照常歸還。
+        """
+        http = self._checkout()
+        try:
+            yield http
+        except Exception as e:
+            if getattr(e, 'resp', None) is None:
+                self._close(http)
+            else:
+                self._checkin(http)
+            raise
+        self._checkin(http)
+
+    def idle_count(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+    def close(self) -> None:
+        """關閉所有閒置連線；之後歸還的連線直接關閉。"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._closed = True
+        for http in idle:
+            self._close(http)
+
+
+def http_factory(httplib2, credentials=None) -> Callable[[], object]:
+    """建立 HttpPool 使用的工廠：每個 Http 設定逾時，使用服務帳號時包裝為 AuthorizedHttp。
+
+    AuthorizedHttp 共用同一個 credentials，access token 只在過期時更新一次。
+    """
+    timeout = float(os.environ.get(TIMEOUT_ENV, DEFAULT_TIMEOUT))
+
+    def factory():
+        http = httplib2.Http(timeout=timeout)
+        if credentials is None:
+            return http
+        from google_auth_httplib2 import AuthorizedHttp
+        return AuthorizedHttp(credentials, http=http)
+    return factory
+
+
+def pool_size_from_env() -> int:
+    return int(os.environ.get(POOL_SIZE_ENV, DEFAULT_POOL_SIZE))
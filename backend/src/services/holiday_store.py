@@ -0,0 +1,345 @@
+import json
+import os
+import threading
+import logging
+from datetime import datetime
+
+from .json_storage import atomic_write_json, dumps_bytes
+from .metrics import io_timer
+from .shared_state import ChangeLog, InterProcessLock
+
+logger = logging.getLogger(__name__)
+
+HOLIDAY_FILE = 'holiday_2026.json' # 僅使用文件名，將在初始化時計算完整路徑
+WEEKDAYS = ["一", "二", "三", "四", "五", "六", "日"]
+HOLIDAY_FIELDS = ("西元日期", "星期", "是否放假", "備註")
+
+
+def resolve_holiday_path(holiday_file: str) -> str:
+    """尋找假日檔案的實際路徑。
+
+    依序嘗試：正規化路徑、backend/data/、當前工作目錄、./backend/data/。
+
+    Raises:
+        FileNotFoundError: 所有位置都找不到檔案時。
+    """
+    normalized_path = os.path.abspath(holiday_file)
+
+    # 1. 檢查正規化後的路徑是否存在
+    if os.path.exists(normalized_path):
+        logger.info(f"✓ 使用路徑: {normalized_path}")
+        return normalized_path
+    # 2. 如果原始路徑是絕對路徑但不存在
+    if os.path.isabs(holiday_file):
+        logger.error(f"✗ 絕對路徑不存在: {holiday_file}")
+        raise FileNotFoundError(f"找不到假日檔案: {holiday_file}")
+
+    # 3. 如果是相對路徑，嘗試多個位置
+    script_dir = os.path.dirname(__file__)
+    base_dir = os.path.abspath(os.path.join(script_dir, '..', '..'))
+    candidates = [
+        os.path.join(base_dir, 'data', os.path.basename(holiday_file)),               # backend/data/
+        os.path.join(os.getcwd(), holiday_file),                                        # 當前工作目錄
+        os.path.join(os.getcwd(), 'backend', 'data', os.path.basename(holiday_file)),  # ./backend/data/
+    ]
+    for path in candidates:
+        logger.debug(f"嘗試路徑: {path}")
+        if os.path.exists(path):
+            logger.info(f"✓ 找到假日檔案: {path}")
+            return path
+
+    logger.error(f"✗ 在所有位置都找不到假日檔案: {holiday_file}")
+    logger.error(f"  已嘗試的路徑: {[normalized_path] + candidates}")
+    raise FileNotFoundError(f"找不到假日檔案: {holiday_file}")
+
+
+class HolidaySnapshot:
+    """某一版本假日資料的唯讀索引。
+
+    快照建立後不會再被修改；寫入時由 HolidayStore 建立新快照並整體替換，
+    因此持有舊快照的讀取端 (例如執行中的報表) 會看到一致的資料。
+    """
+    __slots__ = ('version', 'records', 'records_by_date', 'holidays', 'special_days', 'by_month', '_payloads')
+
+    def __init__(self, version: int, records: list[dict]):
+        self.version = version
+        self.records = records
+        self.records_by_date = {}
+        self.holidays = {}
+        self.special_days = {} # 是否放假=3 的特殊日
+        self.by_month = {}     # YYYYMM -> 該月記錄 (依檔案順序)
+        self._payloads = {}    # (範圍鍵, 欄位) -> 已序列化的 JSON bytes
+
+        count = 0
+        special_count = 0
+        for item in records:
+            date_str = item.get("西元日期")
+            is_holiday_val = item.get("是否放假")
+            # 驗證日期格式
+            if not date_str or not isinstance(date_str, str) or len(date_str) != 8 or not date_str.isdigit():
+                logger.warning(f"跳過無效的日期格式記錄: {item}")
+                continue
+            self.records_by_date[date_str] = item
+            self.by_month.setdefault(date_str[:6], []).append(item)
+
+            # 處理是否放假值
+            try:
+                is_holiday_int = int(is_holiday_val)
+            except (ValueError, TypeError):
+                logger.warning(f"無效的 '是否放假' 值 ({is_holiday_val}) 在日期 {date_str}。將視為非假日。")
+                self.holidays[date_str] = False
+                continue
+
+            if is_holiday_int == 2: # 是否放假 = 2 表示假日
+                self.holidays[date_str] = True
+                count += 1
+            elif is_holiday_int == 3: # 是否放假 = 3 表示特殊日
+                self.special_days[date_str] = True
+                self.holidays[date_str] = True # 特殊日也視為假日計算工時
+                special_count += 1
+                count += 1
+            elif is_holiday_int in [0, 1]: # 0=工作日, 1=休息日 (非假日)
+                self.holidays[date_str] = False
+            else:
+                logger.warning(f"未知的 '是否放假' 值 ({is_holiday_val}) 在日期 {date_str}。將視為非假日。")
+                self.holidays[date_str] = False
+
+        logger.info(f"假日資料 v{version}: {count} 個假日 (含 {special_count} 個特殊日)，共 {len(records)} 筆記錄")
+
+        # 預先序列化每月與每年的完整欄位回應，月份切換時只需查表
+        for year_month in self.by_month:
+            self.month_payload(year_month)
+        for year in {ym[:4] for ym in self.by_month}:
+            self.range_payload(year, year)
+
+    def is_holiday(self, date_str: str) -> bool:
+        """檢查指定日期是否為假日 (包含特殊日)。"""
+        return self.holidays.get(date_str, False)
+
+    def is_special_day(self, date_str: str) -> bool:
+        """檢查指定日期是否為特殊日 (是否放假=3)。"""
+        return self.special_days.get(date_str, False)
+
+    def _month_items(self, year_month: str, fields: tuple) -> bytes:
+        """返回單月記錄序列化後、去掉外層中括號的 JSON 片段 (供組合範圍回應)。
+
+        只快取實際存在的月份；`fields` 須已經過 `_canonical_fields` 正規化，快取大小因此有上限。
+        """
+        if year_month not in self.by_month:
+            return b''
+        key = ('items', year_month, fields)
+        items = self._payloads.get(key)
+        if items is None:
+            records = self.by_month[year_month]
+            if fields:
+                records = [{field: record.get(field, "") for field in fields} for record in records]
+            items = dumps_bytes(records)[1:-1]
+            self._payloads[key] = items
+        return items
+
+    @staticmethod
+    def _canonical_fields(fields: tuple) -> tuple:
+        """把欄位投影正規化為 HOLIDAY_FIELDS 順序、不重複的 tuple (忽略未知欄位)；None 或選取全部欄位時返回 None。"""
+        if not fields:
+            return None
+        selected = tuple(field for field in HOLIDAY_FIELDS if field in fields)
+        return selected if selected and selected != HOLIDAY_FIELDS else None
+
+    def month_payload(self, year_month: str, fields: tuple = None) -> bytes:
+        """返回指定月份的 JSON 回應 bytes。
+
+        Args:
+            year_month (str): 年月 (YYYYMM)。
+            fields (tuple): 只輸出的欄位 (依 HOLIDAY_FIELDS 順序輸出)；None 表示全部欄位。
+        """
+        return b'[' + self._month_items(year_month, self._canonical_fields(fields)) + b']'
+
+    def range_payload(self, start: str = None, end: str = None, fields: tuple = None) -> bytes:
+        """返回 start..end (含) 範圍內所有月份的 JSON 回應 bytes。
+
+        快取鍵使用範圍內實際存在的第一個與最後一個月份，而不是原始的 start/end，
+        因此不同寫法的相同範圍共用同一份結果，快取大小也不受請求參數影響。
+
+        Args:
+            start (str): 起始年 (YYYY) 或年月 (YYYYMM)；None 表示不設下限。
+            end (str): 結束年 (YYYY) 或年月 (YYYYMM)；None 表示不設上限。
+            fields (tuple): 只輸出的欄位 (依 HOLIDAY_FIELDS 順序輸出)；None 表示全部欄位。
+        """
+        start_ym = (start + '01') if start and len(start) == 4 else start
+        end_ym = (end + '12') if end and len(end) == 4 else end
+        fields = self._canonical_fields(fields)
+        months = [ym for ym in sorted(self.by_month)
+                  if (start_ym is None or ym >= start_ym) and (end_ym is None or ym <= end_ym)]
+        if not months:
+            return b'[]'
+        key = ('range', months[0], months[-1], fields)
+        payload = self._payloads.get(key)
+        if payload is None:
+            parts = [self._month_items(ym, fields) for ym in months]
+            payload = b'[' + b','.join(part for part in parts if part) + b']'
+            self._payloads[key] = payload
+        return payload
+
+
+class HolidayStore:
+    """版本化、寫入即同步 (write-through) 的假日資料儲存。
+
+    API 端點與 HolidayService 共用同一個實例：所有寫入都經由 `update_status`，
+    先原子性寫回 JSON 檔，再遞增版本號並替換記憶體中的快照。
+    讀取端直接取用 `snapshot()`，不需要重新讀檔。
+
+    多個 worker 行程共用同一個檔案時，寫入以 <檔案>.lock 互斥，版本號記錄在 <檔案>.version；
+    `snapshot()` 發現其他 worker 寫入過時會重新載入，各 worker 的版本號因此一致。
+    """
+
+    def __init__(self, holiday_file: str = HOLIDAY_FILE):
+        self.holiday_file = holiday_file
+        self.loaded = False
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._file_lock = None # InterProcessLock (<檔案>.lock)，決定假日檔案路徑後建立
+        self._changes = None   # ChangeLog (<檔案>.version)，同上
+        self._listeners = []
+        self._snapshot = HolidaySnapshot(0, [])
+        self._load()
+        self._open_shared_state() # 找不到檔案時，之後的 update_status 仍會建立檔案
+
+    def _read_records(self) -> list[dict]:
+        with io_timer('holidays', 'read'), open(self.holiday_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load(self, version: int = None):
+        """從 JSON 檔案載入假日資料並建立快照。
+
+        Args:
+            version (int): 快照的版本號；None 表示使用共用版本檔目前的版本。
+        """
+        logger.info(f"開始載入假日檔案: {self.holiday_file}")
+        try:
+            self.holiday_file = resolve_holiday_path(self.holiday_file)
+            logger.info(f"=== 最終使用的假日檔案路徑: {self.holiday_file} ===")
+            self._open_shared_state() # 先讀版本再讀資料，資料只會比版本新
+            records = self._read_records()
+            self._snapshot = HolidaySnapshot(version if version is not None else self._changes.seen + 1, records)
+            self.loaded = True
+        except FileNotFoundError:
+            logger.error(f"錯誤：找不到假日檔案 {self.holiday_file}")
+        except json.JSONDecodeError:
+            logger.error(f"錯誤：解析假日檔案 {self.holiday_file} 失敗。")
+        except Exception as e:
+            logger.error(f"載入假日檔案時發生未預期錯誤: {e}", exc_info=True)
+
+    def _open_shared_state(self) -> None:
+        if self._changes is None:
+            self._file_lock = InterProcessLock(f"{self.holiday_file}.lock")
+            self._changes = ChangeLog(f"{self.holiday_file}.version")
+
+    def subscribe(self, listener, external: bool = True) -> None:
+        """註冊假日變更通知。
+
+        寫入後以 (日期, 舊快照, 新快照) 呼叫 listener；重新載入整個檔案時日期為 None。
+
+        Args:
+            listener: 通知函式。
+            external (bool): 是否也接收其他 worker 的寫入 (在本行程發現時通知)；
+                會把變更持久化到共用檔案的 listener (例如標記過期報表) 應設為 False，避免重複處理。
+        """
+        self._listeners.append((listener, external))
+
+    def _notify(self, date, old: HolidaySnapshot, new: HolidaySnapshot, external: bool = False) -> None:
+        for listener, wants_external in self._listeners:
+            if external and not wants_external:
+                continue
+            try:
+                listener(date, old, new)
+            except Exception as e:
+                logger.error(f"假日變更通知失敗 ({listener}): {e}", exc_info=True)
+
+    def _sync(self) -> None:
+        """套用其他 worker 的寫入：重新載入檔案並對變更的日期發出通知。"""
+        with self._sync_lock:
+            changed = self._changes.poll()
+            if changed is None:
+                return
+            version, dates = changed
+            old = self._snapshot
+            try:
+                self._snapshot = HolidaySnapshot(version + 1, self._read_records())
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"重新載入其他 worker 寫入的假日資料失敗: {e}", exc_info=True)
+                return
+            new = self._snapshot
+        logger.info(f"假日資料已由其他 worker 更新，重新載入為 v{new.version}")
+        for date in (sorted(dates) if dates is not None else [None]):
+            self._notify(date, old, new, external=True)
+
+    @property
+    def version(self) -> int:
+        """目前假日資料的版本號，每次寫入或重新載入都會遞增。"""
+        return self.snapshot().version
+
+    def snapshot(self) -> HolidaySnapshot:
+        """取得目前版本的唯讀快照。"""
+        self._sync()
+        return self._snapshot
+
+    def reload(self) -> int:
+        """重新從檔案載入 (用於檔案被外部修改的情況)，返回新版本號。"""
+        with self._write_lock:
+            with self._file_lock:
+                self._sync()
+                old = self._snapshot
+                with self._sync_lock:
+                    self._load(self._changes.bump() + 1)
+                if self._snapshot is not old:
+                    self._notify(None, old, self._snapshot)
+            return self._snapshot.version
+
+    def get_all(self) -> list[dict]:
+        """返回所有假日記錄。"""
+        return self.snapshot().records
+
+    def get_month(self, year_month: str) -> list[dict]:
+        """返回指定年月 (YYYYMM) 的假日記錄。"""
+        return self.snapshot().by_month.get(year_month, [])
+
+    def update_status(self, date: str, status: str, description: str = "") -> int:
+        """更新 (或新增) 指定日期的假日狀態。
+
+        Args:
+            date (str): 日期 (YYYYMMDD)。
+            status (str): 是否放假 (0/1/2/3)。
+            description (str): 備註。
+
+        Returns:
+            int: 寫入後的新版本號。
+        """
+        with self._write_lock, self._file_lock:
+            current = self.snapshot() # 先套用其他 worker 的寫入，避免覆蓋
+            records = list(current.records)
+            existing = current.records_by_date.get(date)
+            if existing is not None:
+                updated = dict(existing)
+                updated["是否放假"] = str(status)
+                updated["備註"] = description
+                records[records.index(existing)] = updated
+            else:
+                try:
+                    weekday = WEEKDAYS[datetime.strptime(date, "%Y%m%d").weekday()]
+                except ValueError:
+                    weekday = ""
+                records.append({
+                    "西元日期": date,
+                    "星期": weekday,
+                    "是否放假": str(status),
+                    "備註": description
+                })
+
+            # 先寫檔，成功後才替換記憶體快照
+            with io_timer('holidays', 'write'):
+                atomic_write_json(self.holiday_file, records)
+            with self._sync_lock:
+                self._snapshot = HolidaySnapshot(self._changes.bump([date]) + 1, records)
+            logger.info(f"已更新 {date} 假日狀態為 {status}，假日資料版本: v{self._snapshot.version}")
+            self._notify(date, current, self._snapshot)
+            return self._snapshot.version
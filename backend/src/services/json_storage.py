@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import logging
+
+try:
+    import orjson # 選用：較快的 JSON 編碼器
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def dumps_bytes(data) -> bytes:
+    """將資料序列化為 UTF-8 JSON bytes (緊湊格式，不跳脫中文)。
+
+    若有安裝 orjson 則使用之，否則退回標準函式庫 json。
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def atomic_write_json(path: str, data, indent: int = 4) -> None:
+    """以「暫存檔 + rename」的方式原子性寫入 JSON 檔案。
+
+    讀取端只會看到完整的舊檔或完整的新檔，不會讀到寫到一半的內容。
+
+    Args:
+        path (str): 目標檔案路徑。
+        data: 可被 json 序列化的資料。
+        indent (int): JSON 縮排，預設與既有資料檔一致 (4)。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def atomic_write_many(files: dict) -> None:
+    """一次寫入多個 JSON 檔案：先全部寫成暫存檔，成功後才依序 rename。
+
+    任一檔案序列化或寫入失敗時，不會有任何目標檔案被替換。
+    rename 依 `files` 的順序進行，呼叫端應把索引類檔案 (如 manifest) 放在最後。
+
+    Args:
+        files (dict): 目標檔案路徑 -> 可被 json 序列化的資料。
+    """
+    staged = []
+    try:
+        for path, data in files.items():
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.json', dir=directory)
+            staged.append((tmp_path, path))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+    except Exception:
+        for tmp_path, _ in staged:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        raise
+
+    for tmp_path, path in staged:
+        os.replace(tmp_path, path)
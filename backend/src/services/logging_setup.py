@@ -0,0 +1,118 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - [%(funcName)s] - %(message)s'
+LOG_LEVEL_ENV = 'LOG_LEVEL'                 # 根 logger 等級，預設 INFO
+LOG_LEVELS_ENV = 'LOG_LEVELS'               # 個別模組等級，例如 "src.core.report_generator=DEBUG,uvicorn.access=WARNING"
+LOG_DEBUG_SAMPLE_ENV = 'LOG_DEBUG_SAMPLE'   # 逐列 debug 訊息每 N 筆輸出 1 筆，預設 100 (1 表示全部輸出)
+UVICORN_LOGGERS = ('uvicorn', 'uvicorn.error', 'uvicorn.access')
+
+_lock = threading.Lock()
+_listeners = []
+_configured = False
+_sample_every = 100
+_sample_counter = itertools.count()
+
+
+class _PassthroughQueueHandler(logging.handlers.QueueHandler):
+    """不預先格式化的 QueueHandler。
+
+    uvicorn 的 formatter 需要原始的 record.args (例如存取日誌的用戶端位址)，
+    標準 QueueHandler.prepare 會把訊息合併並清掉 args，因此這裡直接轉交 record。
+    佇列只在行程內使用，不需要序列化。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_module_levels(spec: Optional[str]) -> dict[str, str]:
+    """解析 "模組=等級,..." 格式的字串，忽略空白與格式錯誤的項目。"""
+    levels = {}
+    for item in (spec or '').split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _start_listener(handlers: list[logging.Handler]) -> queue.SimpleQueue:
+    """建立佇列並啟動把佇列內容交給 handlers 的背景 QueueListener，返回該佇列。"""
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return log_queue
+
+
+def configure_logging(level: Optional[str] = None, module_levels: Optional[dict] = None,
+                      debug_sample_every: Optional[int] = None, use_queue: bool = True) -> None:
+    """集中設定日誌 (取代各模組的 logging.basicConfig)，重複呼叫時不會重新設定。
+
+    * 根 logger 的輸出經由 QueueHandler 交給背景執行緒的 QueueListener 寫出，
+      請求處理的執行緒與事件迴圈不會因為寫 stderr 而阻塞。
+    * 已由 uvicorn 設定的 uvicorn / uvicorn.access logger 也改為經由佇列寫出，保留原本的格式。
+    * 個別模組的等級可由參數或環境變數 LOG_LEVELS 設定。
+
+    Args:
+        level (Optional[str]): 根 logger 等級；None 時使用環境變數 LOG_LEVEL (預設 INFO)。
+        module_levels (Optional[dict]): logger 名稱 -> 等級；與 LOG_LEVELS 合併，參數優先。
+        debug_sample_every (Optional[int]): `sample_debug` 每幾筆輸出一筆；None 時使用 LOG_DEBUG_SAMPLE。
+        use_queue (bool): False 時直接寫 stderr (例如需要在行程結束前立即看到輸出的情況)。
+    """
+    global _configured, _sample_every
+    with _lock:
+        if _configured:
+            return
+        root = logging.getLogger()
+        root.setLevel((level or os.environ.get(LOG_LEVEL_ENV, 'INFO')).upper())
+
+        levels = parse_module_levels(os.environ.get(LOG_LEVELS_ENV))
+        levels.update(module_levels or {})
+        for name, module_level in levels.items():
+            logging.getLogger(name).setLevel(module_level)
+
+        try:
+            _sample_every = max(1, int(debug_sample_every or os.environ.get(LOG_DEBUG_SAMPLE_ENV, _sample_every)))
+        except ValueError:
+            _sample_every = 100
+
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        if use_queue:
+            root.addHandler(logging.handlers.QueueHandler(_start_listener([stream_handler])))
+            for name in UVICORN_LOGGERS:
+                uvicorn_logger = logging.getLogger(name)
+                if uvicorn_logger.handlers:
+                    original = list(uvicorn_logger.handlers)
+                    for handler in original:
+                        uvicorn_logger.removeHandler(handler)
+                    uvicorn_logger.addHandler(_PassthroughQueueHandler(_start_listener(original)))
+        else:
+            root.addHandler(stream_handler)
+        _configured = True
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """停止背景 listener 並寫出佇列中剩餘的記錄 (行程結束時自動呼叫)。"""
+    with _lock:
+        while _listeners:
+            _listeners.pop().stop()
+
+
+def sample_debug(logger: logging.Logger, msg: str, *args) -> None:
+    """逐列/逐班次等高頻 debug 訊息使用：未啟用 debug 時幾乎沒有成本，啟用時每 N 筆只輸出一筆。
+
+    訊息使用 % 格式的延遲格式化 (例如 sample_debug(logger, "row %s", row))，只有真正輸出時才格式化。
+    """
+    if logger.isEnabledFor(logging.DEBUG) and next(_sample_counter) % _sample_every == 0:
+        logger.debug(msg, *args, stacklevel=2)
@@ -0,0 +1,118 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+logger = logging.getLogger(__name__)
+
+# 報表各階段的耗時分布 (秒)；範圍涵蓋單一成員的毫秒級計算到整月產生的數十秒
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+IO_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# stage: client_setup | calendar_fetch | duty_load | merge | classify | excel_render | excel_save | zip
+REPORT_STAGE_SECONDS = Histogram(
+    'overtime_report_stage_seconds', '報表流程各階段的耗時', ['stage'], buckets=STAGE_BUCKETS)
+# kind: generate | preview | export
+REPORT_RUN_SECONDS = Histogram(
+    'overtime_report_run_seconds', '一次報表執行 (所有成員與月份) 的總耗時', ['kind'], buckets=STAGE_BUCKETS)
+REPORT_MEMBERS = Counter('overtime_report_members', '處理過的成員數 (每位成員每個月份計一次)', ['kind'])
+CALENDAR_EVENTS = Counter('overtime_report_calendar_events', '從行事曆事件來源取得的事件數')
+REPORT_SHIFTS = Counter('overtime_report_shifts', '分類後寫入報表 (或預覽) 的班次段數', ['kind'])
+WORKBOOKS = Counter('overtime_report_workbooks', '產生的 Excel 活頁簿數', ['result'])
+
+# result: success | retry (失敗後將重試) | error (最終失敗) | rejected (斷路中未送出)
+CALENDAR_REQUESTS = Counter('overtime_calendar_requests', '行事曆 API 請求 (每頁每次嘗試計一次)', ['result'])
+CALENDAR_THROTTLE_SECONDS = Histogram(
+    'overtime_calendar_throttle_seconds', '行事曆請求等待 token bucket 的時間', buckets=STAGE_BUCKETS)
+CALENDAR_BREAKER_OPEN = Gauge('overtime_calendar_breaker_open', '行事曆 API 斷路器是否開啟 (1 為斷路中)',
+                              multiprocess_mode='max')
+# event: created (新建連線) | reused (沿用池中的連線) | closed (網路錯誤、池已滿或伺服器停止)
+CALENDAR_CONNECTIONS = Counter('overtime_calendar_connections', '行事曆 API 的 HTTP 連線 (Http 物件) 使用情形', ['event'])
+# stage: fetch (行事曆擷取失敗，未產生報表)
+MEMBER_FAILURES = Counter('overtime_report_member_failures', '因錯誤而未能處理的成員數 (每位成員每個月份計一次)', ['stage'])
+
+# store: duties | duty_rules | holidays | calendar_dates | reports；operation: read | write
+STORAGE_IO_SECONDS = Histogram(
+    'overtime_storage_io_seconds', 'JSON 資料檔的讀寫耗時', ['store', 'operation'], buckets=IO_BUCKETS)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'overtime_http_request_seconds', 'API 請求的處理耗時 (依路由樣板)', ['method', 'route', 'status'],
+    buckets=STAGE_BUCKETS)
+
+
+# 目前請求的各階段累計耗時 (名稱 -> [秒數, 次數])，由 Server-Timing 中介層設定；不在請求內時為 None
+_request_timings: ContextVar[Optional[dict]] = ContextVar('request_timings', default=None)
+
+
+def begin_request_timings():
+    """開始收集目前請求的階段耗時，返回 (收集用的 dict, 還原用的 token)。"""
+    timings = {}
+    return timings, _request_timings.set(timings)
+
+
+def end_request_timings(token) -> None:
+    _request_timings.reset(token)
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """把耗時累加到目前請求的 Server-Timing (同一階段多次發生時加總並計數)。"""
+    timings = _request_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """記錄報表階段耗時到 REPORT_STAGE_SECONDS 與目前請求的 Server-Timing。"""
+    REPORT_STAGE_SECONDS.labels(stage).observe(seconds)
+    record_timing(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """量測 with 區塊的耗時並記錄到 REPORT_STAGE_SECONDS (區塊拋出例外時也會記錄)。"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def io_timer(store: str, operation: str):
+    """量測資料檔讀寫的耗時並記錄到 STORAGE_IO_SECONDS。"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STORAGE_IO_SECONDS.labels(store, operation).observe(elapsed)
+        record_timing(f"{store}_{operation}", elapsed)
+
+
+def format_server_timing(timings: dict, total: float) -> str:
+    """組成 Server-Timing 標頭值，例如 `calendar_fetch;desc="8x";dur=120.5, total;dur=300.1` (毫秒)。"""
+    parts = []
+    for name, (seconds, count) in timings.items():
+        desc = f';desc="{count}x"' if count > 1 else ''
+        parts.append(f"{name}{desc};dur={seconds * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(parts)
+
+
+def render_latest() -> tuple[bytes, str]:
+    """返回 Prometheus 文字格式的所有指標與對應的 Content-Type。
+
+    多個 worker 行程 (run.py --workers，設定 PROMETHEUS_MULTIPROC_DIR) 時彙總所有 worker 的指標，
+    否則 /metrics 只會反映剛好處理該請求的 worker。
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
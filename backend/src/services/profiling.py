@@ -0,0 +1,193 @@
+import cProfile
+import contextvars
+import functools
+import hmac
+import io
+import os
+import pstats
+import re
+import threading
+import uuid
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN_ENV = 'PROFILE_TOKEN'     # 未設定時停用效能分析與 /admin/profiles
+PROFILE_TOKEN_HEADER = 'X-Profile-Token'
+PROFILE_DIR_NAME = 'profiles'           # data/profiles/*.prof
+MAX_STORED_PROFILES = 50
+
+_PROFILE_ID_RE = re.compile(r"^[\w.-]+\.prof$")
+
+_active_session: contextvars.ContextVar[Optional['ProfileSession']] = contextvars.ContextVar('profile_session', default=None)
+
+
+def token_matches(supplied: Optional[str]) -> bool:
+    """檢查請求提供的權杖是否與環境變數 PROFILE_TOKEN 相同 (未設定權杖時一律拒絕)。"""
+    expected = os.environ.get(PROFILE_TOKEN_ENV)
+    if not expected or not supplied:
+        return False
+    return hmac.compare_digest(expected.encode('utf-8'), supplied.encode('utf-8'))
+
+
+class ProfileSession:
+    """一次請求的效能分析。
+
+    cProfile 只量測啟用它的執行緒：事件迴圈執行緒使用 `main`，請求派到其他執行緒的工作
+    (經 `profiled` 包裝，例如 asyncio.to_thread 與 calendar-fetch 執行緒池) 各自使用一個 Profile，
+    存檔時合併。結束時仍在執行的工作不會計入。
+    """
+
+    def __init__(self):
+        self.main = cProfile.Profile()
+        self.closed = False
+        self._finished = []   # 已結束的工作執行緒 Profile
+        self._lock = threading.Lock()
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """在目前執行緒以新的 Profile 執行 fn (分析已結束時直接執行)。"""
+        if self.closed:
+            return fn(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError: # 這個執行緒已有其他分析工具
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                if not self.closed:
+                    self._finished.append(profile)
+
+    def stats(self) -> pstats.Stats:
+        """停止分析並合併所有執行緒的結果。"""
+        self.main.disable()
+        with self._lock:
+            self.closed = True
+            finished = list(self._finished)
+        stats = pstats.Stats(self.main)
+        for profile in finished:
+            stats.add(profile)
+        return stats
+
+
+def profiled(fn: Callable) -> Callable:
+    """返回在目前請求的效能分析中執行 fn 的函式；沒有進行中的分析時返回 fn 本身。
+
+    須在提交到其他執行緒前 (仍在請求的 context 中) 呼叫，例如 `asyncio.to_thread(profiled(run))`。
+    """
+    session = _active_session.get()
+    if session is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return session.run(fn, *args, **kwargs)
+    return wrapper
+
+
+def profiled_iter(iterator: Iterator):
+    """返回在目前請求的效能分析中逐項取出的迭代器 (Starlette 在執行緒池中逐項呼叫同步迭代器的 next)。"""
+    session = _active_session.get()
+    if session is None:
+        return iterator
+
+    def generate():
+        while True:
+            try:
+                item = session.run(next, iterator)
+            except StopIteration:
+                return
+            yield item
+    return generate()
+
+
+class RequestProfiler:
+    """對單一請求執行 cProfile 並把結果存成 .prof 檔 (可用 pstats、snakeviz 等工具開啟)。
+
+    事件迴圈執行緒的分析涵蓋整個請求期間，因此同一執行緒上其他請求的程式碼也會被計入；
+    請求派到其他執行緒的工作只有經 `profiled` 包裝的才會計入 (見 ProfileSession)。
+    同時只允許一個請求進行分析。
+    """
+
+    def __init__(self, data_dir: str):
+        self.profile_dir = os.path.join(data_dir, PROFILE_DIR_NAME)
+        self._lock = threading.Lock()
+
+    def try_start(self) -> Optional[ProfileSession]:
+        """開始分析 (並設為目前 context 進行中的分析)；已有其他請求在分析時返回 None。"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        session = ProfileSession()
+        _active_session.set(session)
+        session.main.enable()
+        return session
+
+    @staticmethod
+    def new_profile_id(label: str) -> str:
+        """產生分析檔名 (profile ID)。"""
+        safe_label = re.sub(r"[^\w-]+", '_', label).strip('_')[:60]
+        return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_label}_{uuid.uuid4().hex[:8]}.prof"
+
+    def finish(self, session: ProfileSession, profile_id: str) -> str:
+        """停止分析並以 profile_id 存檔，返回 profile_id。"""
+        try:
+            stats = session.stats()
+        finally:
+            self._lock.release()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stats.dump_stats(os.path.join(self.profile_dir, profile_id))
+        self._prune()
+        logger.info(f"已儲存請求效能分析: {profile_id}")
+        return profile_id
+
+    async def finish_after(self, body: AsyncIterator[bytes], session: ProfileSession,
+                           profile_id: str) -> AsyncIterator[bytes]:
+        """轉送回應本文，送完 (或用戶端中斷) 後才停止分析：串流回應的內容在端點返回後才產生。"""
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            self.finish(session, profile_id)
+
+    def _prune(self) -> None:
+        profiles = self.list_profiles()
+        for stale in profiles[MAX_STORED_PROFILES:]:
+            try:
+                os.unlink(os.path.join(self.profile_dir, stale['id']))
+            except OSError as e:
+                logger.warning(f"刪除舊的效能分析檔失敗 {stale['id']}: {e}")
+
+    def list_profiles(self) -> list[dict]:
+        """返回已儲存的分析檔 (新到舊)。"""
+        if not os.path.isdir(self.profile_dir):
+            return []
+        profiles = []
+        for name in os.listdir(self.profile_dir):
+            if _PROFILE_ID_RE.match(name):
+                stat = os.stat(os.path.join(self.profile_dir, name))
+                profiles.append({"id": name, "size": stat.st_size,
+                                 "created": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds')})
+        profiles.sort(key=lambda item: item['created'], reverse=True)
+        return profiles
+
+    def profile_path(self, profile_id: str) -> Optional[str]:
+        """返回分析檔路徑；ID 格式不正確或檔案不存在時返回 None (防止路徑穿越)。"""
+        if not _PROFILE_ID_RE.match(profile_id):
+            return None
+        path = os.path.join(self.profile_dir, profile_id)
+        return path if os.path.isfile(path) else None
+
+    def render_text(self, profile_id: str, sort: str = 'cumulative', limit: int = 50) -> Optional[str]:
+        """以 pstats 文字格式返回前 limit 個函數 (依 sort 排序)。"""
+        path = self.profile_path(profile_id)
+        if path is None:
+            return None
+        output = io.StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
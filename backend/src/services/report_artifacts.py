@@ -0,0 +1,216 @@
+import json
+import os
+import re
+import threading
+import logging
+from datetime import datetime
+from typing import Iterable, Optional
+
+from .json_storage import atomic_write_json
+from .blob_store import shared_blob_store
+from .metrics import io_timer
+from .shared_state import ChangeLog, InterProcessLock
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DIR_NAME = 'reports'      # data/reports/manifest.json (活頁簿存在 BlobStore)
+MANIFEST_FILE = 'manifest.json'   # data/reports/manifest.json
+
+_KEY_RE = re.compile(r"^(\d{6})/([\w-]+)$")
+
+
+def report_key(year_month: str, member_id: str) -> str:
+    """報表的識別鍵 "YYYYMM/成員ID"。"""
+    return f"{year_month}/{member_id}"
+
+
+def parse_report_key(key: str) -> Optional[tuple[str, str]]:
+    """拆解報表識別鍵；格式不正確時返回 None。"""
+    match = _KEY_RE.match(key)
+    return (match.group(1), match.group(2)) if match else None
+
+
+class ReportArtifactStore:
+    """保存每位成員每個月份最新一版報表的儲存區 (不會被 /generate_report 清空)。
+
+    活頁簿本身存在內容定址的 BlobStore，manifest 只記錄檔名 (blob)；目前引用的檔案不會被淘汰，
+    被新版取代的舊版則依 LRU 淘汰前仍可以 /artifacts/... 網址下載。
+    manifest 記錄每份報表產生時使用的輸入 (假日版本、費率規則版本、行事曆值班日期)
+    以及是否已過期 (dirty)；輸入變更時由 ReportRegenerator 標記並在背景重新產生。
+    多個 worker 行程共用 manifest：修改以 manifest.json.lock 互斥，並先載入其他 worker 的修改。
+    """
+
+    def __init__(self, data_dir: str):
+        self.reports_dir = os.path.join(data_dir, REPORTS_DIR_NAME)
+        self.manifest_file = os.path.join(self.reports_dir, MANIFEST_FILE)
+        os.makedirs(self.reports_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._file_lock = InterProcessLock(f"{self.manifest_file}.lock")
+        self._changes = ChangeLog(f"{self.manifest_file}.version")
+        self._entries = self._read_manifest()
+        self.blobs = shared_blob_store(data_dir)
+        self.blobs.add_pin_source(self.blob_names)
+
+    def _read_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with io_timer('reports', 'read'), open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"讀取報表 manifest 失敗 ({self.manifest_file})，將重新建立: {e}")
+            return {}
+
+    def _write_manifest(self) -> None:
+        """寫回 manifest (呼叫端必須持有 _lock 與 _file_lock，且修改前已呼叫 refresh)。"""
+        with io_timer('reports', 'write'):
+            atomic_write_json(self.manifest_file, self._entries)
+        self._changes.bump()
+
+    def refresh(self) -> None:
+        """其他 worker 修改過 manifest 時重新載入。"""
+        with self._lock:
+            if self._changes.poll() is not None:
+                self._entries = self._read_manifest()
+
+    @property
+    def version(self) -> int:
+        """manifest 的版本號 (所有 worker 共用)，每次修改都會遞增。"""
+        self.refresh()
+        return self._changes.seen
+
+    def legacy_path(self, key: str) -> str:
+        """舊版直接存放在 data/reports/YYYYMM/<成員 ID>.xlsx 的報表 (重新產生後改存 BlobStore)。"""
+        year_month, member_id = parse_report_key(key)
+        return os.path.join(self.reports_dir, year_month, f"{member_id}.xlsx")
+
+    def path_for(self, key: str) -> str:
+        entry = self.get(key) or {}
+        if entry.get('blob'):
+            return self.blobs.path_for(entry['blob'])
+        return self.legacy_path(key)
+
+    def blob_names(self) -> set:
+        """目前所有報表引用的 BlobStore 檔名 (不可淘汰)。"""
+        with self._lock:
+            self.refresh()
+            return {entry['blob'] for entry in self._entries.values() if entry.get('blob')}
+
+    # --- 寫入 ---
+    def publish(self, year_month: str, member_id: str, name: str, source_path: str, inputs: dict,
+                base_revision: Optional[int] = None, blob: Optional[str] = None) -> dict:
+        """記錄剛產生的報表及其輸入，清除過期標記。
+
+        重新產生期間若又有新的變更 (revision 與 base_revision 不同)，報表仍維持過期，稍後再產生一次。
+
+        Args:
+            year_month (str): 年月 (YYYYMM)。
+            member_id (str): 成員 ID。
+            name (str): 成員姓名 (加班記錄以姓名對應成員)。
+            source_path (str): 產生的 Excel 檔案。
+            inputs (dict): 產生時的輸入 (holiday_version、rates_version、calendar_dates)。
+            base_revision (Optional[int]): 開始重新產生時讀到的 revision；None 表示一般產生。
+            blob (Optional[str]): 報表產生時已存入 BlobStore 的檔名；None 時由 source_path 存入。
+
+        Returns:
+            dict: manifest 項目。
+        """
+        key = report_key(year_month, member_id)
+        if blob is None:
+            blob = self.blobs.put_file(source_path)
+        with self._lock, self._file_lock:
+            self.refresh()
+            previous = self._entries.get(key, {})
+            revision = previous.get('revision', 0)
+            still_dirty = base_revision is not None and revision != base_revision
+            entry = {
+                "year_month": year_month,
+                "member_id": member_id,
+                "name": name,
+                "file": os.path.basename(source_path),
+                "blob": blob,
+                "rendered_at": datetime.now().isoformat(timespec='seconds'),
+                "inputs": inputs,
+                "revision": revision,
+                "dirty": still_dirty,
+                "dirty_reasons": previous.get('dirty_reasons', []) if still_dirty else [],
+                "error": None,
+            }
+            self._entries[key] = entry
+            self._write_manifest()
+        self._remove_legacy_file(key)
+        return dict(entry)
+
+    def remove(self, key: str) -> None:
+        """刪除報表 (例如重新產生後該月份已沒有任何班次)。"""
+        with self._lock, self._file_lock:
+            self.refresh()
+            if self._entries.pop(key, None) is None:
+                return
+            self._write_manifest()
+        self._remove_legacy_file(key) # BlobStore 中的檔案可能仍被其他網址使用，交由 LRU 淘汰
+
+    def _remove_legacy_file(self, key: str) -> None:
+        try:
+            os.unlink(self.legacy_path(key))
+        except FileNotFoundError:
+            pass
+
+    def mark_dirty(self, keys: Iterable[str], reason: str) -> list[str]:
+        """把報表標記為過期並清除上次的失敗記錄，返回這次新標記的識別鍵 (不存在的報表略過)。"""
+        newly_dirty = []
+        with self._lock, self._file_lock:
+            self.refresh()
+            changed = False
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                entry['revision'] = entry.get('revision', 0) + 1
+                entry['error'] = None
+                changed = True
+                if reason not in entry['dirty_reasons']:
+                    entry['dirty_reasons'].append(reason)
+                if not entry['dirty']:
+                    entry['dirty'] = True
+                    newly_dirty.append(key)
+            if changed:
+                self._write_manifest()
+        return newly_dirty
+
+    def record_error(self, key: str, error: str) -> None:
+        """記錄重新產生失敗 (報表維持過期狀態，下次標記或手動觸發時再試)。"""
+        with self._lock, self._file_lock:
+            self.refresh()
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['error'] = error
+                self._write_manifest()
+
+    # --- 查詢 ---
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            self.refresh()
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def entries(self) -> list[dict]:
+        """所有報表 (依年月、成員 ID 排序)。"""
+        with self._lock:
+            self.refresh()
+            return [dict(self._entries[key], key=key) for key in sorted(self._entries)]
+
+    def keys_where(self, year_month: Optional[str] = None, names: Optional[set] = None) -> list[str]:
+        """符合年月 (None 表示全部) 與成員姓名 (None 表示全部) 的報表識別鍵。"""
+        with self._lock:
+            self.refresh()
+            return [key for key, entry in self._entries.items()
+                    if (year_month is None or entry['year_month'] == year_month)
+                    and (names is None or entry['name'] in names)]
+
+    def dirty_keys(self, include_failed: bool = True) -> list[str]:
+        """過期的報表；include_failed 為 False 時略過上次重新產生失敗、尚未再被標記的報表。"""
+        with self._lock:
+            self.refresh()
+            return sorted(key for key, entry in self._entries.items()
+                          if entry['dirty'] and (include_failed or not entry.get('error')))
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+import logging
+from typing import Iterable, Optional
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+from .json_storage import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+CHANGE_LOG_SIZE = 64 # 版本檔保留的最近變更數；落後更多版本的 worker 視為全部變更
+
+
+class InterProcessLock:
+    """同一資料目錄的多個 worker 行程之間的互斥鎖 (對 <資料檔>.lock 使用 flock)。
+
+    flock 以開啟的檔案為單位，同一行程內的執行緒無法以它互斥，因此外層再加一個 RLock；
+    同一執行緒可重入，只有最外層的 acquire/release 會實際鎖定/解鎖檔案。
+    行程結束 (包括異常終止) 時作業系統會自動釋放鎖。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def _lock_file(self, blocking: bool) -> bool:
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                return True
+            except BlockingIOError:
+                return False
+        while True:
+            try:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.01)
+
+    def _unlock_file(self) -> None:
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """取得鎖；blocking 為 False 且鎖已被其他執行緒或行程持有時立即返回 False。"""
+        if not self._lock.acquire(blocking):
+            return False
+        if self._depth == 0:
+            try:
+                locked = self._lock_file(blocking)
+            except BaseException:
+                self._lock.release()
+                raise
+            if not locked:
+                self._lock.release()
+                return False
+        self._depth += 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file()
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ChangeLog:
+    """跨 worker 的資料版本號與最近變更的範圍 (<資料檔>.version)。
+
+    寫入端在持有 InterProcessLock 時以 `bump` 遞增版本並記錄變更的鍵 (例如月份或日期)；
+    讀取端以 `poll` 比對版本檔的 stat，只有其他 worker 寫入過時才需要讀檔，
+    並依記錄的鍵只重新載入受影響的部分。
+    """
+
+    def __init__(self, path: str, max_entries: int = CHANGE_LOG_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._signature = self._stat()
+        self.seen = self._read()['version'] # 本行程已套用的版本
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return {"version": int(data['version']), "changes": data.get('changes', [])}
+        except FileNotFoundError:
+            return {"version": 0, "changes": []}
+        except (json.JSONDecodeError, OSError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"讀取版本檔失敗 ({self.path})，視為全部變更: {e}")
+            return {"version": -1, "changes": []}
+
+    def bump(self, keys: Optional[Iterable[str]] = None) -> int:
+        """記錄一次寫入並返回新版本號 (呼叫端必須持有對應的 InterProcessLock)。
+
+        Args:
+            keys (Optional[Iterable[str]]): 這次變更的範圍；None 表示全部。
+        """
+        data = self._read()
+        version = max(data['version'], self.seen) + 1
+        changes = data['changes'] + [[version, sorted(keys) if keys is not None else None]]
+        atomic_write_json(self.path, {"version": version, "changes": changes[-self.max_entries:]}, indent=None)
+        self._signature = self._stat()
+        self.seen = version
+        return version
+
+    def poll(self) -> Optional[tuple[int, Optional[set]]]:
+        """檢查其他 worker 是否寫入過。
+
+        Returns:
+            Optional[tuple[int, Optional[set]]]: 沒有新的寫入時為 None；否則為 (最新版本, 變更的鍵)，
+                變更的鍵為 None 表示範圍不明 (落後超過 max_entries 個版本或整份重新載入)，應全部重新載入。
+        """
+        signature = self._stat()
+        if signature == self._signature:
+            return None
+        self._signature = signature
+        data = self._read()
+        if data['version'] == self.seen:
+            return None
+        pending = [entry for entry in data['changes'] if entry[0] > self.seen]
+        keys = set()
+        if data['version'] < self.seen or not pending or pending[0][0] != self.seen + 1:
+            keys = None
+        else:
+            for _, entry_keys in pending:
+                if entry_keys is None:
+                    keys = None
+                    break
+                keys.update(entry_keys)
+        self.seen = data['version']
+        return self.seen, keys
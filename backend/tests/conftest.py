@@ -0,0 +1,6 @@
+"""單元測試設定：讓 `src` 套件可以從 backend 目錄匯入 (與 benchmarks/conftest.py 相同)。"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
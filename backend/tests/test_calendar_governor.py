@@ -0,0 +1,184 @@
+"""CircuitBreaker 的狀態轉換，以及 CalendarGovernor 在各種錯誤下如何回報斷路器。"""
+import pytest
+
+from src.services import calendar_governor
+from src.services.calendar_governor import CalendarFetchError, CalendarGovernor, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class HttpError(Exception):
+    """模擬 googleapiclient 的 HttpError (以 resp.status 提供狀態碼)。"""
+
+    class Resp(dict):
+        def __init__(self, status: int):
+            super().__init__()
+            self.status = status
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.resp = self.Resp(status)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(calendar_governor.time, 'monotonic', fake)
+    return fake
+
+
+def trip(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker(threshold=3, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(threshold=3, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_breaker_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker(threshold=2, reset_seconds=30)
+    trip(breaker)
+    clock.now += 30
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow() # 試探進行中，其他請求仍被拒絕
+
+
+def test_breaker_probe_success_closes(clock):
+    breaker = CircuitBreaker(threshold=2, reset_seconds=30)
+    trip(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(threshold=2, reset_seconds=30)
+    trip(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.allow() # 再過 reset_seconds 後可以再試探
+
+
+def test_breaker_release_probe_allows_next_probe(clock):
+    breaker = CircuitBreaker(threshold=2, reset_seconds=30)
+    trip(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+
+
+def make_governor(**kwargs) -> CalendarGovernor:
+    options = dict(rate=1000, burst=1000, max_attempts=2, breaker_threshold=2, breaker_reset=30, sleep=lambda _: None)
+    options.update(kwargs)
+    return CalendarGovernor(**options)
+
+
+def raise_error(error: Exception):
+    def call():
+        raise error
+    return call
+
+
+def test_governor_trips_on_retryable_errors(clock):
+    governor = make_governor()
+    with pytest.raises(CalendarFetchError):
+        governor.execute(raise_error(HttpError(503)))
+    assert governor.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        governor.execute(lambda: 'ok')
+
+
+@pytest.mark.parametrize('status', [404, 403])
+def test_governor_non_retryable_probe_settles_breaker(clock, status):
+    """試探請求得到 404 / 非配額的 403 時伺服器有回應，斷路器應恢復，而不是一直停在半開。"""
+    governor = make_governor()
+    with pytest.raises(CalendarFetchError):
+        governor.execute(raise_error(HttpError(503)))
+    clock.now += 30
+    with pytest.raises(CalendarFetchError) as info:
+        governor.execute(raise_error(HttpError(status)))
+    assert not isinstance(info.value, CircuitOpenError)
+    assert info.value.status == status
+    assert governor.breaker.state == 'closed'
+    assert [governor.execute(lambda: 'ok') for _ in range(3)] == ['ok'] * 3
+
+
+def test_governor_unexpected_probe_error_releases_probe(clock):
+    """試探請求拋出無法判斷的錯誤 (沒有狀態碼、不可重試) 時釋放試探資格，下一個請求可以再試探。"""
+    governor = make_governor()
+    with pytest.raises(CalendarFetchError):
+        governor.execute(raise_error(HttpError(503)))
+    clock.now += 30
+    with pytest.raises(CalendarFetchError):
+        governor.execute(raise_error(ValueError('bad response')))
+    assert governor.breaker.state == 'half_open'
+    assert governor.execute(lambda: 'ok') == 'ok'
+    assert governor.breaker.state == 'closed'
+
+
+def test_governor_probe_interrupted_releases_probe(clock):
+    governor = make_governor()
+    with pytest.raises(CalendarFetchError):
+        governor.execute(raise_error(HttpError(503)))
+    clock.now += 30
+    with pytest.raises(KeyboardInterrupt):
+        governor.execute(raise_error(KeyboardInterrupt()))
+    assert governor.execute(lambda: 'ok') == 'ok'
+
+
+def test_governor_retries_then_succeeds(clock):
+    governor = make_governor(max_attempts=3, breaker_threshold=5)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise HttpError(429)
+        return 'ok'
+    assert governor.execute(flaky) == 'ok'
+    assert len(calls) == 3
+    assert governor.breaker.state == 'closed'
+
+
+@pytest.mark.parametrize('workers, rate, burst', [(None, 5.0, 10), ('1', 5.0, 10), ('4', 1.25, 2), ('20', 0.25, 1)])
+def test_from_env_splits_rate_across_workers(monkeypatch, workers, rate, burst):
+    for env in (calendar_governor.RATE_ENV, calendar_governor.BURST_ENV):
+        monkeypatch.delenv(env, raising=False)
+    if workers is None:
+        monkeypatch.delenv(calendar_governor.WORKERS_ENV, raising=False)
+    else:
+        monkeypatch.setenv(calendar_governor.WORKERS_ENV, workers)
+    governor = CalendarGovernor.from_env()
+    assert (governor.bucket.rate, governor.bucket.burst) == (rate, burst)
@@ -0,0 +1,59 @@
+"""週期規則的月份解析、驗證與發生日判斷。"""
+import pytest
+
+from src.services.duty_rules import expand_rule, is_occurrence, parse_year_month, validate_rule
+
+RULE = {"id": "1", "weekday": 2, "time": "1800", "hours": 2, "reason": "科會", "interval": 2,
+        "persons": ["甲", "乙"], "start_date": "20260401", "end_date": "20260630"}
+
+
+class NoHolidays:
+    @staticmethod
+    def is_holiday(date_str: str) -> bool:
+        return False
+
+
+@pytest.mark.parametrize('year_month', ['2025', 'abc', '202513', '202600', '2026011', None])
+def test_parse_year_month_rejects_invalid(year_month):
+    with pytest.raises(ValueError):
+        parse_year_month(year_month)
+
+
+def test_expand_rule_rejects_invalid_month():
+    with pytest.raises(ValueError):
+        expand_rule(RULE, '202513', NoHolidays())
+
+
+def test_expand_rule_respects_interval():
+    dates = [occurrence['dateTime'][:8] for occurrence in expand_rule(RULE, '202604', NoHolidays())]
+    assert dates == ['20260401', '20260415', '20260429']
+    assert all(is_occurrence(RULE, date) for date in dates)
+
+
+@pytest.mark.parametrize('date_str', ['20260408', '20260402', '20260325', '20260708', '2026-04-01'])
+def test_is_occurrence_rejects_other_dates(date_str):
+    assert not is_occurrence(RULE, date_str)
+
+
+def test_validate_rule_accepts_skip_dates_and_exceptions():
+    rule = {**RULE, "skip_dates": ["20260415", "20260429:甲"], "exceptions": {"乙": {"hours": 3, "excluded": False}}}
+    assert validate_rule(rule) == []
+
+
+@pytest.mark.parametrize('weekday', [True, False, 7, -1, "2", 2.5, None])
+def test_validate_rule_rejects_invalid_weekday(weekday):
+    assert any("weekday" in error for error in validate_rule({**RULE, "weekday": weekday}))
+
+
+@pytest.mark.parametrize('changes', [
+    {"skip_dates": ["2026-04-15"]},
+    {"skip_dates": ["20260415:"]},
+    {"skip_dates": "20260415"},
+    {"exceptions": {"丙": {}}},
+    {"exceptions": {"甲": {"hours": 0}}},
+    {"exceptions": {"甲": {"hours": 25}}},
+    {"exceptions": {"甲": {"note": "x"}}},
+    {"exceptions": {"甲": {"excluded": "yes"}}},
+])
+def test_validate_rule_rejects_invalid_skip_dates_and_exceptions(changes):
+    assert validate_rule({**RULE, **changes})
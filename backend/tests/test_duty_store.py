@@ -0,0 +1,21 @@
+"""群組加班記錄的欄位驗證。"""
+import pytest
+
+from src.services.duty_store import validate_duty
+
+GROUP = {"dateTime": "202604011800", "hours": 2, "persons": ["甲", "乙"], "reason": "科會"}
+
+
+def test_group_exception_accepts_valid_override():
+    assert validate_duty({**GROUP, "exceptions": {"乙": {"hours": 3, "reason": "提早離開"}}}) == []
+
+
+@pytest.mark.parametrize('hours', [0, -1, 25, True, "3"])
+def test_group_exception_rejects_hours_out_of_range(hours):
+    errors = validate_duty({**GROUP, "exceptions": {"乙": {"hours": hours}}})
+    assert any("hours" in error for error in errors)
+
+
+@pytest.mark.parametrize('exceptions', [{"丙": {"hours": 1}}, {"乙": {"minutes": 30}}, ["乙"]])
+def test_group_exception_rejects_unknown_persons_and_fields(exceptions):
+    assert validate_duty({**GROUP, "exceptions": exceptions})
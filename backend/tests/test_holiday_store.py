@@ -0,0 +1,40 @@
+"""假日快照的序列化快取：鍵須正規化，且不隨請求參數無限成長。"""
+import json
+
+from src.services.holiday_store import HolidaySnapshot
+
+RECORDS = [
+    {"西元日期": "20260101", "星期": "四", "是否放假": "2", "備註": "開國紀念日"},
+    {"西元日期": "20260102", "星期": "五", "是否放假": "0", "備註": ""},
+    {"西元日期": "20260201", "星期": "日", "是否放假": "2", "備註": ""},
+    {"西元日期": "20261231", "星期": "四", "是否放假": "0", "備註": ""},
+]
+
+
+def test_unknown_months_and_ranges_are_not_cached():
+    snapshot = HolidaySnapshot(1, RECORDS)
+    cached = len(snapshot._payloads)
+    assert snapshot.month_payload('202605') == b'[]'
+    assert snapshot.month_payload('../x') == b'[]'
+    assert snapshot.range_payload('2030', '2031') == b'[]'
+    assert len(snapshot._payloads) == cached
+
+
+def test_equivalent_ranges_share_one_entry():
+    snapshot = HolidaySnapshot(1, RECORDS)
+    cached = len(snapshot._payloads)
+    payload = snapshot.range_payload('202512', '202602')
+    assert [record["西元日期"] for record in json.loads(payload)] == ['20260101', '20260102', '20260201']
+    assert snapshot.range_payload('202601', '202603') is payload
+    assert snapshot.range_payload('2026', '2026') == snapshot.range_payload(None, None)
+    assert len(snapshot._payloads) == cached + 1
+
+
+def test_fields_are_canonicalized():
+    snapshot = HolidaySnapshot(1, RECORDS)
+    payload = snapshot.month_payload('202601', ("是否放假", "西元日期", "是否放假"))
+    assert snapshot.month_payload('202601', ("西元日期", "是否放假")) == payload
+    assert list(json.loads(payload)[0]) == ["西元日期", "是否放假"]
+    cached = len(snapshot._payloads)
+    assert snapshot.month_payload('202601', ("備註", "是否放假", "星期", "西元日期")) == snapshot.month_payload('202601')
+    assert len(snapshot._payloads) == cached
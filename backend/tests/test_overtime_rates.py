@@ -0,0 +1,36 @@
+"""加班費率規則：日期類型判斷與特殊日的級距設定。"""
+import json
+
+from src.core import report_generator
+from src.core.overtime_rates import DEFAULT_RATE_RULES, RateTable
+
+
+class SpecialDay:
+    """是否放假=3 的日期：HolidaySnapshot 同時標記為假日與特殊日。"""
+
+    @staticmethod
+    def is_holiday(date_str: str) -> bool:
+        return True
+
+    @staticmethod
+    def is_special_day(date_str: str) -> bool:
+        return True
+
+
+def test_day_type_prefers_special():
+    assert RateTable.day_type(True, True) == 'special'
+    assert RateTable.day_type(True, False) == 'holiday'
+    assert RateTable.day_type(False, False) == 'weekday'
+
+
+def test_special_tiers_apply_to_special_days(tmp_path, monkeypatch):
+    rules = {**DEFAULT_RATE_RULES, "day_types": {**DEFAULT_RATE_RULES["day_types"],
+                                                 "special": [{"bucket": "I"}]}}
+    path = tmp_path / 'overtime_rules.json'
+    path.write_text(json.dumps(rules), encoding='utf-8')
+
+    default_hours = report_generator._calculate_shift_hours(SpecialDay(), '20260101', '0800', '2000')
+    monkeypatch.setattr(report_generator, 'RATE_RULES_FILE', str(path))
+    special_hours = report_generator._calculate_shift_hours(SpecialDay(), '20260101', '0800', '2000')
+    assert default_hours == [0.0, 0.0, 0.0, 8.0, 4.0]
+    assert special_hours == [0.0, 0.0, 0.0, 0.0, 12.0]
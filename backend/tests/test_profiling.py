@@ -0,0 +1,54 @@
+"""請求效能分析：工作執行緒的結果須合併到請求的分析中。"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.services.profiling import RequestProfiler, profiled, profiled_iter
+
+
+def worker_task(n: int) -> int:
+    return sum(range(n))
+
+
+def function_names(stats) -> set:
+    return {key[2] for key in stats.stats}
+
+
+def test_profiled_is_identity_without_session():
+    assert profiled(worker_task) is worker_task
+
+
+def test_worker_threads_are_merged(tmp_path):
+    profiler = RequestProfiler(str(tmp_path))
+
+    def handle_request():
+        session = profiler.try_start()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(profiled(worker_task), 1000).result() == sum(range(1000))
+        assert list(profiled_iter(iter([1, 2]))) == [1, 2]
+        return session
+
+    # 在新的執行緒執行，分析的 contextvar 不會影響其他測試
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(session=handle_request()))
+    thread.start()
+    thread.join()
+    session = result['session']
+    assert 'worker_task' in function_names(session.stats())
+    assert session.run(worker_task, 10) == 45 # 分析結束後直接執行
+
+
+def test_finish_saves_profile_and_releases_lock(tmp_path):
+    profiler = RequestProfiler(str(tmp_path))
+    result = {}
+
+    def handle_request():
+        session = profiler.try_start()
+        result['busy'] = profiler.try_start()
+        result['id'] = profiler.finish(session, profiler.new_profile_id('GET/x'))
+
+    thread = threading.Thread(target=handle_request)
+    thread.start()
+    thread.join()
+    assert result['busy'] is None
+    assert profiler.profile_path(result['id']) is not None
+    assert [item['id'] for item in profiler.list_profiles()] == [result['id']]
@@ -0,0 +1,84 @@
+"""班次段重疊處理：同來源去重、跨來源扣除、三種優先順序與裁切片段的級距位置。"""
+import pytest
+
+from src.core.overtime_rates import DEFAULT_RATE_RULES, RateTable
+from src.core.shift_intervals import _dedupe_class, _subtract, _to_minutes, resolve_overlaps, resolve_precedence
+
+
+def segment(start: str, end: str, manual: bool = False, date: str = '20260401', reason: str = '') -> dict:
+    return {"date": date, "start": start, "end": end, "is_manual": manual, "reason": reason}
+
+
+def item(value: dict, start: str = None, end: str = None) -> tuple:
+    """(開始分鐘, 結束分鐘, 班次段)；start/end 指定時改用該時段 (裁切後的片段)。"""
+    span = _to_minutes(segment(start or value['start'], end or value['end'], date=value['date']))
+    return (*span, value)
+
+
+def spans(segments: list[dict]) -> list[tuple]:
+    return [(item['start'], item['end'], item['is_manual']) for item in segments]
+
+
+def test_dedupe_class_keeps_earlier_segment_and_trims_later():
+    first, inner, later = segment('1800', '2000'), segment('1830', '1930'), segment('1900', '2100')
+    overlaps = []
+    result = _dedupe_class([item(first), item(inner), item(later)], overlaps, trim=True)
+    assert result == [item(first), item(later, '2000', '2100')]
+    assert [overlap['minutes'] for overlap in overlaps] == [60, 60]
+
+
+def test_dedupe_class_without_trim_only_reports():
+    items = [item(segment('1800', '2000')), item(segment('1900', '2100'))]
+    overlaps = []
+    assert _dedupe_class(items, overlaps, trim=False) == items
+    assert len(overlaps) == 1
+
+
+def test_subtract_splits_around_union():
+    loser = segment('0000', '1000', manual=True)
+    union = [item(segment('0100', '0200')), item(segment('0500', '0600'))]
+    overlaps = []
+    result = _subtract([item(loser)], union, overlaps, trim=True)
+    assert result == [item(loser, '0000', '0100'), item(loser, '0200', '0500'), item(loser, '0600', '1000')]
+    assert [(overlap['start'], overlap['end']) for overlap in overlaps] == [('0100', '0200'), ('0500', '0600')]
+
+
+def test_subtract_drops_fully_covered_segment():
+    overlaps = []
+    assert _subtract([item(segment('0100', '0200', manual=True))], [item(segment('0000', '0300'))], overlaps, trim=True) == []
+    assert overlaps[0]['minutes'] == 60
+
+
+SEGMENTS = [segment('1800', '2200', manual=True, reason='手動'), segment('1900', '2000', reason='行事曆')]
+
+
+def test_calendar_precedence_trims_manual():
+    resolved, overlaps = resolve_overlaps(SEGMENTS, 'calendar')
+    assert spans(resolved) == [('1800', '1900', True), ('1900', '2000', False), ('2000', '2200', True)]
+    assert overlaps[0]['kept'] == 'calendar' and overlaps[0]['trimmed'] == 'manual'
+
+
+def test_manual_precedence_trims_calendar():
+    resolved, overlaps = resolve_overlaps(SEGMENTS, 'manual')
+    assert spans(resolved) == [('1800', '2200', True)]
+    assert overlaps[0]['kept'] == 'manual'
+
+
+def test_flag_precedence_keeps_segments_unchanged():
+    resolved, overlaps = resolve_overlaps(SEGMENTS, 'flag')
+    assert sorted(spans(resolved)) == sorted(spans(SEGMENTS))
+    assert overlaps[0]['minutes'] == 60
+
+
+def test_unknown_precedence_is_rejected():
+    with pytest.raises(ValueError):
+        resolve_precedence('latest')
+
+
+def test_trimmed_pieces_continue_tiers():
+    resolved, _ = resolve_overlaps(SEGMENTS, 'calendar')
+    pieces = [item for item in resolved if item['is_manual']]
+    assert [item.get('tier_offset', 0) for item in pieces] == [0, 60]
+    table = RateTable(DEFAULT_RATE_RULES)
+    hours = [table.classify('weekday', 60), table.classify('weekday', 120, offset=60)]
+    assert [sum(column) for column in zip(*hours)] == table.classify('weekday', 180)
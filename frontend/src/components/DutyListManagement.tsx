@@ -139,17 +139,25 @@ const DutyListManagement: React.FC = () => {
     const dutyDateTime = `${formattedDate}${dutyTime.replace(':', '')}`;
     const reasonText = getReasonText(dutyReason);
     
-    const dutyRequests = selectedPersons.map(person => ({
-      dateTime: dutyDateTime,
-      hours: dutyHours,
-      person: person,
-      reason: additionalReason ? `${reasonText} - ${additionalReason}` : reasonText
-    }));
+    const reason = additionalReason ? `${reasonText} - ${additionalReason}` : reasonText;
 
     setLoading(true);
     try {
-      for (const request of dutyRequests) {
-        await dutyApi.addDuty(request);
+      if (selectedPersons.length > 1) {
+        // 多位成員的同一事件存為一筆群組記錄
+        await dutyApi.addDuties([], [{
+          dateTime: dutyDateTime,
+          hours: dutyHours,
+          persons: selectedPersons,
+          reason
+        }]);
+      } else {
+        await dutyApi.addDuties(selectedPersons.map(person => ({
+          dateTime: dutyDateTime,
+          hours: dutyHours,
+          person,
+          reason
+        })));
       }
       await fetchDuties(dayjs().format('YYYYMM'));
       resetForm();
@@ -163,10 +171,10 @@ const DutyListManagement: React.FC = () => {
   };
 
   // 刪除加班記錄
-  const removeDuty = async (id: string) => {
+  const removeDuty = async (id: string, dateTime: string) => {
     setLoading(true);
     try {
-      await dutyApi.removeDuty(id);
+      await dutyApi.removeDuty(id, dateTime.slice(0, 6));
       await fetchDuties(dayjs().format('YYYYMM'));
       showNotification('成功刪除加班記錄', 'success');
     } catch (err) {
@@ -478,7 +486,7 @@ const DutyListManagement: React.FC = () => {
                       <TableCell>
                         <IconButton
                           color="error"
-                          onClick={() => removeDuty(duty.id)}
+                          onClick={() => removeDuty(duty.id, duty.dateTime)}
                           disabled={loading}
                         >
                           <DeleteIcon />
@@ -1,9 +1,10 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { 
   Box, Paper, Typography, Button, Grid, Select, MenuItem, 
   FormControl, InputLabel, CircularProgress, Chip, Alert, 
   Snackbar, List, ListItem, ListItemIcon, ListItemText, Link,
-  IconButton
+  IconButton, Table, TableBody, TableCell, TableHead, TableRow,
+  Accordion, AccordionSummary, AccordionDetails, LinearProgress
 } from '@mui/material';
 import { DatePicker } from '@mui/x-date-pickers/DatePicker';
 import DescriptionIcon from '@mui/icons-material/Description';
@@ -11,14 +12,36 @@ import CheckCircleIcon from '@mui/icons-material/CheckCircle';
 import ErrorIcon from '@mui/icons-material/Error';
 import ArrowBackIcon from '@mui/icons-material/ArrowBack';
 import ArrowForwardIcon from '@mui/icons-material/ArrowForward';
+import ExpandMoreIcon from '@mui/icons-material/ExpandMore';
 import dayjs, { Dayjs } from 'dayjs';
 import { reportApi } from '../services/api';
+import { MemberReportPreview, ReportProgressEvent } from '../types';
 
 interface Member {
   id: string;
   name: string;
 }
 
+// 報表產生進度中單一成員的狀態 (依序為 fetched → classified → rendered / skipped / failed)
+interface MemberProgress {
+  name: string;
+  status: 'fetched' | 'classified' | 'rendered' | 'skipped' | 'failed';
+  events?: number;
+  rows?: number;
+  ms?: number;
+  file?: string;
+  url?: string;
+  error?: string;
+}
+
+const progressLabels: Record<MemberProgress['status'], string> = {
+  fetched: '已取得行事曆',
+  classified: '已計算時數',
+  rendered: '已完成',
+  skipped: '無記錄',
+  failed: '失敗'
+};
+
 // 假資料 - 在 API 完成前使用
 const mockMembers: Member[] = [
   { id: 'A', name: '林怡芸' },
@@ -38,6 +61,11 @@ const ReportGenerator: React.FC = () => {
   const [loading, setLoading] = useState<boolean>(false);
   const [generatedFiles, setGeneratedFiles] = useState<{ path: string; url: string }[]>([]);
   const [responseMessage, setResponseMessage] = useState<string>('');
+  const [previewLoading, setPreviewLoading] = useState<boolean>(false);
+  const [preview, setPreview] = useState<MemberReportPreview[]>([]);
+  const [progress, setProgress] = useState<Record<string, MemberProgress>>({});
+  const [totalMembers, setTotalMembers] = useState<number>(0);
+  const stopStreamRef = useRef<(() => void) | null>(null);
   const [notification, setNotification] = useState<{show: boolean, message: string, type: 'success' | 'error'}>({
     show: false,
     message: '',
@@ -47,6 +75,8 @@ const ReportGenerator: React.FC = () => {
   useEffect(() => {
     // 實際專案中應從 API 獲取成員列表
     setMembers(mockMembers);
+    // 離開頁面時停止接收進度
+    return () => stopStreamRef.current?.();
   }, []);
 
   const handleDateChange = (newDate: Dayjs | null) => {
@@ -69,44 +99,103 @@ const ReportGenerator: React.FC = () => {
     setSelectedMemberId(event.target.value as string);
   };
 
-  const handleGenerateReport = async () => {
+  // 處理報表產生進度事件：每位成員的報表完成後即可下載，不必等待所有成員
+  const handleProgressEvent = (event: ReportProgressEvent) => {
+    switch (event.event) {
+      case 'started':
+        setTotalMembers(event.members);
+        break;
+      case 'fetched':
+        setProgress(prev => ({
+          ...prev,
+          [event.member_id]: { name: event.name, status: 'fetched', events: event.events, ms: event.ms }
+        }));
+        break;
+      case 'classified':
+      case 'skipped':
+        setProgress(prev => ({
+          ...prev,
+          [event.member_id]: { ...prev[event.member_id], name: event.name, status: event.event, rows: event.rows }
+        }));
+        break;
+      case 'failed':
+        setProgress(prev => ({
+          ...prev,
+          [event.member_id]: {
+            ...prev[event.member_id], name: event.name, status: 'failed', rows: event.rows, error: event.error
+          }
+        }));
+        break;
+      case 'rendered':
+        setProgress(prev => ({
+          ...prev,
+          [event.member_id]: {
+            ...prev[event.member_id], name: event.name, status: 'rendered',
+            rows: event.rows, ms: event.ms, file: event.file, url: event.url
+          }
+        }));
+        break;
+      case 'complete':
+        setLoading(false);
+        setGeneratedFiles(event.files.map(file => ({ path: file.file, url: file.url })));
+        if (event.failures.length > 0) {
+          const failedNames = Array.from(new Set(event.failures.map(failure => failure.name)));
+          setResponseMessage(`${failedNames.join('、')} 的行事曆無法取得，未產生報表，請稍後重試`);
+          showNotification(`${failedNames.length} 位成員的行事曆無法取得`, 'error');
+        } else if (event.files.length > 0) {
+          setResponseMessage(`成功產生 ${event.files.length} 個報表`);
+          showNotification(`成功產生 ${event.files.length} 個報表`, 'success');
+        } else {
+          setResponseMessage('已完成處理，但未產生任何報表檔案 (該月份可能沒有值班記錄)。');
+        }
+        break;
+      case 'report_error':
+        setLoading(false);
+        setResponseMessage(`報表產生失敗: ${event.detail}`);
+        showNotification(`報表產生失敗，請稍後再試: ${event.detail}`, 'error');
+        break;
+    }
+  };
+
+  const handleGenerateReport = () => {
     const yearMonth = date.format('YYYYMM');
-    
+
+    stopStreamRef.current?.();
     setLoading(true);
     setGeneratedFiles([]);
     setResponseMessage('');
-    
+    setProgress({});
+    setTotalMembers(0);
+    stopStreamRef.current = reportApi.streamReport(yearMonth, selectedMemberId || undefined, handleProgressEvent);
+  };
+
+  const finishedCount = Object.values(progress)
+    .filter(member => ['rendered', 'skipped', 'failed'].includes(member.status)).length;
+
+  // 預覽報表內容：不產生 Excel，只顯示每位成員的總計與明細
+  const handlePreviewReport = async () => {
+    const yearMonth = date.format('YYYYMM');
+
+    setPreviewLoading(true);
+    setPreview([]);
+
     try {
-      // 使用API呼叫
-      const response = await reportApi.generateReport(yearMonth, selectedMemberId || undefined);
-      setResponseMessage(response.message);
-      
-      // 添加空值檢查，確保generated_files存在
-      if (response.generated_files && response.generated_files.length > 0) {
-        setGeneratedFiles(response.generated_files);
-        
-        showNotification(
-          `成功產生 ${response.generated_files.length} 個報表`,
-          'success'
-        );
-      } else if (response.message.includes('失敗')) {
-        setGeneratedFiles([]);
-        showNotification(response.message, 'error');
-      } else {
-        // 報表可能已通過API內部邏輯自動下載
-        setGeneratedFiles([]);
-        showNotification('已開始下載報表', 'success');
+      const response = await reportApi.previewReport(yearMonth, selectedMemberId || undefined);
+      setPreview(response.members);
+      if (response.members.length === 0) {
+        showNotification('沒有可預覽的資料', 'error');
       }
     } catch (error) {
       const errorMsg = error instanceof Error ? error.message : '未知錯誤';
-      console.error('報表產生失敗:', error);
-      setResponseMessage(`報表產生失敗: ${errorMsg}`);
-      showNotification(`報表產生失敗，請稍後再試: ${errorMsg}`, 'error');
+      console.error('報表預覽失敗:', error);
+      showNotification(`報表預覽失敗，請稍後再試: ${errorMsg}`, 'error');
     } finally {
-      setLoading(false);
+      setPreviewLoading(false);
     }
   };
 
+  const formatDate = (value: string) => `${value.slice(4, 6)}/${value.slice(6, 8)}`;
+
   const showNotification = (message: string, type: 'success' | 'error') => {
     setNotification({
       show: true,
@@ -182,7 +271,18 @@ const ReportGenerator: React.FC = () => {
           </Grid>
           
           <Grid item xs={12} md={4}>
-            <Box sx={{ mt: 2 }}>
+            <Box sx={{ mt: 2, display: 'flex', gap: 1 }}>
+              <Button
+                variant="outlined"
+                color="primary"
+                fullWidth
+                size="large"
+                onClick={handlePreviewReport}
+                disabled={previewLoading || loading}
+                startIcon={previewLoading ? <CircularProgress size={20} color="inherit" /> : null}
+              >
+                {previewLoading ? '計算中...' : '預覽時數'}
+              </Button>
               <Button
                 variant="contained"
                 color="primary"
@@ -208,23 +308,100 @@ const ReportGenerator: React.FC = () => {
         </Alert>
       )}
       
-      {generatedFiles.length > 0 && (
+      {preview.length > 0 && (
+        <Paper sx={{ p: 2, mb: 3 }}>
+          <Typography variant="h6" gutterBottom>
+            時數預覽 ({date.format('YYYY/MM')})
+          </Typography>
+          {preview.map(member => (
+            <Accordion key={member.member_id} disableGutters>
+              <AccordionSummary expandIcon={<ExpandMoreIcon />}>
+                <Box sx={{ display: 'flex', alignItems: 'center', gap: 1, flexWrap: 'wrap' }}>
+                  <Typography sx={{ minWidth: 120 }}>
+                    {member.name} ({member.member_id})
+                  </Typography>
+                  <Chip label={`總計 ${member.totals.total_hours} 小時`} color="primary" size="small" />
+                  {(['E', 'F', 'G', 'H', 'I'] as const).map(bucket => (
+                    <Chip key={bucket} label={`${bucket}: ${member.totals[bucket]}`} size="small" variant="outlined" />
+                  ))}
+                </Box>
+              </AccordionSummary>
+              <AccordionDetails>
+                {member.rows.length === 0 ? (
+                  <Typography variant="body2" color="text.secondary">本月沒有值班記錄</Typography>
+                ) : (
+                  <Table size="small">
+                    <TableHead>
+                      <TableRow>
+                        <TableCell>日期</TableCell>
+                        <TableCell>星期</TableCell>
+                        <TableCell>時段</TableCell>
+                        <TableCell align="right">E</TableCell>
+                        <TableCell align="right">F</TableCell>
+                        <TableCell align="right">G</TableCell>
+                        <TableCell align="right">H</TableCell>
+                        <TableCell align="right">I</TableCell>
+                        <TableCell>事由</TableCell>
+                      </TableRow>
+                    </TableHead>
+                    <TableBody>
+                      {member.rows.map((row, index) => (
+                        <TableRow key={index}>
+                          <TableCell>{formatDate(row.date)}</TableCell>
+                          <TableCell>{row.weekday}</TableCell>
+                          <TableCell>{row.start}-{row.end}</TableCell>
+                          {row.work_hours.map((hours, bucket) => (
+                            <TableCell key={bucket} align="right">{hours || ''}</TableCell>
+                          ))}
+                          <TableCell>
+                            {row.is_manual ? row.reason : '值班'}
+                          </TableCell>
+                        </TableRow>
+                      ))}
+                    </TableBody>
+                  </Table>
+                )}
+              </AccordionDetails>
+            </Accordion>
+          ))}
+        </Paper>
+      )}
+
+      {(loading || Object.keys(progress).length > 0) && (
         <Paper sx={{ p: 2 }}>
           <Typography variant="h6" gutterBottom>
-            已產生的報表檔案:
+            報表產生進度 {totalMembers > 0 && `(${finishedCount}/${totalMembers})`}
           </Typography>
+          <LinearProgress
+            variant={totalMembers > 0 ? 'determinate' : 'indeterminate'}
+            value={totalMembers > 0 ? (finishedCount / totalMembers) * 100 : 0}
+            sx={{ mb: 1 }}
+          />
           <List>
-            {generatedFiles.map((file, index) => (
-              <ListItem key={index}>
+            {Object.entries(progress).map(([memberId, member]) => (
+              <ListItem key={memberId}>
                 <ListItemIcon>
-                  <DescriptionIcon color="primary" />
+                  {member.status === 'rendered' && <CheckCircleIcon color="success" />}
+                  {member.status === 'failed' && <ErrorIcon color="error" />}
+                  {member.status === 'skipped' && <DescriptionIcon color="disabled" />}
+                  {['fetched', 'classified'].includes(member.status) && <CircularProgress size={20} />}
                 </ListItemIcon>
-                <ListItemText 
-                  primary={file.path.split('/').pop()} 
+                <ListItemText
+                  primary={`${member.name} (${memberId})`}
                   secondary={
-                    <Link href={file.url} target="_blank" rel="noopener">
-                      下載連結
-                    </Link>
+                    <>
+                      {progressLabels[member.status]}
+                      {member.rows !== undefined && ` · ${member.rows} 筆班次`}
+                      {member.error && ` · ${member.error}`}
+                      {member.url && (
+                        <>
+                          {' · '}
+                          <Link href={reportApi.downloadUrl(member.url)} target="_blank" rel="noopener">
+                            下載 {member.file}
+                          </Link>
+                        </>
+                      )}
+                    </>
                   }
                 />
               </ListItem>
@@ -240,7 +417,8 @@ const ReportGenerator: React.FC = () => {
         <Typography variant="body2" color="text.secondary">
           • 報表產生需要獲取 Google Calendar 事件和手動值班資料。<br />
           • 產生的 Excel 檔案將包含選定月份的所有值班記錄和計算好的工時。<br />
-          • 可以選擇產生單一成員或所有成員的報表。<br />
+          • 可以選擇產生單一成員或所有成員的報表；每位成員的報表完成後即可下載。<br />
+          • 「預覽時數」只計算時數與明細，不產生 Excel 檔案。<br />
           • 建議使用時確保網路連線穩定以防 API 呼叫中斷。
         </Typography>
       </Box>
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { Holiday, Duty, ReportGenerationResponse, DutyCreate } from '../types';
+import { Holiday, Duty, ReportGenerationResponse, DutyCreate, DutyGroupCreate, DutyRule, DutyRuleCreate, MonthSummary, ReportPreview, ReportProgressEvent } from '../types';
 
 // API基礎URL設定
 const API_URL_FULL = process.env.REACT_APP_API_URL || 'http://localhost:8088';
@@ -14,6 +14,9 @@ const apiClient = axios.create({
 
 export default apiClient;
 
+// 假日月份快取：月份切換時直接查表，更新假日狀態後整體清除
+const holidayMonthCache = new Map<string, Promise<Holiday[]>>();
+
 // 假日相關API
 export const holidayApi = {
   // 獲取假日資料
@@ -23,9 +26,20 @@ export const holidayApi = {
   },
 
   // 獲取指定月份的假日資料
-  getHolidaysForMonth: async (yearMonth: string): Promise<Holiday[]> => {
-    const response = await axios.get(`${API_BASE}/holidays/month/${yearMonth}`);
-    return response.data;
+  getHolidaysForMonth: (yearMonth: string): Promise<Holiday[]> => {
+    const cached = holidayMonthCache.get(yearMonth);
+    if (cached) {
+      return cached;
+    }
+    const request = axios.get(`${API_BASE}/holidays/month/${yearMonth}`)
+      .then(response => response.data as Holiday[])
+      .catch(error => {
+        // 失敗的請求不留在快取中，下次切換月份時重試
+        holidayMonthCache.delete(yearMonth);
+        throw error;
+      });
+    holidayMonthCache.set(yearMonth, request);
+    return request;
   },
   
   // 更新假日狀態
@@ -33,6 +47,7 @@ export const holidayApi = {
     const response = await axios.put(`${API_BASE}/holidays/${date}`, null, {
       params: { status: status.toString(), description }
     });
+    holidayMonthCache.clear();
     return response.data;
   }
 };
@@ -68,9 +83,17 @@ export const dutyApi = {
     return response.data;
   },
   
-  // 刪除加班記錄
-  removeDuty: async (id: string): Promise<void> => {
-    const response = await axios.delete(`${API_BASE}/duties/${id}`);
+  // 批次新增加班記錄 (後端單次寫入)
+  addDuties: async (duties: DutyCreate[], groups: DutyGroupCreate[] = []): Promise<Duty[]> => {
+    const response = await axios.post(`${API_BASE}/duties/bulk`, { create: duties, create_groups: groups });
+    return response.data.created;
+  },
+  
+  // 刪除加班記錄 (提供 yearMonth 時後端只需讀取該月份分區)
+  removeDuty: async (id: string, yearMonth?: string): Promise<void> => {
+    const response = await axios.delete(`${API_BASE}/duties/${id}`, {
+      params: yearMonth ? { year_month: yearMonth } : {}
+    });
     return response.data;
   },
   
@@ -124,8 +147,85 @@ export const dutyApi = {
   }
 };
 
+// 週期規則相關API
+export const dutyRuleApi = {
+  getRules: async (): Promise<DutyRule[]> => {
+    const response = await axios.get(`${API_BASE}/duty_rules`);
+    return response.data;
+  },
+
+  addRule: async (rule: DutyRuleCreate): Promise<DutyRule> => {
+    const response = await axios.post(`${API_BASE}/duty_rules`, rule);
+    return response.data;
+  },
+
+  updateRule: async (id: string, rule: DutyRuleCreate): Promise<DutyRule> => {
+    const response = await axios.put(`${API_BASE}/duty_rules/${id}`, rule);
+    return response.data;
+  },
+
+  removeRule: async (id: string): Promise<void> => {
+    const response = await axios.delete(`${API_BASE}/duty_rules/${id}`);
+    return response.data;
+  }
+};
+
+// 加班時數摘要API (不產生 Excel)
+export const summaryApi = {
+  getMonthSummary: async (yearMonth: string, memberId?: string): Promise<MonthSummary> => {
+    const response = await axios.get(`${API_BASE}/summary/${yearMonth}`, {
+      params: memberId ? { member_id: memberId } : undefined
+    });
+    return response.data;
+  }
+};
+
 // 報表相關API
 export const reportApi = {
+  // 預覽報表內容 (不產生 Excel)
+  previewReport: async (yearMonth: string, memberId?: string): Promise<ReportPreview> => {
+    const response = await axios.get(`${API_BASE}/report_preview/${yearMonth}`, {
+      params: memberId ? { member_id: memberId } : undefined
+    });
+    return response.data;
+  },
+
+  // 產生報表並串流每位成員的進度 (SSE)；返回停止接收的函數
+  // 連線中斷時不自動重連 (重連會重新產生報表)，改為送出 report_error 事件
+  // (伺服器的失敗事件名稱為 report_error，不與 EventSource 內建的連線 error 事件重名)
+  streamReport: (yearMonth: string, memberId: string | undefined,
+                 onEvent: (event: ReportProgressEvent) => void): (() => void) => {
+    const params = new URLSearchParams({ start_ym: yearMonth });
+    if (memberId) {
+      params.set('member_id', memberId);
+    }
+    const source = new EventSource(`${API_BASE}/generate_report_events?${params.toString()}`);
+    const eventTypes: ReportProgressEvent['event'][] = [
+      'started', 'fetched', 'classified', 'rendered', 'skipped', 'failed', 'finished', 'complete', 'report_error'
+    ];
+    eventTypes.forEach(type => {
+      source.addEventListener(type, message => {
+        if (!(message instanceof MessageEvent) || typeof message.data !== 'string') {
+          return;
+        }
+        if (type === 'complete' || type === 'report_error') {
+          source.close();
+        }
+        onEvent(JSON.parse(message.data) as ReportProgressEvent);
+      });
+    });
+    source.onerror = () => {
+      if (source.readyState !== EventSource.CLOSED) {
+        source.close();
+        onEvent({ event: 'report_error', detail: '與伺服器的連線中斷' });
+      }
+    };
+    return () => source.close();
+  },
+
+  // 報表下載網址 (後端返回的 url 為 /artifacts/... 相對路徑，內容不變可長期快取)
+  downloadUrl: (url: string): string => `${API_BASE}${url}`,
+
   // 觸發報表生成
   generateReport: async (yearMonth: string, memberId?: string): Promise<ReportGenerationResponse> => {
     try {
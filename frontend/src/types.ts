@@ -21,8 +21,135 @@ export interface Duty {
   hours: number;
   person: string;
   reason: string;
+  group_id?: string;  // 由群組記錄展開時，對應的群組 ID
 }
 
+// 群組加班記錄新增請求結構 (多位成員共用一筆記錄)
+export interface DutyGroupCreate {
+  dateTime: string;
+  hours: number;
+  persons: string[];
+  reason: string;
+  exceptions?: Record<string, { hours?: number; reason?: string; excluded?: boolean }>;
+}
+
+// 週期加班規則 (例如每週二 07:30 科會)
+export interface DutyRuleCreate {
+  weekday: number;       // 0=週一 ... 6=週日
+  time: string;          // HHMM
+  hours: number;
+  reason: string;
+  persons: string[];
+  start_date: string;    // YYYYMMDD
+  end_date?: string | null;
+  interval?: number;     // 每幾週一次
+  skip_holidays?: boolean;
+  exceptions?: Record<string, { hours?: number; reason?: string; excluded?: boolean }>;
+  skip_dates?: string[];
+}
+
+export interface DutyRule extends DutyRuleCreate {
+  id: string;
+  revision: number;
+}
+
+// 成員月份加班時數摘要
+export interface MemberSummary {
+  member_id: string | null;
+  name: string;
+  employee_id: string | null;
+  total_hours: number;
+  E: number;
+  F: number;
+  G: number;
+  H: number;
+  I: number;
+  manual_hours: number;
+  calendar_hours: number;
+}
+
+export interface MonthSummary {
+  year_month: string;
+  holiday_version: number;
+  calendar_synced: boolean;
+  members: MemberSummary[];
+}
+
+// 報表預覽 (不產生 Excel)
+export interface ReportPreviewRow {
+  date: string;
+  weekday: string;
+  start: string;
+  end: string;
+  work_hours: number[]; // [E, F, G, H, I]
+  reason: string;
+  is_manual: boolean;
+}
+
+// 合併時重疊的時段 (kept 保留、trimmed 被裁切；SHIFT_OVERLAP_PRECEDENCE=flag 時只標記不裁切)
+export interface ShiftOverlap {
+  date: string;
+  start: string;
+  end: string;
+  minutes: number;
+  kept: 'calendar' | 'manual';
+  kept_reason: string | null;
+  trimmed: 'calendar' | 'manual';
+  trimmed_reason: string | null;
+}
+
+export interface MemberReportPreview {
+  member_id: string;
+  name: string;
+  employee_id: string | null;
+  totals: {
+    total_hours: number;
+    E: number;
+    F: number;
+    G: number;
+    H: number;
+    I: number;
+  };
+  rows: ReportPreviewRow[];
+  overlaps: ShiftOverlap[];
+}
+
+export interface ReportPreview {
+  year_month: string;
+  holiday_version: number | null;
+  members: MemberReportPreview[];
+  failures: ReportFailure[];
+}
+
+// 行事曆擷取失敗而未產生報表的成員 (每個月份一筆)
+export interface ReportFailure {
+  year_month: string;
+  member_id: string;
+  name: string;
+  stage: 'fetch';
+  error: string;
+  status: number | null;
+}
+
+// 報表產生進度 (GET /generate_report_events 的 Server-Sent Events)
+export interface ReportMemberProgress {
+  year_month: string;
+  member_id: string;
+  name: string;
+  rows: number;
+  ms: number;
+}
+
+export type ReportProgressEvent =
+  | { event: 'started'; members: number; year_months: string[] }
+  | { event: 'fetched'; member_id: string; name: string; events: number; ms: number }
+  | ({ event: 'classified' | 'skipped' } & ReportMemberProgress)
+  | ({ event: 'failed'; stage?: 'fetch'; error?: string } & Omit<ReportMemberProgress, 'rows'> & { rows?: number })
+  | ({ event: 'rendered'; file: string; url: string } & ReportMemberProgress)
+  | { event: 'finished'; files: number; members: number; failed: number; seconds: number }
+  | { event: 'complete'; holiday_version: number | null; files: { file: string; url: string }[]; failures: ReportFailure[] }
+  | { event: 'report_error'; detail: string };
+
 // 報表產生響應數據結構
 export interface ReportGenerationResponse {
   message: string;
@@ -13,6 +13,7 @@ export interface Duty {
   hours: number;
   person: string;
   reason: string;
+  group_id?: string;  // 由群組記錄展開時，對應的群組 ID
 }
 
 // 創建值班資料類型
@@ -23,6 +24,15 @@ export interface DutyCreate {
   reason: string;
 }
 
+// 群組加班記錄新增請求結構 (多位成員共用一筆記錄)
+export interface DutyGroupCreate {
+  dateTime: string;
+  hours: number;
+  persons: string[];
+  reason: string;
+  exceptions?: Record<string, { hours?: number; reason?: string; excluded?: boolean }>;
+}
+
 // 報表生成響應類型
 export interface ReportGenerationResponse {
   message: string;